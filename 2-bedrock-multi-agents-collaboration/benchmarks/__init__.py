@@ -0,0 +1,6 @@
+"""Offline benchmarks for the Bedrock Agent instrumentation in ``core``.
+
+Run from the ``2-bedrock-multi-agents-collaboration`` directory, e.g.::
+
+    python -m benchmarks.bench_tracer_provider
+"""
@@ -0,0 +1,49 @@
+"""
+Per-request cost of reading the agent configuration.
+
+Compares opening and parsing config.json on every request (as main.py used
+to do) with reading the cached AgentConfig snapshot, which only stats the
+file once per check interval.
+
+    python -m benchmarks.bench_agent_config --requests 20000
+"""
+
+import argparse
+import base64
+import json
+import time
+
+from core.agent_config import get_agent_config
+
+
+def per_request(path):
+    with open(path, "r") as config_file:
+        config = json.load(config_file)
+    langfuse = config["langfuse"]
+    base64.b64encode(
+        f"{langfuse['langfuse_public_key']}:{langfuse['langfuse_secret_key']}".encode()
+    ).decode()
+    return config["agent"]["agentId"]
+
+
+def cached(path):
+    return get_agent_config(path).agent_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--config", default="config.json")
+    args = parser.parse_args()
+
+    for label, func in (("parse per request", per_request), ("cached snapshot", cached)):
+        func(args.config)
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            func(args.config)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<20} {elapsed / args.requests * 1e6:8.2f} us/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Per-request cost of creating a bedrock-agent-runtime client.
+
+Runs invoke_agent against a local stub endpoint, comparing a new client per
+request (as main.py used to do) with the shared, pooled client from
+core.clients. The stub can delay every new connection to stand in for the
+TCP/TLS handshake with the real endpoint, which only the pooled client
+avoids paying per request.
+
+    python -m benchmarks.bench_clients --requests 200 --connect-delay-ms 30
+"""
+
+import argparse
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+
+from core.clients import configure_clients, get_client
+
+
+class StubAgentHandler(BaseHTTPRequestHandler):
+    """Answers every InvokeAgent call with an empty event stream"""
+
+    protocol_version = "HTTP/1.1"
+    connect_delay = 0.0
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        StubAgentHandler.connections += 1
+        if self.connect_delay:
+            time.sleep(self.connect_delay)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.amazon.eventstream")
+        self.send_header("x-amzn-bedrock-agent-content-type", "application/json")
+        self.send_header("x-amz-bedrock-agent-session-id", "bench-session")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def invoke(client):
+    response = client.invoke_agent(
+        inputText="hello", agentId="BENCHAGENT", agentAliasId="BENCHALIAS",
+        sessionId="bench-session", enableTrace=True,
+    )
+    # Drain the stream so the connection goes back to the pool
+    for _ in response["completion"]:
+        pass
+
+
+def per_request(endpoint_url):
+    invoke(boto3.client("bedrock-agent-runtime", endpoint_url=endpoint_url))
+
+
+def pooled(endpoint_url):
+    invoke(get_client("bedrock-agent-runtime", endpoint_url=endpoint_url))
+
+
+def run(func, endpoint_url, requests):
+    StubAgentHandler.connections = 0
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        func(endpoint_url)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, StubAgentHandler.connections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--connect-delay-ms", type=float, default=0.0,
+                        help="delay per new connection, standing in for the TLS handshake")
+    args = parser.parse_args()
+
+    # The stub does not check signatures, but botocore needs something to sign with
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+    StubAgentHandler.connect_delay = args.connect_delay_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubAgentHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    configure_clients(max_attempts=1)
+    for label, func in (("client per request", per_request), ("pooled client", pooled)):
+        func(endpoint_url)  # warm up imports and the service model cache
+        timings, connections = run(func, endpoint_url, args.requests)
+        print(f"{label:<20} mean {statistics.mean(timings):7.2f} ms   "
+              f"p50 {statistics.median(timings):7.2f} ms   "
+              f"max {max(timings):7.2f} ms   connections {connections}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
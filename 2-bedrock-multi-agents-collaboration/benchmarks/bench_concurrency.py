@@ -0,0 +1,80 @@
+"""
+Throughput of concurrent instrumented agent invocations.
+
+Each invocation simulates the Bedrock round trip with a sleep and then streams
+sample_event_stream() through instrument_agent_invocation. Per-invocation
+state lives in an InvocationContext, so every run is also checked for
+cross-talk: each trace must contain exactly the spans of a single invocation.
+
+    python -m benchmarks.bench_concurrency --invocations 200 --threads 1 2 4 8
+"""
+
+import argparse
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from core import instrument_agent_invocation
+
+from .common import install_memory_exporter, quiet, sample_event_stream
+
+
+def make_invoker(latency_s: float):
+    @instrument_agent_invocation
+    def invoke(inputText, agentId, agentAliasId, sessionId, **kwargs):
+        time.sleep(latency_s)
+        return {"completion": iter(sample_event_stream(f"trace-{sessionId}"))}
+
+    return invoke
+
+
+def run(invocations: int, threads: int, latency_s: float, exporter):
+    invoke = make_invoker(latency_s)
+    exporter.clear()
+
+    def one(i):
+        return invoke(
+            inputText="What is my forecast?",
+            agentId="BENCHAGENT",
+            agentAliasId="BENCHALIAS",
+            sessionId=f"s{i}",
+            model_id="anthropic.claude-3-haiku-20240307-v1:0",
+        )
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, range(invocations)))
+    elapsed = time.perf_counter() - start
+
+    spans = exporter.get_finished_spans()
+    per_trace = Counter(span.context.trace_id for span in spans)
+    isolated = len(per_trace) == invocations and len(set(per_trace.values())) == 1
+    return elapsed, len(spans), isolated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--invocations", type=int, default=200)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument(
+        "--latency-ms", type=float, default=20.0,
+        help="simulated Bedrock round trip per invocation",
+    )
+    args = parser.parse_args()
+
+    exporter = install_memory_exporter()
+    print(f"{'threads':>7} {'seconds':>9} {'inv/s':>9} {'spans':>7} {'isolated':>9}")
+    with quiet():
+        results = [
+            (threads, *run(args.invocations, threads, args.latency_ms / 1000, exporter))
+            for threads in args.threads
+        ]
+    for threads, elapsed, span_count, isolated in results:
+        print(
+            f"{threads:>7} {elapsed:>9.2f} {args.invocations / elapsed:>9.1f} "
+            f"{span_count:>7} {str(isolated):>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
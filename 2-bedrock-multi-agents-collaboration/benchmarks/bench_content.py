@@ -0,0 +1,62 @@
+"""
+Export payload size per invocation with and without the content store.
+
+Runs the sample event stream through the instrumented call in each content
+store mode and encodes the finished spans as an OTLP protobuf request, the
+payload the exporter would send.
+
+    python -m benchmarks.bench_content --prompt-size 8000 --invocations 50
+"""
+
+import argparse
+import gzip
+import os
+import tempfile
+import time
+
+from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+
+from core import instrument_agent_invocation
+from core.content import ContentStoreMode, configure_content_store, read_content_log
+from core.trace_log import close_trace_logs
+
+from .common import install_memory_exporter, quiet, sample_event_stream
+
+
+@instrument_agent_invocation
+def invoke(inputText, agentId, agentAliasId, sessionId, **kwargs):
+    return {"completion": iter(sample_event_stream(prompt_size=kwargs["prompt_size"]))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--prompt-size", type=int, default=8000)
+    parser.add_argument("--invocations", type=int, default=50)
+    args = parser.parse_args()
+
+    exporter = install_memory_exporter()
+    with tempfile.TemporaryDirectory() as tmp:
+        content_log = os.path.join(tmp, "content_store.jsonl")
+        for mode in ContentStoreMode.ALL:
+            configure_content_store(mode=mode, path=content_log)
+            exporter.clear()
+            start = time.perf_counter()
+            with quiet():
+                for i in range(args.invocations):
+                    invoke(inputText="hello", agentId="BENCHAGENT", agentAliasId="BENCHALIAS",
+                           sessionId="bench-session", prompt_size=args.prompt_size,
+                           model_id="anthropic.claude-3-haiku-20240307-v1:0")
+            elapsed = time.perf_counter() - start
+
+            payload = encode_spans(exporter.get_finished_spans()).SerializeToString()
+            line = (f"{mode:<5} {len(payload) / args.invocations / 1024:8.1f} KiB/invocation   "
+                    f"gzip {len(gzip.compress(payload)) / args.invocations / 1024:7.1f} KiB   "
+                    f"{elapsed / args.invocations * 1e6:8.0f} us/invocation")
+            if mode == ContentStoreMode.BLOB:
+                close_trace_logs()
+                line += f"   side file: {len(read_content_log(content_log))} distinct texts"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Export bytes per span for each exporter.
+
+Runs the sample event stream through the instrumented call and exports the
+spans through the background pipeline to the local file exporter (JSON Lines
+and protobuf) and to a local OTLP/HTTP collector stand-in, uncompressed and
+with gzip, reporting the bytes written or received per span.
+
+    python -m benchmarks.bench_export --invocations 200
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core import flush_telemetry, instrument_agent_invocation
+from core.configuration import reconfigure_tracer_provider
+from core.tracing import get_export_metrics
+
+from .common import install_memory_exporter, quiet, sample_event_stream
+
+
+class StubCollector(BaseHTTPRequestHandler):
+    """Accepts OTLP/HTTP export requests and counts the bytes received"""
+
+    protocol_version = "HTTP/1.1"
+    received_bytes = 0
+    requests = 0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        StubCollector.received_bytes += len(body)
+        StubCollector.requests += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-protobuf")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@instrument_agent_invocation
+def invoke(inputText, agentId, agentAliasId, sessionId, **kwargs):
+    return {"completion": iter(sample_event_stream())}
+
+
+def run(invocations: int) -> float:
+    start = time.perf_counter()
+    with quiet():
+        for _ in range(invocations):
+            invoke(inputText="hello", agentId="BENCHAGENT", agentAliasId="BENCHALIAS",
+                   sessionId="bench-session", model_id="anthropic.claude-3-haiku-20240307-v1:0")
+    elapsed = time.perf_counter() - start
+    flush_telemetry(blocking=True)
+    return elapsed
+
+
+def report(label: str, spans: int, size: int, elapsed: float, invocations: int):
+    print(f"{label:<22} {size / max(spans, 1):8.1f} bytes/span   "
+          f"{size / invocations / 1024:7.1f} KiB/invocation   "
+          f"{elapsed / invocations * 1e6:7.0f} us/invocation")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--invocations", type=int, default=200)
+    args = parser.parse_args()
+
+    install_memory_exporter()
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, path in (("file (jsonl)", "spans.jsonl"), ("file (protobuf)", "spans.pb")):
+            reconfigure_tracer_provider(exporter="file", file_path=os.path.join(tmp, path))
+            elapsed = run(args.invocations)
+            metrics = get_export_metrics()
+            report(label, metrics["exported_spans"],
+                   os.path.getsize(os.path.join(tmp, path)), elapsed, args.invocations)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubCollector)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}/v1/traces"
+    for compression in ("none", "gzip"):
+        os.environ["OTEL_EXPORTER_OTLP_COMPRESSION"] = compression
+        StubCollector.received_bytes = 0
+        reconfigure_tracer_provider(exporter="otlp", endpoint=endpoint)
+        elapsed = run(args.invocations)
+        metrics = get_export_metrics()
+        report(f"otlp ({compression})", metrics["exported_spans"],
+               StubCollector.received_bytes, elapsed, args.invocations)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
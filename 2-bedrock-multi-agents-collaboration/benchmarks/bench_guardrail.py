@@ -0,0 +1,97 @@
+"""
+Cost of post-response guardrail events in long streamed answers.
+
+With a low applyGuardrailInterval every few chunks produce a guardrail-post
+event. The old buffering stored each event twice and combined assessments
+at the end of the stream with a list scan per assessment; GuardrailAggregate
+folds events as they arrive and deduplicates by hash.
+
+    python -m benchmarks.bench_guardrail --events 500 --distinct 50
+"""
+
+import argparse
+import time
+
+from opentelemetry import trace
+
+from core import handlers
+from core.context import InvocationContext
+from core.handlers import handle_guardrail_trace, process_guardrail_buffer
+from core.timing import now
+
+from .common import _trace_event, install_memory_exporter
+
+POLICIES = ("contentPolicy", "topicPolicy", "wordPolicy", "sensitiveInformationPolicy")
+
+
+def guardrail_events(count: int, distinct: int):
+    return [
+        _trace_event(i, {"guardrailTrace": {
+            "traceId": f"bench-trace-0-guardrail-post-{i}", "action": "NONE",
+            "outputAssessments": [{"contentPolicy": {"filters": [
+                {"type": "VIOLENCE", "confidence": "LOW", "action": "NONE", "n": i % distinct}]}}],
+        }})["trace"]
+        for i in range(count)
+    ]
+
+
+def legacy(events):
+    """Per-event buffering and end-of-stream combination as before"""
+    span_manager_buffer, invocation_buffer = {}, {}
+    start = time.perf_counter()
+    for trace_data in events:
+        base = trace_data["trace"]["guardrailTrace"]["traceId"].split("-guardrail-post-")[0]
+        span_manager_buffer.setdefault(base, []).append(
+            {"trace_data": trace_data, "timestamp": now().iso, "content": None})
+        invocation_buffer.setdefault(base, []).append(
+            {"trace_data": trace_data, "timestamp": now().iso, "content": None})
+    arrival = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for entries in invocation_buffer.values():
+        combined = []
+        for entry in entries:
+            guardrail = entry["trace_data"].get("trace", {}).get("guardrailTrace", {})
+            for assessment in guardrail.get("outputAssessments", []):
+                if assessment and any(assessment.get(key) for key in POLICIES):
+                    if assessment not in combined:
+                        combined.append(assessment)
+    return arrival, time.perf_counter() - start
+
+
+def aggregated(events):
+    ctx = InvocationContext()
+    tracer = trace.get_tracer("bedrock-agent-bench")
+    handlers.set_tracer(tracer)
+    with ctx.activate(), tracer.start_as_current_span("bench") as root_span:
+        start = time.perf_counter()
+        for trace_data in events:
+            handle_guardrail_trace(trace_data, root_span)
+        arrival = time.perf_counter() - start
+
+        start = time.perf_counter()
+        process_guardrail_buffer(ctx.guardrail_buffer, root_span)
+        end_of_stream = time.perf_counter() - start
+        ctx.close()
+    return arrival, end_of_stream
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--distinct", type=int, default=50,
+                        help="distinct assessments among the events")
+    args = parser.parse_args()
+
+    install_memory_exporter()
+    events = guardrail_events(args.events, args.distinct)
+    for label, func in (("legacy buffers", legacy), ("GuardrailAggregate", aggregated)):
+        arrival, end_of_stream = func(events)
+        print(f"{label:<20} arrival {arrival / len(events) * 1e6:8.1f} us/event   "
+              f"end of stream {end_of_stream * 1000:8.2f} ms")
+    print("(GuardrailAggregate includes routing through handle_guardrail_trace on arrival "
+          "and creating the spans at the end of the stream)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Per-event cost of timestamping trace events.
+
+Compares the get_time() the agent and processes modules used to carry
+(time.time() plus datetime formatting on every call) with core.timing,
+where a timestamp is an integer until its ISO string is needed.
+
+    python -m benchmarks.bench_timing --events 200000
+"""
+
+import argparse
+import time
+from datetime import datetime, timezone
+
+from core.timer_lib import timer
+from core.timing import Timestamp, now
+
+from .common import sample_event_stream
+
+
+def legacy_get_time():
+    current_time = time.time()
+    iso = datetime.fromtimestamp(current_time, tz=timezone.utc).replace(tzinfo=None).isoformat()
+    return current_time, iso
+
+
+def legacy_event_time(trace_data):
+    event_time = trace_data.get("eventTime")
+    if isinstance(event_time, datetime):
+        return event_time.timestamp(), event_time.replace(tzinfo=None).isoformat()
+    return legacy_get_time()
+
+
+def measure(label: str, func, events: int):
+    start = time.perf_counter_ns()
+    for _ in range(events):
+        func()
+    per_event = (time.perf_counter_ns() - start) / events
+    print(f"{label:<44}{per_event:>10.0f} ns/event")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=200000)
+    args = parser.parse_args()
+
+    trace_data = next(e["trace"] for e in sample_event_stream() if "trace" in e)
+
+    measure("legacy get_time()", legacy_get_time, args.events)
+    measure("legacy eventTime -> (seconds, iso)", lambda: legacy_event_time(trace_data), args.events)
+    measure("now()", now, args.events)
+    measure("now().iso", lambda: now().iso, args.events)
+    measure("Timestamp.from_datetime(eventTime)",
+            lambda: Timestamp.from_datetime(trace_data["eventTime"]), args.events)
+    measure("FunctionTimer.check_start_time()",
+            lambda: timer.check_start_time("bench", trace_data, "bench-trace"), args.events)
+
+
+if __name__ == "__main__":
+    main()
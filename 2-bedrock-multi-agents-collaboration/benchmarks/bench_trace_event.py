@@ -0,0 +1,88 @@
+"""
+Per-event cost of reading trace events.
+
+Before TraceEvent, an orchestration event was walked by extract_trace_id()
+in process_orchestration_trace (twice) and again in every handler, each
+handler re-read its component trace with ``trace_data.get("trace", {})``
+chains and every timer call converted eventTime again. This replays that
+access pattern against parsing the event once.
+
+    python -m benchmarks.bench_trace_event --events 200000
+"""
+
+import argparse
+import time
+
+from core.events import TraceEvent
+from core.timing import event_timestamp
+
+from .common import sample_event_stream
+
+
+def legacy_extract_trace_id(trace_data):
+    """extract_trace_id() as it was before TraceEvent (inferred component)"""
+    trace_obj = trace_data.get("trace", trace_data)
+    if "orchestrationTrace" in trace_obj:
+        component_trace = trace_obj["orchestrationTrace"]
+    elif "preProcessingTrace" in trace_obj:
+        component_trace = trace_obj["preProcessingTrace"]
+    elif "postProcessingTrace" in trace_obj:
+        component_trace = trace_obj["postProcessingTrace"]
+    elif "guardrailTrace" in trace_obj:
+        return trace_obj["guardrailTrace"].get("traceId", f"guardrail-{time.time()}")
+    elif "failureTrace" in trace_obj:
+        return trace_obj["failureTrace"].get("traceId", f"failure-{time.time()}")
+    else:
+        component_trace = {}
+    for field in ("modelInvocationInput", "modelInvocationOutput",
+                  "rationale", "invocationInput", "observation"):
+        if isinstance(component_trace.get(field), dict) and "traceId" in component_trace[field]:
+            return component_trace[field]["traceId"]
+    return f"generated-{time.time()}"
+
+
+def legacy(trace_data, handlers: int):
+    # process_orchestration_trace: two trace id walks, one timer, one subtrace
+    legacy_extract_trace_id(trace_data)
+    event_timestamp(trace_data)
+    trace_data.get("trace", {}).get("orchestrationTrace", {})
+    legacy_extract_trace_id(trace_data)
+    # each handler: trace id walk, timer, subtrace
+    for _ in range(handlers):
+        legacy_extract_trace_id(trace_data)
+        event_timestamp(trace_data)
+        trace_data.get("trace", {}).get("orchestrationTrace", {})
+
+
+def parsed(trace_data, handlers: int):
+    event = TraceEvent(trace_data)
+    for _ in range(handlers + 1):
+        event.trace_id
+        event.event_time
+        event.subtrace("orchestration")
+
+
+def measure(label: str, func, traces, handlers: int, events: int):
+    start = time.perf_counter_ns()
+    for i in range(events):
+        func(traces[i % len(traces)], handlers)
+    per_event = (time.perf_counter_ns() - start) / events
+    print(f"{label:<36}{per_event:>10.0f} ns/event")
+    return per_event
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--handlers", type=int, default=2,
+                        help="handlers invoked per event (orchestration events run 1-3)")
+    args = parser.parse_args()
+
+    traces = [e["trace"] for e in sample_event_stream() if "trace" in e]
+    before = measure("repeated walks (before)", legacy, traces, args.handlers, args.events)
+    after = measure("TraceEvent parsed once", parsed, traces, args.handlers, args.events)
+    print(f"{'saving':<36}{before - after:>10.0f} ns/event ({(1 - after / before) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
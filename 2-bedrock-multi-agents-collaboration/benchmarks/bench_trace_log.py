@@ -0,0 +1,74 @@
+"""
+Per-event cost of trace logging on the request path.
+
+Compares the old SAVE_TRACE_LOGS behaviour (open, json.dumps with
+DateTimeEncoder, write, close for every trace event) with recording through
+CaptureWriter and the background TraceLogSink.
+
+    python -m benchmarks.bench_trace_log --events 20000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from core.agent import DateTimeEncoder
+from core.capture import CaptureWriter, encode_record, read_capture
+from core.trace_log import TraceLogSink
+
+from .common import sample_event_stream
+
+
+def legacy(path: str, events):
+    start = time.perf_counter()
+    for event in events:
+        if "trace" in event:
+            with open(path, "a") as f:
+                f.write(json.dumps(event["trace"], cls=DateTimeEncoder))
+                f.write("\n---\n")
+    return time.perf_counter() - start
+
+
+def background(path: str, events, compression: str):
+    sink = TraceLogSink(path, compression=compression, max_bytes=4 * 1024 * 1024,
+                        max_queue_size=len(events) + 1, encoder=encode_record)
+    writer = CaptureWriter(path, sink=sink, agentId="BENCHAGENT")
+    start = time.perf_counter()
+    for event in events:
+        writer.write_event(event)
+    elapsed = time.perf_counter() - start
+    flush_start = time.perf_counter()
+    sink.close()
+    return elapsed, time.perf_counter() - flush_start, sink
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--compression", default="gzip", choices=("none", "gzip", "zstd"))
+    args = parser.parse_args()
+
+    stream = sample_event_stream()
+    events = [stream[i % len(stream)] for i in range(args.events)]
+    trace_events = sum(1 for e in events if "trace" in e)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        elapsed = legacy(os.path.join(tmp, "trace_logs.json"), events)
+        print(f"legacy (open/write/close per event): {elapsed / trace_events * 1e6:8.1f} us/event")
+
+        path = os.path.join(tmp, "trace_logs.jsonl")
+        elapsed, drain, sink = background(path, events, args.compression)
+        print(f"background sink, caller thread:      {elapsed / len(events) * 1e6:8.1f} us/event")
+        print(f"  drained in {drain * 1000:.1f} ms, written={sink.written_records} "
+              f"dropped={sink.dropped_records} rotations={sink.rotations}")
+        segments = sorted(os.listdir(tmp))
+        print(f"  files: {', '.join(segments)}")
+        recovered = sum(len(c) for name in segments if name.startswith("trace_logs.jsonl")
+                        for c in read_capture(os.path.join(tmp, name)))
+        print(f"  events read back: {recovered}")
+
+
+if __name__ == "__main__":
+    main()
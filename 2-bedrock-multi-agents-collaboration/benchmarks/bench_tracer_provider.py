@@ -0,0 +1,76 @@
+"""
+Per-invocation cost of obtaining the TracerProvider.
+
+"before" rebuilds a TracerProvider, OTLPSpanExporter and BatchSpanProcessor on
+every call, as create_tracer_provider() used to. "after" goes through the
+process-wide registry, which builds them once.
+
+    python -m benchmarks.bench_tracer_provider --iterations 200
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+from core.configuration import TracerProviderRegistry, _build_resource
+
+
+def build_per_call():
+    """Legacy behaviour: a new provider, exporter and processor thread per call"""
+    provider = TracerProvider(resource=_build_resource())
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    return provider
+
+
+def run(iterations: int):
+    results = {}
+
+    # Before: one provider (and exporter thread) per invocation
+    threads_before = threading.active_count()
+    providers = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        providers.append(build_per_call())
+    elapsed = time.perf_counter() - start
+    results["before"] = (elapsed, threading.active_count() - threads_before)
+    for provider in providers:
+        provider.shutdown()
+
+    # After: the registry builds once and then returns the shared provider
+    registry = TracerProviderRegistry()
+    threads_before = threading.active_count()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        registry.get_or_create()
+    elapsed = time.perf_counter() - start
+    results["after"] = (elapsed, threading.active_count() - threads_before)
+    registry.shutdown()
+
+    print(f"{'mode':<8} {'total ms':>10} {'us/call':>10} {'new threads':>12}")
+    for mode, (elapsed, threads) in results.items():
+        print(
+            f"{mode:<8} {elapsed * 1000:>10.2f} "
+            f"{elapsed / iterations * 1e6:>10.2f} {threads:>12}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    # Exporters are only built when an endpoint is configured; nothing is
+    # exported during the benchmark, so an unreachable endpoint is fine.
+    os.environ.setdefault("OTEL_EXPORTER_OTLP_ENDPOINT", "http://127.0.0.1:4318")
+    logging.getLogger("opentelemetry").setLevel(logging.ERROR)
+    run(args.iterations)
+
+
+if __name__ == "__main__":
+    main()
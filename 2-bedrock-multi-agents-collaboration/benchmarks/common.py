@@ -0,0 +1,92 @@
+"""Shared fixtures for the benchmarks: a sample event stream and exporters."""
+
+import contextlib
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from core.configuration import reconfigure_tracer_provider
+
+EVENT_TIME_ORIGIN = datetime(2025, 5, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+
+def _trace_event(step: int, trace: dict) -> dict:
+    return {
+        "trace": {
+            "agentId": "BENCHAGENT",
+            "agentAliasId": "BENCHALIAS",
+            "sessionId": "bench-session",
+            "eventTime": EVENT_TIME_ORIGIN + timedelta(milliseconds=400 * step),
+            "trace": trace,
+        }
+    }
+
+
+def sample_event_stream(trace_id: str = "bench-trace-0", prompt_size: int = 3000):
+    """A single-agent completion stream: guardrails, LLM, KB, action group, answer"""
+    second_id = f"{trace_id}-1"
+    events = [
+        _trace_event(0, {"guardrailTrace": {
+            "traceId": f"{trace_id}-guardrail-pre-0", "action": "NONE",
+            "inputAssessments": [{}]}}),
+        _trace_event(1, {"orchestrationTrace": {"modelInvocationInput": {
+            "traceId": trace_id, "text": "P" * prompt_size, "type": "ORCHESTRATION",
+            "inferenceConfiguration": {"temperature": 0, "maximumLength": 2048}}}}),
+        _trace_event(2, {"orchestrationTrace": {"modelInvocationOutput": {
+            "traceId": trace_id, "rawResponse": {"content": "C" * 500},
+            "metadata": {"usage": {"inputTokens": 1000, "outputTokens": 100}},
+            "parsedResponse": {"text": "thinking"}}}}),
+        _trace_event(3, {"orchestrationTrace": {"rationale": {
+            "traceId": trace_id, "text": "Look up the knowledge base first."}}}),
+        _trace_event(4, {"orchestrationTrace": {"invocationInput": {
+            "traceId": trace_id, "invocationType": "KNOWLEDGE_BASE",
+            "knowledgeBaseLookupInput": {"text": "energy efficiency lamps",
+                                         "knowledgeBaseId": "KB123"}}}}),
+        _trace_event(9, {"orchestrationTrace": {"observation": {
+            "traceId": trace_id, "type": "KNOWLEDGE_BASE",
+            "knowledgeBaseLookupOutput": {"retrievedReferences": [
+                {"content": {"text": "reference " * 80},
+                 "location": {"s3Location": {"uri": f"s3://bench/doc-{i}.txt"}}}
+                for i in range(3)]}}}}),
+        _trace_event(10, {"orchestrationTrace": {"invocationInput": {
+            "traceId": trace_id, "invocationType": "ACTION_GROUP",
+            "actionGroupInvocationInput": {
+                "actionGroupName": "forecast", "function": "update_forecast",
+                "executionType": "LAMBDA",
+                "parameters": [{"name": "id", "value": "1"}]}}}}),
+        _trace_event(12, {"orchestrationTrace": {"observation": {
+            "traceId": trace_id, "type": "ACTION_GROUP",
+            "actionGroupInvocationOutput": {"text": "forecast updated"}}}}),
+        _trace_event(13, {"orchestrationTrace": {"modelInvocationInput": {
+            "traceId": second_id, "text": "P" * prompt_size, "type": "ORCHESTRATION"}}}),
+        _trace_event(15, {"orchestrationTrace": {"modelInvocationOutput": {
+            "traceId": second_id, "rawResponse": {"content": "Final answer"},
+            "metadata": {"usage": {"inputTokens": 1200, "outputTokens": 50}}}}}),
+        _trace_event(16, {"orchestrationTrace": {"observation": {
+            "traceId": second_id, "type": "FINISH",
+            "finalResponse": {"text": "Final answer"}}}}),
+        {"chunk": {"bytes": b"Final "}},
+    ]
+    for i in range(5):
+        events.append(_trace_event(17 + i, {"guardrailTrace": {
+            "traceId": f"{trace_id}-guardrail-post-{i}", "action": "NONE",
+            "outputAssessments": [{"contentPolicy": {"filters": [{"type": "VIOLENCE"}]}}]}}))
+    events.append({"chunk": {"bytes": b"answer"}})
+    return events
+
+
+def install_memory_exporter() -> InMemorySpanExporter:
+    """Route all spans to an in-memory exporter and silence handler logging"""
+    exporter = InMemorySpanExporter()
+    reconfigure_tracer_provider(span_processor=SimpleSpanProcessor(exporter))
+    logging.getLogger("core").setLevel(logging.CRITICAL)
+    logging.getLogger("opentelemetry").setLevel(logging.ERROR)
+    return exporter
+
+
+def quiet():
+    """Context manager discarding the handlers' diagnostic prints"""
+    return contextlib.redirect_stdout(open(os.devnull, "w"))
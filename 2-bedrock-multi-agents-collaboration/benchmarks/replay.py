@@ -0,0 +1,276 @@
+"""
+Replay recorded Bedrock Agent event streams through the instrumentation.
+
+Captures are written with ``SAVE_TRACE_LOGS`` (see core/capture.py); legacy
+``trace_logs.json`` files are accepted too. Every recorded invocation is fed
+through the instrumentation against an in-memory exporter, with no AWS
+access, and the run reports events/sec, spans/sec, inclusive time per handler
+and allocations per invocation. It exits with status 1 if a registered
+handler the events are routed to never shows up in the handler table.
+
+Modes:
+    decorator  instrument_agent_invocation, non-streaming (default)
+    streaming  instrument_agent_invocation with AgentStreamingWrapper
+    direct     process_trace_event under a bare root span
+
+    python -m benchmarks.replay trace_logs.jsonl --mode streaming
+    python -m benchmarks.replay --iterations 500 --json after.json --baseline before.json
+
+Without capture files the built-in sample_event_stream() is replayed;
+``--record PATH`` writes that sample as a capture to start from.
+"""
+
+import argparse
+import functools
+import json
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List
+
+from opentelemetry import trace
+
+from core import instrument_agent_invocation
+from core import agent, handlers, processes, streaming_wrapper
+from core.agent import process_trace_event
+from core.capture import Capture, read_capture, write_capture
+from core.context import InvocationContext, tracer as step_tracer
+from core.dispatch import dispatcher
+from core.events import TraceEvent
+
+from .common import install_memory_exporter, quiet, sample_event_stream
+
+MODES = ("decorator", "streaming", "direct")
+
+
+class HandlerProfiler:
+    """Wraps the trace handlers to accumulate inclusive time per handler
+
+    Handlers are timed where they are dispatched: every entry of the
+    dispatcher's registry, plus the handlers the instrumentation calls
+    outside of it through the module globals in DIRECT_CALLS.
+    """
+
+    DIRECT_CALLS = (
+        (agent, ("handle_file_operations", "process_guardrail_buffer")),
+        (streaming_wrapper, ("process_guardrail_buffer",)),
+        (processes, ("handle_file_operations", "handle_llm_invocation", "handle_final_response")),
+    )
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._originals = []
+        self._wrapped = {}
+
+    def install(self):
+        dispatcher.replace_handlers(self._wrap_handler)
+        for module, names in self.DIRECT_CALLS:
+            for name in names:
+                func = getattr(module, name)
+                self._originals.append((module, name, func))
+                setattr(module, name, self._wrap(name, func))
+
+    def uninstall(self):
+        dispatcher.replace_handlers(lambda handler: self._wrapped.get(handler, handler))
+        self._wrapped.clear()
+        for module, name, func in self._originals:
+            setattr(module, name, func)
+        self._originals.clear()
+
+    def _wrap_handler(self, handler):
+        timed = self._wrap(handler.__name__, handler)
+        self._wrapped[timed] = handler
+        return timed
+
+    def _wrap(self, name, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.seconds[name] += time.perf_counter() - start
+                self.calls[name] += 1
+
+        return timed
+
+
+def dispatched_handlers(captures: List[Capture]) -> List[str]:
+    """Names of the registered handlers the captured events are routed to"""
+    names = set()
+    for capture in captures:
+        for event in capture.events:
+            if "trace" in event:
+                names.update(handler.__name__
+                              for handler in dispatcher.handlers_for(TraceEvent(event["trace"])))
+    return sorted(names)
+
+
+def _invoker():
+    @instrument_agent_invocation
+    def invoke(inputText, agentId, agentAliasId, sessionId, **kwargs):
+        return kwargs["capture"].response()
+
+    return invoke
+
+
+def replay_once(capture: Capture, mode: str, invoke):
+    """Feed one recorded invocation through the instrumentation"""
+    header = capture.header
+    if mode == "direct":
+        ctx = InvocationContext()
+        tracer = trace.get_tracer("bedrock-agent-replay")
+        handlers.set_tracer(step_tracer)
+        with ctx.activate(), tracer.start_as_current_span("replay") as root_span:
+            ctx.root_span = root_span
+            for event in capture.response()["completion"]:
+                if "trace" in event:
+                    process_trace_event(event["trace"], root_span)
+            ctx.close()
+        return
+
+    response = invoke(
+        inputText=header.get("inputText", "replay"),
+        agentId=header.get("agentId", "REPLAY"),
+        agentAliasId=header.get("agentAliasId", "REPLAY"),
+        sessionId=header.get("sessionId", "replay-session"),
+        model_id=header.get("model_id"),
+        streaming=mode == "streaming",
+        capture=capture,
+    )
+    if mode == "streaming":
+        for _ in response["completion"]:
+            pass
+
+
+def run(captures: List[Capture], mode: str, iterations: int, exporter) -> Dict:
+    invoke = _invoker()
+    events = sum(len(capture) for capture in captures)
+
+    # Warm up imports and caches
+    with quiet():
+        for capture in captures:
+            replay_once(capture, mode, invoke)
+    exporter.clear()
+
+    profiler = HandlerProfiler()
+    profiler.install()
+    try:
+        start = time.perf_counter()
+        with quiet():
+            for _ in range(iterations):
+                for capture in captures:
+                    replay_once(capture, mode, invoke)
+        elapsed = time.perf_counter() - start
+    finally:
+        profiler.uninstall()
+    spans = len(exporter.get_finished_spans())
+    exporter.clear()
+
+    # Allocations are measured in a separate pass; tracemalloc skews timing
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        with quiet():
+            for capture in captures:
+                replay_once(capture, mode, invoke)
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    exporter.clear()
+
+    invocations = iterations * len(captures)
+    return {
+        "mode": mode,
+        "invocations": invocations,
+        "events": events * iterations,
+        "spans": spans,
+        "seconds": round(elapsed, 4),
+        "events_per_sec": round(events * iterations / elapsed, 1),
+        "spans_per_sec": round(spans / elapsed, 1),
+        "us_per_invocation": round(elapsed / invocations * 1e6, 1),
+        "retained_kib_per_invocation": round((after - before) / len(captures) / 1024, 1),
+        "peak_kib": round((peak - before) / 1024, 1),
+        "handlers": {
+            name: {
+                "calls": profiler.calls[name],
+                "us_per_call": round(profiler.seconds[name] / profiler.calls[name] * 1e6, 1),
+                "ms_total": round(profiler.seconds[name] * 1000, 2),
+            }
+            for name in sorted(profiler.seconds, key=profiler.seconds.get, reverse=True)
+        },
+        # Registered handlers the events are routed to that were never timed
+        "missing_handlers": [
+            name for name in dispatched_handlers(captures) if name not in profiler.calls
+        ],
+    }
+
+
+def _delta(now: float, before: float) -> str:
+    if not before:
+        return ""
+    return f" ({(now - before) / before * 100:+.1f}%)"
+
+
+def report(result: Dict, baseline: Dict = None):
+    baseline = baseline or {}
+    print(f"\nmode={result['mode']}  invocations={result['invocations']}  "
+          f"events={result['events']}  spans={result['spans']}")
+    for key in ("events_per_sec", "spans_per_sec", "us_per_invocation",
+                "retained_kib_per_invocation", "peak_kib"):
+        print(f"  {key:<28}{result[key]:>12}{_delta(result[key], baseline.get(key))}")
+    print(f"  {'handler (inclusive)':<40}{'calls':>8}{'us/call':>10}{'ms total':>10}")
+    for name, stats in result["handlers"].items():
+        print(f"  {name:<40}{stats['calls']:>8}{stats['us_per_call']:>10}"
+              f"{stats['ms_total']:>10}")
+    if result["missing_handlers"]:
+        print(f"  MISSING from the handler table: {', '.join(result['missing_handlers'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("captures", nargs="*", help="capture or trace_logs.json files")
+    parser.add_argument("--mode", choices=MODES + ("all",), default="all")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--record", help="write the built-in sample stream as a capture")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare with")
+    args = parser.parse_args()
+
+    if args.record:
+        write_capture(args.record, sample_event_stream(), agentId="BENCHAGENT",
+                      agentAliasId="BENCHALIAS", sessionId="bench-session")
+        print(f"Wrote {args.record}")
+        return
+
+    if args.captures:
+        captures = [c for path in args.captures for c in read_capture(path)]
+    else:
+        captures = [Capture({"agentId": "BENCHAGENT"}, sample_event_stream(), [])]
+
+    exporter = install_memory_exporter()
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {r["mode"]: r for r in json.load(f)}
+
+    modes = MODES if args.mode == "all" else (args.mode,)
+    results = []
+    for mode in modes:
+        result = run(captures, mode, args.iterations, exporter)
+        report(result, baseline.get(mode))
+        results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if any(result["missing_handlers"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
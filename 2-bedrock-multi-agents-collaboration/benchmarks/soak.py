@@ -0,0 +1,215 @@
+"""
+Soak test for memory growth across thousands of instrumented invocations.
+
+Replays recorded (or the built-in sample, or synthetic) event streams through
+the instrumentation many times and takes a tracemalloc snapshot at every
+interval. Allocation sites in core/ whose retained size keeps growing are
+reported with their growth per 1000 invocations, together with the size of
+the long-lived containers (the default invocation's timers, span manager,
+guardrail buffer and registries) and the InvocationContext and streaming
+wrapper objects still alive at the end.
+
+    python -m benchmarks.soak --invocations 10000 --interval 1000
+    python -m benchmarks.soak trace_logs.jsonl --mode streaming --max-retained-kib 256
+    python -m benchmarks.soak --synthetic 10 --invocations 2000
+
+Exits with status 1 if the memory retained after the warm-up grows by more
+than --max-retained-kib, so it can run as a CI gate.
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+import core
+from core.capture import Capture, read_capture
+from core.context import InvocationContext, _default_invocation
+from core.streaming_wrapper import AgentStreamingWrapper
+
+from .common import install_memory_exporter, quiet, sample_event_stream
+from .replay import MODES, _invoker, replay_once
+from .synthetic import StreamShape, synthetic_stream
+
+CORE_FILES = os.path.join(os.path.dirname(os.path.abspath(core.__file__)), "*")
+
+
+def _core_sites(snapshot: tracemalloc.Snapshot) -> Dict[str, tracemalloc.Statistic]:
+    """Retained size and count per core/ allocation site"""
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(True, CORE_FILES)])
+    return {
+        f"{os.path.relpath(stat.traceback[0].filename)}:{stat.traceback[0].lineno}": stat
+        for stat in snapshot.statistics("lineno")
+    }
+
+
+def container_sizes() -> Dict[str, int]:
+    """Entries held by the long-lived state of the default invocation"""
+    ctx = _default_invocation
+    active = dict(ctx.active_spans)
+    active.update(active.pop("active_traces", {}))
+    return {
+        "timer._timers": len(ctx.timer._timers),
+        "span_manager.spans": len(ctx.span_manager.spans),
+        "span_manager.spans_with_set_times": len(ctx.span_manager.spans_with_set_times),
+        "guardrail_buffer": len(ctx.guardrail_buffer),
+        "active_spans": sum(value is not None for value in active.values()),
+        "spans (registry)": len(ctx.spans.open_spans()),
+        "event_clock trace IDs": len(ctx.event_clock._last_by_trace),
+        "attribute_usage": len(ctx.attribute_usage),
+        "content_digests": len(ctx.content_digests),
+    }
+
+
+def live_objects() -> Dict[str, int]:
+    """Per-invocation objects that should not outlive their invocation"""
+    counts = {"InvocationContext": 0, "AgentStreamingWrapper": 0, "streamed traces": 0}
+    for obj in gc.get_objects():
+        if isinstance(obj, InvocationContext) and obj is not _default_invocation:
+            counts["InvocationContext"] += 1
+        elif isinstance(obj, AgentStreamingWrapper):
+            counts["AgentStreamingWrapper"] += 1
+            counts["streamed traces"] += len(obj._self_completion_data["traces"])
+    return counts
+
+
+def soak(captures: List[Capture], mode: str, invocations: int, interval: int,
+         warmup: int, exporter, min_site_growth: int = 1024) -> Dict[str, Any]:
+    invoke = _invoker()
+
+    def replay(count: int, offset: int = 0):
+        with quiet():
+            for i in range(count):
+                replay_once(captures[(offset + i) % len(captures)], mode, invoke)
+                exporter.clear()
+
+    # Fill caches, metric series and lazily created state before the baseline
+    replay(warmup)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline_traced, _ = tracemalloc.get_traced_memory()
+        baseline_sites = _core_sites(tracemalloc.take_snapshot())
+        samples = [{"invocations": 0, "traced_kib": 0.0, "core_kib": 0.0}]
+        # Retained bytes per site at every interval, relative to the baseline
+        series: Dict[str, List[int]] = {}
+
+        started = time.perf_counter()
+        done = 0
+        while done < invocations:
+            count = min(interval, invocations - done)
+            replay(count, done)
+            done += count
+            gc.collect()
+            traced, _ = tracemalloc.get_traced_memory()
+            sites = _core_sites(tracemalloc.take_snapshot())
+            for site in set(sites) | set(series):
+                size = sites[site].size if site in sites else 0
+                before = baseline_sites[site].size if site in baseline_sites else 0
+                series.setdefault(site, [0] * (len(samples) - 1)).append(size - before)
+            samples.append({
+                "invocations": done,
+                "traced_kib": round((traced - baseline_traced) / 1024, 1),
+                "core_kib": round(sum(values[-1] for values in series.values()) / 1024, 1),
+            })
+        elapsed = time.perf_counter() - started
+    finally:
+        tracemalloc.stop()
+
+    # Growing: still retaining more in the second half of the run; caches
+    # filling up to their bound level off before that
+    growing = []
+    for site, values in series.items():
+        growth = values[-1]
+        if growth > 0 and values[-1] - values[len(values) // 2] >= min_site_growth:
+            growing.append({
+                "site": site,
+                "growth_kib": round(growth / 1024, 1),
+                "bytes_per_1k_invocations": round(growth / invocations * 1000),
+                "intervals_grown": sum(b > a for a, b in zip([0] + values, values)),
+            })
+    growing.sort(key=lambda site: site["growth_kib"], reverse=True)
+
+    return {
+        "mode": mode,
+        "invocations": invocations,
+        "seconds": round(elapsed, 1),
+        "retained_kib": samples[-1]["traced_kib"],
+        "retained_bytes_per_invocation": round(samples[-1]["traced_kib"] * 1024 / invocations, 1),
+        "samples": samples,
+        "growing_sites": growing,
+        "containers": container_sizes(),
+        "live_objects": live_objects(),
+    }
+
+
+def report(result: Dict[str, Any], top: int):
+    print(f"\nmode={result['mode']}  invocations={result['invocations']}  "
+          f"seconds={result['seconds']}")
+    print(f"  {'invocations':>12}{'retained KiB':>14}{'core/ KiB':>12}")
+    for sample in result["samples"]:
+        print(f"  {sample['invocations']:>12}{sample['traced_kib']:>14}{sample['core_kib']:>12}")
+    print(f"  retained {result['retained_kib']} KiB "
+          f"({result['retained_bytes_per_invocation']} bytes/invocation)")
+
+    growing = result["growing_sites"][:top]
+    print(f"  growing core/ allocation sites: {len(result['growing_sites'])}")
+    for site in growing:
+        print(f"    {site['site']:<48}{site['growth_kib']:>9} KiB"
+              f"{site['bytes_per_1k_invocations']:>10} B/1k invocations"
+              f"  grew in {site['intervals_grown']}/{len(result['samples']) - 1} intervals")
+    print("  long-lived state: " + ", ".join(
+        f"{name}={size}" for name, size in result["containers"].items()))
+    print("  live objects: " + ", ".join(
+        f"{name}={count}" for name, count in result["live_objects"].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("captures", nargs="*", help="capture or trace_logs.json files")
+    parser.add_argument("--mode", choices=MODES, default="decorator")
+    parser.add_argument("--synthetic", type=int, metavar="SCALE",
+                        help="replay a synthetic stream of this scale (see benchmarks.synthetic)")
+    parser.add_argument("--invocations", type=int, default=10000)
+    parser.add_argument("--interval", type=int, default=1000,
+                        help="invocations between tracemalloc snapshots")
+    parser.add_argument("--warmup", type=int, default=500)
+    parser.add_argument("--max-retained-kib", type=float, default=1024,
+                        help="fail if memory retained after the warm-up grows beyond this")
+    parser.add_argument("--min-site-growth", type=int, default=1024,
+                        help="bytes a site must grow by in the second half to be reported")
+    parser.add_argument("--top", type=int, default=15, help="growing sites to list")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    if args.captures:
+        captures = [c for path in args.captures for c in read_capture(path)]
+    elif args.synthetic:
+        shape = StreamShape().scaled(args.synthetic)
+        captures = [Capture({"agentId": "SYNTHAGENT"},
+                            list(synthetic_stream(shape, streaming=args.mode == "streaming")), [])]
+    else:
+        captures = [Capture({"agentId": "BENCHAGENT"}, sample_event_stream(), [])]
+
+    exporter = install_memory_exporter()
+    result = soak(captures, args.mode, args.invocations, args.interval, args.warmup,
+                  exporter, args.min_site_growth)
+    result["max_retained_kib"] = args.max_retained_kib
+    report(result, args.top)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if result["retained_kib"] > args.max_retained_kib:
+        print(f"FAIL: retained {result['retained_kib']} KiB > {args.max_retained_kib} KiB")
+        sys.exit(1)
+    print(f"OK: retained {result['retained_kib']} KiB <= {args.max_retained_kib} KiB")
+
+
+if __name__ == "__main__":
+    main()
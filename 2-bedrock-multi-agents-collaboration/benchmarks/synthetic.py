@@ -0,0 +1,353 @@
+"""
+Synthetic Bedrock Agent completion streams for scale testing.
+
+``synthetic_stream`` generates the events of an ``invoke_agent`` completion
+stream with a configurable shape: orchestration steps, knowledge base lookups
+with N retrieved references, action group calls, collaborator agents (with
+their own caller-chained traces), pre/post-processing, answer chunks and the
+guardrail-post events between them, and the eventTime spacing of the steps.
+Events are generated lazily, like the botocore EventStream, so 100x streams
+do not have to be built up front.
+
+``SyntheticAgentClient`` stands in for the ``bedrock-agent-runtime`` client:
+``invoke_agent(**invoke_params)`` takes the parameters ``invoke_bedrock_agent``
+passes and returns a response shaped like boto3's, so the instrumented call
+can be benchmarked as it runs in production, without AWS access.
+
+Run as a benchmark it compares the instrumentation on the default shape
+(about the size of a real single-agent trace) and multiples of it:
+
+    python -m benchmarks.synthetic --scales 1 10 100 --invocations 20
+    python -m benchmarks.synthetic --streaming --collaborators 2 --json scale.json
+"""
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, NamedTuple, Optional
+
+from core import instrument_agent_invocation
+
+from .common import install_memory_exporter, quiet
+
+MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+
+PROMPT_TYPES = {
+    "preProcessingTrace": "PRE_PROCESSING",
+    "orchestrationTrace": "ORCHESTRATION",
+    "postProcessingTrace": "POST_PROCESSING",
+}
+
+
+class StreamShape(NamedTuple):
+    """Shape of a synthetic completion stream"""
+    # Orchestration steps before the final answer; each calls one of the
+    # tools below while there are tool calls left, and only reasons otherwise
+    orchestration_steps: int = 3
+    kb_lookups: int = 1
+    references: int = 3
+    reference_chars: int = 800
+    action_groups: int = 1
+    collaborators: int = 0
+    # Orchestration steps of each collaborator, traced with its callerChain
+    collaborator_steps: int = 1
+    preprocessing: bool = False
+    postprocessing: bool = False
+    prompt_chars: int = 3000
+    completion_chars: int = 500
+    answer_chars: int = 1200
+    # Answer bytes per chunk; streamed answers get a guardrail-post event
+    # every guardrail_interval chunks
+    chunk_size: int = 60
+    guardrail_interval: int = 4
+    # eventTime gap between events, and before each tool observation
+    step_ms: float = 400.0
+    tool_ms: float = 2000.0
+    # Relative random variation of the gaps (0.2: +-20%)
+    jitter: float = 0.0
+    seed: int = 0
+
+    def scaled(self, factor: int) -> "StreamShape":
+        """The same shape with ``factor`` times as many steps, tool calls and
+        answer chunks; references per lookup and per-item sizes stay the same,
+        so the stream grows linearly with ``factor``"""
+        return self._replace(
+            orchestration_steps=self.orchestration_steps * factor,
+            kb_lookups=self.kb_lookups * factor,
+            action_groups=self.action_groups * factor,
+            collaborators=self.collaborators * factor,
+            answer_chars=self.answer_chars * factor,
+        )
+
+
+class _Timeline:
+    """eventTime values of one stream, with optional jitter"""
+
+    def __init__(self, shape: StreamShape, start: datetime):
+        self._random = random.Random(shape.seed)
+        self._jitter = shape.jitter
+        self.time = start
+
+    def advance(self, ms: float) -> datetime:
+        if self._jitter:
+            ms *= self._random.uniform(1 - self._jitter, 1 + self._jitter)
+        self.time += timedelta(milliseconds=ms)
+        return self.time
+
+
+def _tool_calls(shape: StreamShape, trace_id: str, step: int):
+    """Invocation input and observation of the tool called in ``step``"""
+    kb, actions = shape.kb_lookups, shape.action_groups
+    if step < kb:
+        return (
+            {"invocationType": "KNOWLEDGE_BASE",
+             "knowledgeBaseLookupInput": {"text": f"lookup {step}", "knowledgeBaseId": "SYNTHKB"}},
+            {"type": "KNOWLEDGE_BASE",
+             "knowledgeBaseLookupOutput": {"retrievedReferences": [
+                 {"content": {"text": "r" * shape.reference_chars},
+                  "location": {"type": "S3", "s3Location": {"uri": f"s3://synthetic/doc-{i}.txt"}},
+                  "metadata": {"x-amz-bedrock-kb-chunk-id": f"{trace_id}-{i}"}}
+                 for i in range(shape.references)]}},
+        )
+    if step < kb + actions:
+        return (
+            {"invocationType": "ACTION_GROUP",
+             "actionGroupInvocationInput": {
+                 "actionGroupName": "synthetic", "function": f"action_{step - kb}",
+                 "executionType": "LAMBDA",
+                 "parameters": [{"name": "id", "type": "string", "value": str(step)}]}},
+            {"type": "ACTION_GROUP",
+             "actionGroupInvocationOutput": {"text": f"action {step - kb} done"}},
+        )
+    collaborator = step - kb - actions
+    arn = f"arn:aws:bedrock:us-east-1:000000000000:agent-alias/SYNTHCOLLAB{collaborator}/ALIAS"
+    return (
+        {"invocationType": "AGENT_COLLABORATOR",
+         "agentCollaboratorInvocationInput": {
+             "agentCollaboratorName": f"collaborator-{collaborator}",
+             "agentCollaboratorAliasArn": arn,
+             "input": {"type": "TEXT", "text": f"task {collaborator}"}}},
+        {"type": "AGENT_COLLABORATOR",
+         "agentCollaboratorInvocationOutput": {
+             "agentCollaboratorName": f"collaborator-{collaborator}",
+             "agentCollaboratorAliasArn": arn,
+             "output": {"type": "TEXT", "text": f"collaborator {collaborator} answer"}}},
+    )
+
+
+def synthetic_stream(
+    shape: StreamShape = StreamShape(),
+    agent_id: str = "SYNTHAGENT",
+    agent_alias_id: str = "SYNTHALIAS",
+    session_id: str = "synthetic-session",
+    streaming: bool = True,
+    start: Optional[datetime] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Yield the events of one invoke_agent completion stream.
+
+    eventTime values start at ``start`` (default: now). Without ``streaming``
+    the answer arrives as one chunk and no guardrail-post events are sent.
+    """
+    timeline = _Timeline(shape, start or datetime.now(timezone.utc))
+    base_id = uuid.uuid4().hex
+    caller_chain = [{"agentAliasArn": f"arn:aws:bedrock:us-east-1:000000000000:"
+                                      f"agent-alias/{agent_id}/{agent_alias_id}"}]
+
+    def event(trace: dict, ms: float = shape.step_ms, chain=caller_chain, agent=agent_id):
+        return {"trace": {
+            "agentId": agent, "agentAliasId": agent_alias_id, "agentVersion": "1",
+            "sessionId": session_id, "callerChain": chain,
+            "eventTime": timeline.advance(ms), "trace": trace,
+        }}
+
+    def model_step(kind: str, trace_id: str, chain=caller_chain, agent=agent_id):
+        # modelInvocationInput/Output pair of an LLM call
+        yield event({kind: {"modelInvocationInput": {
+            "traceId": trace_id, "text": "P" * shape.prompt_chars,
+            "type": PROMPT_TYPES[kind],
+            "inferenceConfiguration": {"temperature": 0, "topP": 1, "maximumLength": 2048}}}},
+            chain=chain, agent=agent)
+        yield event({kind: {"modelInvocationOutput": {
+            "traceId": trace_id, "rawResponse": {"content": "C" * shape.completion_chars},
+            "metadata": {"usage": {"inputTokens": shape.prompt_chars // 4,
+                                   "outputTokens": shape.completion_chars // 4}},
+            "parsedResponse": {"isValid": True, "rationale": "synthetic", "text": "synthetic"}}}},
+            chain=chain, agent=agent)
+
+    yield event({"guardrailTrace": {
+        "traceId": f"{base_id}-guardrail-pre-0", "action": "NONE", "inputAssessments": [{}]}})
+    if shape.preprocessing:
+        yield from model_step("preProcessingTrace", f"{base_id}-pre-0")
+
+    tools = shape.kb_lookups + shape.action_groups + shape.collaborators
+    for step in range(max(shape.orchestration_steps, tools)):
+        trace_id = f"{base_id}-{step}"
+        yield from model_step("orchestrationTrace", trace_id)
+        yield event({"orchestrationTrace": {"rationale": {
+            "traceId": trace_id, "text": f"Reasoning for step {step}."}}})
+        if step >= tools:
+            continue
+        invocation_input, observation = _tool_calls(shape, trace_id, step)
+        yield event({"orchestrationTrace": {"invocationInput": {
+            "traceId": trace_id, **invocation_input}}})
+        if "agentCollaboratorInvocationInput" in invocation_input:
+            # The collaborator's own trace, reported through the supervisor
+            name = invocation_input["agentCollaboratorInvocationInput"]["agentCollaboratorName"]
+            collaborator_id = name.upper().replace("-", "")
+            chain = caller_chain + [{"agentAliasArn": invocation_input[
+                "agentCollaboratorInvocationInput"]["agentCollaboratorAliasArn"]}]
+            collaborator_trace = f"{trace_id}-{name}"
+            for collaborator_step in range(shape.collaborator_steps):
+                yield from model_step("orchestrationTrace", f"{collaborator_trace}-{collaborator_step}",
+                                      chain, collaborator_id)
+            yield event({"orchestrationTrace": {"observation": {
+                "traceId": collaborator_trace, "type": "FINISH",
+                "finalResponse": {"text": f"{name} answer"}}}}, chain=chain, agent=collaborator_id)
+        yield event({"orchestrationTrace": {"observation": {
+            "traceId": trace_id, **observation}}}, ms=shape.tool_ms)
+
+    final_id = f"{base_id}-final"
+    yield from model_step("orchestrationTrace", final_id)
+    answer = ("The synthetic answer. " * (shape.answer_chars // 22 + 1))[:shape.answer_chars]
+    yield event({"orchestrationTrace": {"observation": {
+        "traceId": final_id, "type": "FINISH", "finalResponse": {"text": answer}}}})
+    if shape.postprocessing:
+        yield from model_step("postProcessingTrace", f"{base_id}-post-0")
+
+    encoded = answer.encode("utf-8")
+    if not streaming:
+        yield {"chunk": {"bytes": encoded}}
+        return
+    size = max(shape.chunk_size, 1)
+    for index, offset in enumerate(range(0, len(encoded), size)):
+        yield {"chunk": {"bytes": encoded[offset:offset + size]}}
+        if shape.guardrail_interval and (index + 1) % shape.guardrail_interval == 0:
+            yield event({"guardrailTrace": {
+                "traceId": f"{base_id}-guardrail-post-{index // shape.guardrail_interval}",
+                "action": "NONE",
+                "outputAssessments": [{"contentPolicy": {"filters": [{"type": "VIOLENCE"}]}}]}},
+                ms=shape.step_ms / 10)
+
+
+class SyntheticAgentClient:
+    """Stand-in for the bedrock-agent-runtime client, serving synthetic streams"""
+
+    def __init__(self, shape: StreamShape = StreamShape()):
+        self.shape = shape
+
+    def invoke_agent(self, agentId: str, agentAliasId: str, sessionId: str,
+                     streamingConfigurations: Optional[dict] = None, **kwargs) -> Dict[str, Any]:
+        streaming = bool((streamingConfigurations or {}).get("streamFinalResponse"))
+        return {
+            "ResponseMetadata": {"HTTPStatusCode": 200, "RequestId": str(uuid.uuid4())},
+            "contentType": "application/json",
+            "sessionId": sessionId,
+            "completion": synthetic_stream(self.shape, agentId, agentAliasId, sessionId, streaming),
+        }
+
+
+def run(shape: StreamShape, invocations: int, streaming: bool, exporter) -> Dict[str, Any]:
+    client = SyntheticAgentClient(shape)
+
+    @instrument_agent_invocation
+    def invoke(inputText, agentId, agentAliasId, sessionId, **kwargs):
+        # The same call invoke_bedrock_agent makes on the boto3 client
+        invoke_params = {"inputText": inputText, "agentId": agentId,
+                         "agentAliasId": agentAliasId, "sessionId": sessionId,
+                         "enableTrace": True}
+        if kwargs.get("streaming"):
+            invoke_params["streamingConfigurations"] = {
+                "applyGuardrailInterval": 10, "streamFinalResponse": True}
+        return client.invoke_agent(**invoke_params)
+
+    def invoke_once():
+        response = invoke(inputText="synthetic", agentId="SYNTHAGENT", agentAliasId="SYNTHALIAS",
+                          sessionId="synthetic-session", model_id=MODEL_ID, streaming=streaming)
+        if streaming:
+            for _ in response["completion"]:
+                pass
+
+    events = sum(1 for _ in synthetic_stream(shape, streaming=streaming))
+    with quiet():
+        invoke_once()
+    exporter.clear()
+
+    # Time spent generating the stream, subtracted from the instrumented time
+    start = time.perf_counter()
+    for _ in range(invocations):
+        for _ in synthetic_stream(shape, streaming=streaming):
+            pass
+    generate = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with quiet():
+        for _ in range(invocations):
+            invoke_once()
+    elapsed = time.perf_counter() - start
+    spans = len(exporter.get_finished_spans())
+    exporter.clear()
+
+    # Allocations are measured in a separate pass; tracemalloc skews timing
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        with quiet():
+            invoke_once()
+        exporter.clear()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    instrumented = max(elapsed - generate, 0.0)
+    return {
+        "events_per_invocation": events,
+        "spans_per_invocation": round(spans / invocations, 1),
+        "us_per_invocation": round(instrumented / invocations * 1e6, 1),
+        "us_per_event": round(instrumented / invocations / events * 1e6, 2),
+        "generate_us_per_invocation": round(generate / invocations * 1e6, 1),
+        "retained_kib": round((after - before) / 1024, 1),
+        "peak_kib": round((peak - before) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--invocations", type=int, default=20,
+                        help="invocations at scale 1; fewer at larger scales")
+    parser.add_argument("--streaming", action="store_true",
+                        help="stream the answer (AgentStreamingWrapper, guardrail-post events)")
+    for field, default in StreamShape._field_defaults.items():
+        option = "--" + field.replace("_", "-")
+        if isinstance(default, bool):
+            parser.add_argument(option, action="store_true", default=default)
+        else:
+            parser.add_argument(option, type=type(default), default=default)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    shape = StreamShape(**{field: getattr(args, field) for field in StreamShape._fields})
+    exporter = install_memory_exporter()
+    print(f"{'scale':>6}{'events':>9}{'spans':>9}{'us/invocation':>16}{'us/event':>11}"
+          f"{'retained KiB':>14}{'peak KiB':>11}")
+    results = []
+    for scale in args.scales:
+        result = run(shape.scaled(scale), max(args.invocations // scale, 1), args.streaming, exporter)
+        result["scale"] = scale
+        results.append(result)
+        print(f"{scale:>6}{result['events_per_invocation']:>9}{result['spans_per_invocation']:>9}"
+              f"{result['us_per_invocation']:>16}{result['us_per_event']:>11}"
+              f"{result['retained_kib']:>14}{result['peak_kib']:>11}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,4 +3,5 @@ Core module for Bedrock Agent OpenTelemetry integration.
 """
 
 from .agent import instrument_agent_invocation
-from .tracing import flush_telemetry
\ No newline at end of file
+from .dispatch import register_trace_handler
+from .tracing import flush_telemetry, get_export_metrics
\ No newline at end of file
@@ -6,7 +6,7 @@ This module processes events as they're received without collecting them.
 import json
 import logging
 import time
-from datetime import datetime, timezone
+from datetime import datetime
 from functools import wraps
 import uuid
 from typing import Dict, Any, Optional
@@ -14,6 +14,24 @@ from opentelemetry import trace
 from opentelemetry.trace import Status, StatusCode, SpanKind
 from .configuration import create_tracer_provider
 from .constants import SpanAttributes, SpanKindValues
+from .attributes import set_attribute, set_prompt
+from .timing import get_time, now
+from .context import InvocationContext, SpanManager, current_invocation, trace_event, tracer as step_tracer
+from .events import TraceEvent
+from .dispatch import dispatcher
+from .handlers import (
+    handle_failure,
+    handle_file_operations,
+    handle_guardrail_trace,
+    handle_preprocessing,
+    process_guardrail_buffer,
+    set_tracer,
+)
+from .processes import (
+    ORCHESTRATION_HANDLERS,
+    process_orchestration_trace,
+    process_post_processing_trace,
+)
 
 # Initialize logging
 logger = logging.getLogger(__name__)
@@ -30,189 +48,11 @@ class DateTimeEncoder(json.JSONEncoder):
             return obj.isoformat()
         return super().default(obj)
 
-# Class to manage spans during processing
-
-
-class SpanManager:
-    """Manages spans and their relationships for the duration of processing."""
-
-    def __init__(self):
-        # Main spans dictionary - keyed by component_type:trace_id
-        self.spans = {}
-
-        # Track current trace_id for each component
-        self.active_traces = {
-            "orchestration": None,
-            "postprocessing": None,
-            "preprocessing": None,
-            "guardrail_pre": None,
-            "guardrail_post": None,
-        }
-
-        # Special spans tracked for direct access
-        self.special_spans = {
-            "kb_span": None,
-            "code_span": None,
-            "action_span": None,
-            "llm_spans": {},  # Tracks LLM spans by trace_id
-        }
-
-        # Buffer for guardrail traces in streaming mode
-        self.guardrail_buffer = {}
-        # Track which spans have had their times set to prevent overwriting
-        self.spans_with_set_times = set()
-
-    def reset(self):
-        """Reset the span manager, ending any active spans."""
-        # End all active spans
-        for span_id, span in list(self.spans.items()):
-            if span and hasattr(span, "is_recording") and span.is_recording():
-                try:
-                    span.set_status(Status(StatusCode.OK))
-                    span.end()
-                except Exception as e:
-                    logger.error(f"Error ending span {span_id}: {e}")
-
-        # Reset all tracking collections
-        self.spans.clear()
-        self.active_traces = {
-            "orchestration": None,
-            "postprocessing": None,
-            "preprocessing": None,
-            "guardrail_pre": None,
-            "guardrail_post": None,
-        }
-
-        self.special_spans = {
-            "kb_span": None,
-            "code_span": None,
-            "action_span": None,
-            "llm_spans": {},
-        }
-
-        self.guardrail_buffer.clear()
-        self.spans_with_set_times.clear()
-
-    def protect_span_timing(self, span_key: str):
-        """Mark a span's timing as protected to prevent overwrites"""
-        self.spans_with_set_times.add(span_key)
-
-    def can_set_timing(self, span_key: str) -> bool:
-        """Check if timing can be set for this span"""
-        return span_key not in self.spans_with_set_times
-
-    def get_or_create_span(
-        self,
-        component_type: str,
-        trace_id: str,
-        parent_span,
-        attributes=None,
-        timing_data=None,
-    ):
-        span_key = f"{component_type}:{trace_id}"
-
-        if not parent_span:
-            logger.info("No parent span provided, cannot create child span.")
-
-            # Check existing span
-        if span_key in self.spans and self.spans[span_key].is_recording():
-            span = self.spans[span_key]
-
-            # Only update timing if allowed and provided
-            if timing_data and self.can_set_timing(span_key):
-                start_time_iso, end_time_iso, latency_ms = timing_data
-                if start_time_iso and end_time_iso:
-                    span.set_attribute(
-                        SpanAttributes.SPAN_START_TIME, start_time_iso
-                    )
-                    span.set_attribute(
-                        SpanAttributes.SPAN_END_TIME, end_time_iso)
-                    span.set_attribute(
-                        SpanAttributes.SPAN_DURATION, latency_ms)
-                    self.protect_span_timing(span_key)
-
-            return span
-
-        # Create new span with proper context from parent
-        span = tracer.start_span(
-            name=component_type,
-            kind=SpanKind.CLIENT,
-            attributes=attributes or {},
-            context=trace.set_span_in_context(parent_span),
-        )
-
-        # Start the span only if it's not already recording
-        if not span.is_recording():
-            print(f"Span {span_key} is not recording, starting it now.")
-            span.start()
-
-        # Set timing data if provided
-        if timing_data:
-            start_time_iso, end_time_iso, latency_ms = timing_data
-
-            # Only set if values are valid
-            if start_time_iso and end_time_iso:
-                span.set_attribute(
-                    SpanAttributes.SPAN_START_TIME, start_time_iso)
-                span.set_attribute(SpanAttributes.SPAN_END_TIME, end_time_iso)
-                span.set_attribute(SpanAttributes.SPAN_DURATION, latency_ms)
-
-                # Mark as having times set
-                self.spans_with_set_times.add(span_key)
-                logger.debug(f"Set timing on new span {span_key}")
-
-        self.spans[span_key] = span
-        self.active_traces[component_type] = trace_id
-        return span
-
-    def set_timing_if_not_set(
-        self, span_key, span, start_time_iso, end_time_iso, latency_ms
-    ):
-        """Set timing data on a span if it hasn't been set already."""
-        if span_key not in self.spans_with_set_times:
-            span.set_attribute(SpanAttributes.SPAN_START_TIME, start_time_iso)
-            span.set_attribute(SpanAttributes.SPAN_END_TIME, end_time_iso)
-            span.set_attribute(SpanAttributes.SPAN_DURATION, latency_ms)
-            self.spans_with_set_times.add(span_key)
-            logger.debug(f"Set timing on span {span_key}")
-            return True
-        return False
-
-    def add_guardrail_event(
-        self, base_trace_id: str, trace_data: Dict, content: Optional[str] = None
-    ) -> None:
-        """Add event to guardrail buffer with associated content chunk"""
-        if base_trace_id not in self.guardrail_buffer:
-            self.guardrail_buffer[base_trace_id] = []
-
-        # Store event with timestamp and content
-        event_data = {
-            "trace_data": trace_data,
-            "timestamp": datetime.now().isoformat(),
-            "content": content,
-        }
-        self.guardrail_buffer[base_trace_id].append(event_data)
-
-
-# Create a global instance of SpanManager
-span_manager = SpanManager()
-
-# Global dictionary for backwards compatibility
-active_spans = {
-    "kb_span": None,
-    "action_span": None,
-    "code_span": None,
-    "orchestration_span": None,
-    "postprocessing_span": None,
-    "active_traces": {
-        "preprocessing": None,
-        "orchestration": None,
-        "postprocessing": None,
-    },
-}
-
-# Global guardrail buffer for backward compatibility
-guardrail_buffer = {}
+def __getattr__(name):
+    """Resolve the legacy module globals to the current invocation's state"""
+    if name in ("span_manager", "active_spans", "guardrail_buffer"):
+        return getattr(current_invocation(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def json_safe(obj):
@@ -222,78 +62,29 @@ def json_safe(obj):
     return obj
 
 
-def get_time():
-    """Get the current time in timestamp and ISO format"""
-    end_timestamp = time.time()
-    end_time_iso = (
-        datetime.fromtimestamp(end_timestamp, tz=timezone.utc)
-        .replace(tzinfo=None)
-        .isoformat()
-    )
-    return end_timestamp, end_time_iso
+def open_capture(save_trace_logs, **header):
+    """Open the capture file for SAVE_TRACE_LOGS (True or a file path)"""
+    from .capture import CaptureWriter
+
+    path = save_trace_logs if isinstance(save_trace_logs, str) else "trace_logs.jsonl"
+    try:
+        return CaptureWriter(path, **header)
+    except Exception as e:
+        logger.error(f"Failed to open trace log {path}: {str(e)}")
+        return None
 
 
 def extract_trace_id(trace_data: Dict[str, Any], component_type: str = None) -> str:
     """Extract trace ID from any component trace"""
-    # Handle the case where we're given the full trace object
-    trace_obj = trace_data.get("trace", trace_data)
-
-    # Check for event type based on component_type if provided
+    event = trace_event(trace_data)
     if component_type:
-        if component_type == "orchestration" and "orchestrationTrace" in trace_obj:
-            component_trace = trace_obj["orchestrationTrace"]
-        elif component_type == "preprocessing" and "preProcessingTrace" in trace_obj:
-            component_trace = trace_obj["preProcessingTrace"]
-        elif component_type == "postprocessing" and "postProcessingTrace" in trace_obj:
-            component_trace = trace_obj["postProcessingTrace"]
-        elif component_type == "guardrail_pre" or component_type == "guardrail_post":
-            return trace_obj.get("guardrailTrace", {}).get(
-                "traceId", f"guardrail-{time.time()}"
-            )
-        else:
-            print(f"Unknown component type: {component_type}")
-            component_trace = {}
-    else:
-        # Try to infer component type from trace object
-        if "orchestrationTrace" in trace_obj:
-            component_trace = trace_obj["orchestrationTrace"]
-        elif "preProcessingTrace" in trace_obj:
-            component_trace = trace_obj["preProcessingTrace"]
-        elif "postProcessingTrace" in trace_obj:
-            component_trace = trace_obj["postProcessingTrace"]
-        elif "guardrailTrace" in trace_obj:
-            return trace_obj["guardrailTrace"].get(
-                "traceId", f"guardrail-{time.time()}"
-            )
-        elif "failureTrace" in trace_obj:
-            return trace_obj["failureTrace"].get("traceId", f"failure-{time.time()}")
-        else:
-            print(f"Unknown component trace: {trace_obj}")
-            component_trace = {}
-
-    # Try to extract from modelInvocation fields first
-    if (
-        "modelInvocationInput" in component_trace
-        and "traceId" in component_trace["modelInvocationInput"]
-    ):
-        return component_trace["modelInvocationInput"]["traceId"]
-    if (
-        "modelInvocationOutput" in component_trace
-        and "traceId" in component_trace["modelInvocationOutput"]
-    ):
-        return component_trace["modelInvocationOutput"]["traceId"]
-
-    # Try other common fields
-    for field in ["rationale", "invocationInput", "observation"]:
-        if field in component_trace:
-            if (
-                isinstance(component_trace[field], dict)
-                and "traceId" in component_trace[field]
-            ):
-                return component_trace[field]["traceId"]
-
-    # Fall back to a generated ID
-    return f"generated-{time.time()}"
+        expected = "guardrail" if component_type.startswith("guardrail") else component_type
+        if event.component_type != expected:
+            logger.debug(f"Trace event is not a {component_type} trace")
+            if expected == "guardrail":
+                return f"guardrail-{time.time()}"
+            return f"generated-{time.time()}"
+    return event.trace_id
 
 
 def process_trace_event(trace_data: Dict[str, Any], parent_span):
@@ -304,112 +95,59 @@ def process_trace_event(trace_data: Dict[str, Any], parent_span):
         trace_data: The trace data received from Bedrock Agent
         parent_span: The parent span for this trace event
     """
-    from .handlers import handle_file_operations
-
     # print(f"Processing trace data: {trace_data}")
     # print parent_span if it exists
     if not parent_span:
         logger.info("No parent span provided")
 
-    # Capture receive time if not already present
-    if "received_timestamp" not in trace_data:
-        received_timestamp = time.time()
-        received_time_iso = (
-            datetime.fromtimestamp(received_timestamp, tz=timezone.utc)
-            .replace(tzinfo=None)
-            .isoformat()
-        )
-        trace_data["received_timestamp"] = received_timestamp
-        trace_data["received_time_iso"] = received_time_iso
-
-    if "files" in trace_data:
-        handle_file_operations(trace_data, parent_span)
-
-    # Log event time and receive time for debugging
-    if "eventTime" in trace_data:
-        event_time = trace_data["eventTime"]
-        if isinstance(event_time, datetime):
-            event_timestamp = event_time.timestamp()
-            logger.debug(
-                f"Event time: {event_time.isoformat()}, Received time: {trace_data['received_time_iso']}"
-            )
+    # Capture receive time if not already present (ISO formatting is deferred)
+    if "received_at" not in trace_data:
+        received_at = now()
+        trace_data["received_at"] = received_at
+        trace_data["received_timestamp"] = received_at.seconds
+
+    # Parse the event once; handlers reach it through context.trace_event()
+    ctx = current_invocation()
+    event = TraceEvent(trace_data)
+    previous_event, ctx.trace_event = ctx.trace_event, event
+    try:
+        if "files" in trace_data:
+            handle_file_operations(trace_data, parent_span)
+
+        # Log event time and receive time for debugging
+        if event.event_time is not None and logger.isEnabledFor(logging.DEBUG):
             logger.debug(
-                f"Event processing latency: {(trace_data['received_timestamp'] - event_timestamp) * 1000:.2f} ms"
+                f"Event time: {event.event_time.iso}, Received time: {event.received_at.iso}, "
+                f"latency: {event.received_at.ms_since(event.event_time, 2)} ms"
             )
 
-    # Determine the trace type
-    trace = trace_data.get("trace", {})
+        # Spans and timers created by the handlers use the event's step window
+        ctx.usage.add_event(event, ctx.model_id)
+        with ctx.event_clock.handling(event) as window:
+            if window is not None:
+                ctx.critical_path.add(event, window)
+            dispatcher.dispatch(event, parent_span)
+    finally:
+        ctx.trace_event = previous_event
 
-    # Handle guardrail traces first (exclusive handling)
-    if "guardrailTrace" in trace:
-        # Import here to avoid circular imports
-        from .handlers import (
-            handle_guardrail_pre,
-            handle_guardrail_post,
-            handle_guardrail_intervention,
-        )
 
-        # Handle guardrail trace
-        guardrail_trace = trace["guardrailTrace"]
-        trace_id = guardrail_trace.get("traceId", "")
-        action = guardrail_trace.get("action", "NONE")
-
-        if "pre" in trace_id:
-            # Pre-request guardrail
-            if action in ["BLOCKED", "INTERVENED"]:
-                # This is an actual guardrail intervention
-                handle_guardrail_intervention(trace_data, parent_span)
-            else:
-                # Standard pre-request guardrail
-                handle_guardrail_pre(trace_data, parent_span)
-        else:
-            # Post-response guardrail - buffer for later processing
-            # Extract base trace ID
-            base_trace_id = (
-                trace_id.split("-guardrail-post-")[0]
-                if "-guardrail-post-" in trace_id
-                else trace_id
-            )
+def _orchestration_trace(trace_data: Dict[str, Any], parent_span):
+    process_orchestration_trace(trace_data, parent_span, current_invocation().active_spans)
 
-            # Add to span manager's buffer
-            span_manager.add_guardrail_event(base_trace_id, trace_data)
 
-            # Also add to global buffer for backward compatibility
-            if base_trace_id not in guardrail_buffer:
-                guardrail_buffer[base_trace_id] = []
-
-            buffer_entry = {
-                "trace_data": trace_data,
-                "timestamp": trace_data["received_time_iso"],
-                "content": None,
-            }
-            guardrail_buffer[base_trace_id].append(buffer_entry)
+def _post_processing_trace(trace_data: Dict[str, Any], parent_span):
+    process_post_processing_trace(trace_data, parent_span, current_invocation().active_spans)
 
-    elif "preProcessingTrace" in trace:
-        # Import here to avoid circular imports
-        from .handlers import handle_preprocessing
 
-        # Handle preprocessing trace (always separate from guardrails)
-        handle_preprocessing(trace_data, parent_span)
-
-    elif "orchestrationTrace" in trace:
-        # Handle orchestration trace
-        from .processes import process_orchestration_trace
-
-        process_orchestration_trace(trace_data, parent_span, active_spans)
-
-    elif "postProcessingTrace" in trace:
-        # Handle post-processing trace
-        from .processes import process_post_processing_trace
-
-        process_post_processing_trace(trace_data, parent_span, active_spans)
-
-    elif "failureTrace" in trace:
-        # Import here to avoid circular imports
-        from .handlers import handle_failure
-
-        # Handle failure trace
-        handle_failure(trace_data, parent_span)
+# Built-in handlers; guardrail traces are handled exclusively (pre-request
+# spans or buffering of post-response assessments)
+dispatcher.register("guardrail", handle_guardrail_trace)
+dispatcher.register("preprocessing", handle_preprocessing)
+dispatcher.register("orchestration", _orchestration_trace)
+dispatcher.register("postprocessing", _post_processing_trace)
+dispatcher.register("failure", handle_failure)
+for _subtypes, _handler in ORCHESTRATION_HANDLERS:
+    dispatcher.register("orchestration", _handler, subtypes=_subtypes)
 
 
 def instrument_agent_invocation(func):
@@ -427,21 +165,38 @@ def instrument_agent_invocation(func):
         model_id = kwargs.pop("model_id", None)
         save_trace_logs = kwargs.pop("SAVE_TRACE_LOGS", False)
 
-        # Create tracer provider:
+        # Get the process-wide tracer provider (built on the first call only)
         create_tracer_provider()
 
-        # Import handlers and set tracer
-        from .handlers import set_tracer
-        set_tracer(tracer)
+        # Set the handlers' tracer (step spans follow the event clock)
+        set_tracer(step_tracer)
 
-        # Reset span manager for a clean start
-        span_manager.reset()
+        # Fresh per-invocation state, so concurrent invocations never share spans
+        ctx = InvocationContext(
+            root_attributes={
+                SpanAttributes.LLM_REQUEST_MODEL: model_id or "bedrock-agent-default",
+                "stream_mode": streaming,
+                "metadata.streaming": streaming,
+            }
+        )
+
+        # Record the raw event stream for offline replay if requested
+        if save_trace_logs:
+            ctx.capture = open_capture(
+                save_trace_logs,
+                agentId=agentId,
+                agentAliasId=agentAliasId,
+                sessionId=sessionId,
+                streaming=streaming,
+                model_id=model_id,
+            )
 
         # Get start time for the entire operation
-        start_timestamp, start_time_iso = get_time()
+        started_at = now()
+        start_timestamp, start_time_iso = started_at.seconds, started_at.iso
 
         # Start root span for agent invocation - this is the parent for all other spans
-        with tracer.start_as_current_span(
+        with ctx.activate(), tracer.start_as_current_span(
             name=f"Bedrock Agent: {agentId}",
             kind=SpanKind.CLIENT,
             attributes={
@@ -456,13 +211,19 @@ def instrument_agent_invocation(func):
                 "metadata.streaming": streaming,
                 SpanAttributes.LLM_SYSTEM: "aws.bedrock",
                 SpanAttributes.LLM_REQUEST_MODEL: model_id or "bedrock-agent-default",
-                SpanAttributes.LLM_PROMPTS: inputText,
                 SpanAttributes.SESSION_ID: sessionId,
                 SpanAttributes.SPAN_START_TIME: start_time_iso,
                 "invoke_started_timestamp": start_timestamp,
                 "invoke_started_time_iso": start_time_iso,
             },
+            # Streaming responses are consumed after we return, so the root
+            # span is ended explicitly once the stream has been drained
+            end_on_exit=False,
         ) as root_span:
+            ctx.root_span = root_span
+            # Through the encoder, not attributes=, so the cap and content store apply
+            set_prompt(root_span, inputText)
+            stream_handed_off = False
             try:
                 # Execute the original function (bedrock agent invocation)
                 response = func(
@@ -474,15 +235,13 @@ def instrument_agent_invocation(func):
                 )
 
                 # Record invoke complete time
-                invoke_complete_timestamp, invoke_complete_time_iso = get_time()
-                invoke_duration_ms = round(
-                    (invoke_complete_timestamp - start_timestamp) * 1000, 2
-                )
+                invoke_complete = now()
+                invoke_duration_ms = invoke_complete.ms_since(started_at, 2)
                 root_span.set_attribute(
-                    "invoke_complete_timestamp", invoke_complete_timestamp
+                    "invoke_complete_timestamp", invoke_complete.seconds
                 )
                 root_span.set_attribute(
-                    "invoke_complete_time_iso", invoke_complete_time_iso
+                    "invoke_complete_time_iso", invoke_complete.iso
                 )
                 root_span.set_attribute(
                     "invoke_duration_ms", invoke_duration_ms)
@@ -497,6 +256,7 @@ def instrument_agent_invocation(func):
                     from .streaming_wrapper import wrap_streaming_response
 
                     response = wrap_streaming_response(response, root_span)
+                    stream_handed_off = True
                     return response
 
                 # Non-streaming mode - Process all completion events in batch
@@ -506,13 +266,17 @@ def instrument_agent_invocation(func):
 
                 if isinstance(response, dict) and "completion" in response:
                     # Begin processing time
-                    processing_start_timestamp, processing_start_time_iso = get_time()
+                    processing_start = now()
                     root_span.set_attribute(
-                        "processing_start_time_iso", processing_start_time_iso
+                        "processing_start_time_iso", processing_start.iso
                     )
 
                     # Process all completion events
                     for event in response["completion"]:
+                        ctx.record_stream_event(is_chunk="chunk" in event)
+                        if ctx.capture is not None:
+                            ctx.capture.write_event(event)
+
                         # Process text chunks
                         if "chunk" in event:
                             chunk_data = event["chunk"]
@@ -527,48 +291,20 @@ def instrument_agent_invocation(func):
                         # Process trace events
                         elif "trace" in event:
                             # Capture the time when we received this trace
-                            trace_receive_timestamp, trace_receive_time_iso = get_time()
+                            trace_received_at = now()
 
                             trace_data = event["trace"]
                             # Store receive time in trace data
-                            trace_data["received_timestamp"] = trace_receive_timestamp
-                            trace_data["received_time_iso"] = trace_receive_time_iso
+                            trace_data["received_at"] = trace_received_at
+                            trace_data["received_timestamp"] = trace_received_at.seconds
 
                             # Track earliest and latest trace times for latency measurement
-                            if (
-                                all_traces_start_time is None
-                                or trace_receive_timestamp < all_traces_start_time
-                            ):
-                                all_traces_start_time = trace_receive_timestamp
-
-                            if (
-                                all_traces_end_time is None
-                                or trace_receive_timestamp > all_traces_end_time
-                            ):
-                                all_traces_end_time = trace_receive_timestamp
-
-                            # Extract event time if available
-                            event_time = trace_data.get("eventTime")
-                            if event_time and isinstance(event_time, datetime):
-                                logger.debug(
-                                    f"Trace event time: {event_time.isoformat()}, Received: {trace_receive_time_iso}"
-                                )
-                                logger.debug(
-                                    f"Latency: {(trace_receive_timestamp - event_time.timestamp()) * 1000:.2f} ms"
-                                )
+                            if all_traces_start_time is None:
+                                all_traces_start_time = trace_received_at
+                            all_traces_end_time = trace_received_at
 
-                            # Save trace logs if requested
                             if show_traces:
                                 logger.info(f"Trace event: {trace_data}")
-                            if save_trace_logs:
-                                try:
-                                    with open("trace_logs.json", "a") as f:
-                                        f.write(json.dumps(
-                                            trace_data, cls=DateTimeEncoder))
-                                        f.write("\n---\n")
-                                except Exception as e:
-                                    logger.error(
-                                        f"Failed to write trace logs: {str(e)}")
 
                             # Process trace events through our central processor
                             try:
@@ -580,14 +316,10 @@ def instrument_agent_invocation(func):
                                 )
 
                     # End processing time
-                    processing_end_timestamp, processing_end_time_iso = get_time()
-                    processing_duration_ms = round(
-                        (processing_end_timestamp -
-                         processing_start_timestamp) * 1000,
-                        2,
-                    )
+                    processing_end = now()
+                    processing_duration_ms = processing_end.ms_since(processing_start, 2)
                     root_span.set_attribute(
-                        "processing_end_time_iso", processing_end_time_iso
+                        "processing_end_time_iso", processing_end.iso
                     )
                     root_span.set_attribute(
                         "processing_duration_ms", processing_duration_ms
@@ -595,8 +327,8 @@ def instrument_agent_invocation(func):
 
                     # Calculate trace processing window
                     if all_traces_start_time and all_traces_end_time:
-                        traces_window_ms = round(
-                            (all_traces_end_time - all_traces_start_time) * 1000, 2
+                        traces_window_ms = all_traces_end_time.ms_since(
+                            all_traces_start_time, 2
                         )
                         root_span.set_attribute(
                             "traces_window_ms", traces_window_ms)
@@ -604,21 +336,20 @@ def instrument_agent_invocation(func):
                 # Add the extracted completion to the response
                 response["extracted_completion"] = extracted_completion
                 if extracted_completion:
-                    root_span.set_attribute(
-                        SpanAttributes.LLM_COMPLETIONS, extracted_completion
+                    set_attribute(
+                        root_span, SpanAttributes.LLM_COMPLETIONS, extracted_completion
                     )
 
                 # Process any buffered guardrails
-                from .handlers import process_guardrail_buffer
-                process_guardrail_buffer(guardrail_buffer, root_span)
+                process_guardrail_buffer(ctx.guardrail_buffer, root_span)
 
                 # End all spans
-                span_manager.reset()
+                ctx.close()
 
                 # Set success status and end time - don't overwrite SPAN_START_TIME
-                end_timestamp, end_time_iso = get_time()
-                duration_ms = round(
-                    (end_timestamp - start_timestamp) * 1000, 2)
+                ended_at = now()
+                end_timestamp, end_time_iso = ended_at.seconds, ended_at.iso
+                duration_ms = ended_at.ms_since(started_at, 2)
 
                 # Set final metrics on root span
                 root_span.set_attribute("duration_ms", duration_ms)
@@ -636,14 +367,18 @@ def instrument_agent_invocation(func):
                 root_span.set_attribute("error.message", str(e))
                 root_span.set_attribute("error.type", e.__class__.__name__)
                 root_span.set_status(Status(StatusCode.ERROR))
+                ctx.close()
                 logger.error(
                     f"Error during agent invocation: {str(e)}", exc_info=True)
                 return {"error": str(e), "exception": str(e)}
+            finally:
+                if not stream_handed_off:
+                    ctx.end_root_span(root_span)
 
     return wrapper
 
 
-def flush_telemetry():
-    """Force flush OpenTelemetry data to ensure exports complete."""
+def flush_telemetry(blocking: bool = False, timeout_millis: int = 30000):
+    """Flush OpenTelemetry data; see core.tracing.flush_telemetry."""
     from .tracing import flush_telemetry as flush
-    flush()
+    flush(blocking=blocking, timeout_millis=timeout_millis)
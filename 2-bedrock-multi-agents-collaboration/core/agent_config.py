@@ -0,0 +1,157 @@
+"""
+Cached, hot-reloadable agent configuration.
+
+An agent config file (``config.json``, ``config-peak.json``, ...) is parsed and
+validated once into an immutable ``AgentConfig`` snapshot. Each request only
+reads the current snapshot; the file's mtime and size are checked at most
+once per ``BEDROCK_AGENT_CONFIG_CHECK_INTERVAL`` seconds (default 1.0) and a
+changed file is reloaded and swapped in atomically. A file that fails to
+parse or validate is logged and the previous snapshot stays in use.
+
+    config = get_agent_config()                 # the active config file
+    peak = get_agent_config("config-peak.json")
+    use_agent_config("config-peak.json")        # switch without a restart
+
+The active file defaults to ``BEDROCK_AGENT_CONFIG`` or ``config.json``.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, NamedTuple, Optional, Tuple
+
+# Initialize logging
+logger = logging.getLogger(__name__)
+
+REQUIRED_KEYS = (("agent", "agentId"), ("agent", "agentAliasId"))
+
+
+def _freeze(value: Any) -> Any:
+    """Read-only view of parsed JSON, so a snapshot cannot be changed in place"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class AgentConfig(NamedTuple):
+    """Immutable snapshot of one agent config file"""
+    path: str
+    agent_id: str
+    agent_alias_id: str
+    user_id: str
+    model_id: Optional[str]
+    project_name: Optional[str]
+    environment: Optional[str]
+    langfuse_public_key: Optional[str]
+    langfuse_secret_key: Optional[str]
+    langfuse_api_url: Optional[str]
+    question: Optional[str]
+    raw: Mapping[str, Any]
+    version: Tuple[int, int]  # (mtime_ns, size) of the file that was loaded
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], path: str = "",
+                  version: Tuple[int, int] = (0, 0)) -> "AgentConfig":
+        """Validate a parsed config file and build its snapshot"""
+        if not isinstance(data, dict):
+            raise ValueError(f"{path}: expected a JSON object")
+        missing = [".".join(keys) for keys in REQUIRED_KEYS
+                   if not isinstance(data.get(keys[0]), dict) or not data[keys[0]].get(keys[1])]
+        if missing:
+            raise ValueError(f"{path}: missing required keys {', '.join(missing)}")
+
+        agent = data["agent"]
+        user = data.get("user") or {}
+        langfuse = data.get("langfuse") or {}
+
+        return cls(
+            path=path,
+            agent_id=agent["agentId"],
+            agent_alias_id=agent["agentAliasId"],
+            user_id=user.get("userId", "anonymous"),
+            model_id=user.get("agent_model_id"),
+            project_name=langfuse.get("project_name"),
+            environment=langfuse.get("environment"),
+            langfuse_public_key=langfuse.get("langfuse_public_key"),
+            langfuse_secret_key=langfuse.get("langfuse_secret_key"),
+            langfuse_api_url=langfuse.get("langfuse_api_url"),
+            question=(data.get("question") or {}).get("question"),
+            raw=_freeze(data),
+            version=version,
+        )
+
+
+class AgentConfigStore:
+    """Holds the current snapshot of one config file and reloads it on change"""
+
+    def __init__(self, path: str, check_interval: Optional[float] = None):
+        self.path = path
+        self.check_interval = check_interval if check_interval is not None else float(
+            os.environ.get("BEDROCK_AGENT_CONFIG_CHECK_INTERVAL", 1.0))
+        self._lock = threading.Lock()
+        self._snapshot: Optional[AgentConfig] = None
+        self._seen_version: Optional[Tuple[int, int]] = None
+        self._next_check = 0.0
+
+    def get(self) -> AgentConfig:
+        """Return the current snapshot, reloading it if the file changed"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() < self._next_check:
+            return snapshot
+        return self.reload()
+
+    def reload(self, force: bool = False) -> AgentConfig:
+        """Check the file now and load it if it changed (or if force is set)"""
+        with self._lock:
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                stat = os.stat(self.path)
+                version = (stat.st_mtime_ns, stat.st_size)
+                if force or version != self._seen_version:
+                    self._seen_version = version
+                    self._snapshot = self._load(version)
+                    logger.info(f"Loaded agent config {self.path}")
+            except (OSError, ValueError) as e:
+                if self._snapshot is None:
+                    raise
+                # Keep serving the last good snapshot (e.g. the file is being written)
+                logger.warning(f"Keeping previous agent config, could not reload "
+                               f"{self.path}: {e}")
+            return self._snapshot
+
+    def _load(self, version: Tuple[int, int]) -> AgentConfig:
+        with open(self.path, "r") as config_file:
+            data = json.load(config_file)
+        return AgentConfig.from_dict(data, path=self.path, version=version)
+
+
+_stores: Dict[str, AgentConfigStore] = {}
+_stores_lock = threading.Lock()
+_active_path = os.environ.get("BEDROCK_AGENT_CONFIG", "config.json")
+
+
+def config_store(path: str) -> AgentConfigStore:
+    """Return the shared store for a config file"""
+    store = _stores.get(path)
+    if store is None:
+        with _stores_lock:
+            store = _stores.setdefault(path, AgentConfigStore(path))
+    return store
+
+
+def get_agent_config(path: Optional[str] = None) -> AgentConfig:
+    """Return the current snapshot of a config file (default: the active one)"""
+    return config_store(path or _active_path).get()
+
+
+def use_agent_config(path: str) -> AgentConfig:
+    """Make another config file the active one; it is validated first"""
+    global _active_path
+    snapshot = config_store(path).get()
+    _active_path = path
+    return snapshot
@@ -0,0 +1,162 @@
+"""
+Size-capped, lazily encoded span attributes.
+
+Prompts, completions and JSON payloads from the agent trace can be many KB
+each and are copied onto several spans. Values set through this module are
+only encoded when the span is actually recording (sampled), and are capped by
+a per-value limit and a per-span byte budget. Oversized values are truncated
+(or replaced entirely) and tagged with the SHA-256 of the full value, so the
+original can still be correlated with other copies. Large values repeated
+across spans can instead be stored once by hash (see ``core/content.py``);
+the copy kept in full by the content store is not shortened.
+
+Limits are read from the environment and can be changed at runtime with
+``configure_attribute_limits``:
+
+    BEDROCK_AGENT_ATTR_MAX_VALUE_BYTES    largest single value (default 16384)
+    BEDROCK_AGENT_ATTR_SPAN_BUDGET_BYTES  total string bytes per span (default 131072)
+    BEDROCK_AGENT_ATTR_OVERFLOW           "truncate" (keep a prefix) or "hash"
+"""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from . import content
+from .constants import SpanAttributes
+from .context import current_invocation
+
+# Initialize logging
+logger = logging.getLogger(__name__)
+
+_PRIMITIVES = (str, bool, int, float)
+
+
+class AttributeOverflow:
+    """How to shorten a value that does not fit"""
+    TRUNCATE = "truncate"
+    HASH = "hash"
+
+    ALL = (TRUNCATE, HASH)
+
+
+class AttributeLimits:
+    """Per-value and per-span size limits for string attributes"""
+
+    def __init__(
+        self,
+        max_value_bytes: Optional[int] = None,
+        span_budget_bytes: Optional[int] = None,
+        overflow: Optional[str] = None,
+    ):
+        self.max_value_bytes = max_value_bytes or int(
+            os.environ.get("BEDROCK_AGENT_ATTR_MAX_VALUE_BYTES", 16384))
+        self.span_budget_bytes = span_budget_bytes or int(
+            os.environ.get("BEDROCK_AGENT_ATTR_SPAN_BUDGET_BYTES", 131072))
+        self.overflow = overflow or os.environ.get(
+            "BEDROCK_AGENT_ATTR_OVERFLOW", AttributeOverflow.TRUNCATE)
+        if self.overflow not in AttributeOverflow.ALL:
+            raise ValueError(
+                f"Unknown attribute overflow mode {self.overflow!r}, "
+                f"expected one of {AttributeOverflow.ALL}"
+            )
+
+
+# Process-wide limits, replaced by configure_attribute_limits()
+limits = AttributeLimits()
+
+
+def configure_attribute_limits(**kwargs) -> AttributeLimits:
+    """Replace the process-wide attribute limits"""
+    global limits
+    limits = AttributeLimits(**kwargs)
+    return limits
+
+
+def encode_value(value: Any) -> Any:
+    """Convert a value to an OpenTelemetry attribute type, JSON-encoding structures"""
+    if isinstance(value, _PRIMITIVES):
+        return value
+    if isinstance(value, (list, tuple)) and all(
+        isinstance(item, _PRIMITIVES) for item in value
+    ):
+        return value
+    return json.dumps(value, default=str)
+
+
+def _byte_length(value: str) -> int:
+    return len(value) if value.isascii() else len(value.encode("utf-8"))
+
+
+def _shorten(value: str, size: int, allowed: int, overflow: str) -> str:
+    """Fit ``value`` (``size`` bytes) into ``allowed`` bytes"""
+    digest = hashlib.sha256(value.encode("utf-8")).hexdigest()
+    marker = f"...[truncated {size} bytes sha256:{digest}]"
+    if overflow == AttributeOverflow.HASH or allowed <= len(marker):
+        return f"[omitted {size} bytes sha256:{digest}]"
+    prefix = value.encode("utf-8")[: allowed - len(marker)]
+    return prefix.decode("utf-8", errors="ignore") + marker
+
+
+def set_attribute(span, key: str, value: Any) -> None:
+    """Set an attribute, encoding and size-capping it only if the span is recording"""
+    if span is None or value is None or not span.is_recording():
+        return
+
+    value = encode_value(value)
+    if isinstance(value, str):
+        kept = False
+        if content.store.enabled:
+            size = _byte_length(value)
+            if size >= content.store.min_bytes:
+                value, kept = content.store.store(span, key, value, size)
+        # The one full copy of a stored text is what its references point to
+        value = _fit_to_budget(span, key, value, shorten=not kept)
+    span.set_attribute(key, value)
+
+
+def set_prompt(span, value: Any) -> None:
+    """Set the prompt of ``span``, keeping the original for prompt_of"""
+    if span is None or value is None or not span.is_recording():
+        return
+    current_invocation().prompts[span.get_span_context().span_id] = value
+    set_attribute(span, SpanAttributes.LLM_PROMPTS, value)
+
+
+def prompt_of(span, default: Any = "") -> Any:
+    """The prompt set on ``span`` with set_prompt, as it was before encoding,
+    capping or content-store references"""
+    if span is None:
+        return default
+    return current_invocation().prompts.get(span.get_span_context().span_id, default)
+
+
+def set_attributes(span, attributes: Dict[str, Any]) -> None:
+    """Set several attributes through set_attribute"""
+    if span is None or not span.is_recording():
+        return
+    for key, value in attributes.items():
+        set_attribute(span, key, value)
+
+
+def _fit_to_budget(span, key: str, value: str, shorten: bool = True) -> str:
+    """Account ``value`` against the span budget, shortening it if needed
+    (and allowed)"""
+    usage = current_invocation().attribute_usage.setdefault(
+        span.get_span_context().span_id, {"__total__": 0}
+    )
+    previous = usage.get(key, 0)
+    remaining = limits.span_budget_bytes - usage["__total__"] + previous
+
+    size = _byte_length(value)
+    allowed = min(limits.max_value_bytes, remaining)
+    if shorten and size > allowed:
+        value = _shorten(value, size, max(allowed, 0), limits.overflow)
+        logger.debug(f"Attribute {key} shortened from {size} bytes")
+        size = _byte_length(value)
+
+    usage[key] = size
+    usage["__total__"] += size - previous
+    return value
@@ -0,0 +1,317 @@
+"""
+Offline bulk processing of captured Bedrock Agent traces.
+
+Rebuilds spans and latency/token statistics from trace logs recorded with
+``SAVE_TRACE_LOGS`` (see core/capture.py), without invoking the agent. Every
+recorded invocation is one task for a process pool; each worker runs it
+through the same instrumentation as a live call and appends the spans to its
+own file exporter shard.
+
+    python -m core.bulk captures/ --out backfill/ --workers 8
+
+Writes to the output directory:
+
+    spans-<pid>.jsonl    spans per worker (--format protobuf: spans-<pid>.pb)
+    invocations.jsonl    one summary per invocation: spans, duration, time per
+                         step, critical path, tokens and cost per model
+    summary.json         totals with count/mean/p50/p95/max per step
+
+Rotated segments of a trace log (``trace_logs.jsonl.<stamp>.gz``) are read
+together with the active file, so invocations split by a rotation are
+processed whole. Finished invocations go to the workers as soon as they are
+read; only those still open at the end of a segment wait for the next one.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from array import array
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from .capture import Capture, iter_captures
+from .constants import SpanAttributes, SpanKindValues
+from .exporters import FileFormat, FileSpanExporter
+from .pricing import compute_cost
+
+# Initialize logging
+logger = logging.getLogger(__name__)
+
+# Per-worker state, set up by _init_worker
+_worker: Dict[str, Any] = {}
+
+
+def find_trace_logs(paths: Iterable[str]) -> List[List[str]]:
+    """Group trace log files by log, oldest rotated segment first"""
+    families: Dict[str, List[str]] = defaultdict(list)
+    for path in paths:
+        if os.path.isdir(path):
+            files = [os.path.join(root, name)
+                     for root, _, names in os.walk(path) for name in names]
+        else:
+            files = [path]
+        for file in files:
+            name = os.path.basename(file)
+            if ".jsonl" in name:
+                families[file[:file.rindex(".jsonl") + len(".jsonl")]].append(file)
+            elif name.endswith(".json"):
+                families[file].append(file)
+    # Rotated segments sort by their timestamp; the active file comes last
+    return [sorted(files, key=lambda file: (file == base, file))
+            for base, files in sorted(families.items())]
+
+
+def iter_invocations(family: List[str]) -> Iterator[Capture]:
+    """Yield the invocations of one trace log, merged across its segments.
+
+    Complete captures are yielded as soon as they are read; only the ones
+    still open at the end of a segment are held until the next segment
+    shows whether they continue there.
+    """
+    # Open captures of the previous segment, by capture_id
+    pending: Dict[Any, Capture] = {}
+    for path in family:
+        still_open: Dict[Any, Capture] = {}
+        try:
+            for capture in iter_captures(path):
+                key = capture.header.get("capture_id") or id(capture)
+                existing = pending.pop(key, None)
+                if existing is None:
+                    capture.header.setdefault("source", path)
+                else:
+                    if "format" in capture.header:
+                        existing.header = {**capture.header, **existing.header}
+                    existing.events.extend(capture.events)
+                    existing.offsets_ms.extend(capture.offsets_ms)
+                    existing.complete = capture.complete
+                    capture = existing
+                if capture.complete:
+                    yield capture
+                else:
+                    still_open[key] = capture
+        except Exception as e:
+            logger.warning(f"Skipping {path}: {e}")
+        # Open captures not continued in this segment will not get more events
+        yield from pending.values()
+        pending = still_open
+    yield from pending.values()
+
+
+def _init_worker(out_dir: str, file_format: str):
+    # Handlers print diagnostics for every event; keep worker output quiet
+    sys.stdout = open(os.devnull, "w")
+    logging.getLogger("core").setLevel(logging.ERROR)
+    logging.getLogger("opentelemetry").setLevel(logging.ERROR)
+
+    from .agent import instrument_agent_invocation
+    from .configuration import reconfigure_tracer_provider
+
+    memory = InMemorySpanExporter()
+    reconfigure_tracer_provider(span_processor=SimpleSpanProcessor(memory))
+
+    @instrument_agent_invocation
+    def invoke(inputText, agentId, agentAliasId, sessionId, **kwargs):
+        # Each task gets its own unpickled capture, so no need to copy events
+        return kwargs["capture"].response(copy=False)
+
+    suffix = "pb" if file_format == FileFormat.PROTOBUF else "jsonl"
+    _worker.update(
+        memory=memory,
+        invoke=invoke,
+        spans=FileSpanExporter(os.path.join(out_dir, f"spans-{os.getpid()}.{suffix}"), file_format),
+    )
+
+
+def _process(capture: Capture) -> Dict[str, Any]:
+    header = capture.header
+    started = time.perf_counter()
+    _worker["invoke"](
+        inputText=header.get("inputText", "replay"),
+        agentId=header.get("agentId", "REPLAY"),
+        agentAliasId=header.get("agentAliasId", "REPLAY"),
+        sessionId=header.get("sessionId", "replay-session"),
+        model_id=header.get("model_id"),
+        capture=capture,
+    )
+    memory = _worker["memory"]
+    spans = memory.get_finished_spans()
+    memory.clear()
+    # Workers may exit without running finalizers; write through per task
+    _worker["spans"].export(spans)
+    _worker["spans"].force_flush()
+
+    summary = summarize(capture, spans)
+    summary["processing_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return summary
+
+
+def summarize(capture: Capture, spans) -> Dict[str, Any]:
+    """Duration, time per step and tokens per model of one invocation"""
+    header = capture.header
+    steps: Dict[str, Dict[str, float]] = {}
+    tokens: Dict[str, Dict[str, int]] = {}
+    cost_usd = 0.0
+    duration_ms = None
+    critical_path: Dict[str, Any] = {}
+    for span in spans:
+        attributes = span.attributes or {}
+        span_ms = (span.end_time - span.start_time) / 1_000_000
+        if attributes.get("gen_ai.operation.name") == SpanKindValues.AGENT and "agent.id" in attributes:
+            duration_ms = span_ms
+            critical_path = {
+                key[len("critical_path."):]: value
+                for key, value in attributes.items() if key.startswith("critical_path.")
+            }
+            continue
+        part = attributes.get("trace.part")
+        step = steps.setdefault(f"{part}/{span.name}" if part else span.name,
+                                {"count": 0, "ms": 0.0})
+        step["count"] += 1
+        step["ms"] = round(step["ms"] + span_ms, 3)
+        if span.name == "llm" and SpanAttributes.LLM_USAGE_PROMPT_TOKENS in attributes:
+            model = attributes.get(SpanAttributes.LLM_REQUEST_MODEL) or "unknown"
+            input_tokens = int(attributes.get(SpanAttributes.LLM_USAGE_PROMPT_TOKENS) or 0)
+            output_tokens = int(attributes.get(SpanAttributes.LLM_USAGE_COMPLETION_TOKENS) or 0)
+            usage = tokens.setdefault(model, {"input": 0, "output": 0})
+            usage["input"] += input_tokens
+            usage["output"] += output_tokens
+            cost_usd += compute_cost(model, input_tokens, output_tokens) or 0.0
+    return {
+        "capture_id": header.get("capture_id"),
+        "source": header.get("source"),
+        "agent_id": header.get("agentId"),
+        "session_id": header.get("sessionId"),
+        "events": len(capture.events),
+        "spans": len(spans),
+        # Receive offset of the last event: the original stream duration
+        "stream_ms": capture.offsets_ms[-1] if capture.offsets_ms else None,
+        "duration_ms": round(duration_ms, 3) if duration_ms is not None else None,
+        "steps": steps,
+        "critical_path": critical_path,
+        "tokens": tokens,
+        "cost_usd": round(cost_usd, 8),
+    }
+
+
+def _percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+class SummaryAggregator:
+    """Totals over all invocation summaries"""
+
+    def __init__(self):
+        self.invocations = 0
+        self.spans = 0
+        self.events = 0
+        self.cost_usd = 0.0
+        self.step_ms: Dict[str, array] = defaultdict(lambda: array("d"))
+        self.step_counts: Dict[str, int] = defaultdict(int)
+        self.tokens: Dict[str, Dict[str, int]] = defaultdict(lambda: {"input": 0, "output": 0})
+        self.stream_ms = array("d")
+        self.slowest_steps: Dict[str, int] = defaultdict(int)
+
+    def add(self, summary: Dict[str, Any]):
+        self.invocations += 1
+        self.spans += summary["spans"]
+        self.events += summary["events"]
+        self.cost_usd += summary["cost_usd"]
+        if summary["stream_ms"] is not None:
+            self.stream_ms.append(summary["stream_ms"])
+        slowest = summary["critical_path"].get("slowest_step")
+        if slowest is not None:
+            self.slowest_steps[slowest] += 1
+        for name, step in summary["steps"].items():
+            self.step_counts[name] += step["count"]
+            self.step_ms[name].append(step["ms"])
+        for model, usage in summary["tokens"].items():
+            self.tokens[model]["input"] += usage["input"]
+            self.tokens[model]["output"] += usage["output"]
+
+    @staticmethod
+    def _stats(values) -> Dict[str, float]:
+        if not values:
+            return {}
+        return {
+            "mean_ms": round(sum(values) / len(values), 3),
+            "p50_ms": round(_percentile(values, 0.50), 3),
+            "p95_ms": round(_percentile(values, 0.95), 3),
+            "max_ms": round(max(values), 3),
+        }
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            "invocations": self.invocations,
+            "events": self.events,
+            "spans": self.spans,
+            "cost_usd": round(self.cost_usd, 6),
+            "stream": self._stats(self.stream_ms),
+            # Per invocation time in each step (all occurrences summed)
+            "steps": {
+                name: {"count": self.step_counts[name], **self._stats(values)}
+                for name, values in sorted(self.step_ms.items())
+            },
+            # Invocations per kind of step that was their slowest
+            "slowest_steps": dict(self.slowest_steps),
+            "tokens": dict(self.tokens),
+        }
+
+
+def process_trace_logs(
+    paths: Iterable[str],
+    out_dir: str,
+    workers: Optional[int] = None,
+    file_format: str = FileFormat.JSONL,
+    chunksize: int = 4,
+) -> Dict[str, Any]:
+    """Run every captured invocation through the instrumentation in a process pool"""
+    os.makedirs(out_dir, exist_ok=True)
+    families = find_trace_logs(paths)
+    invocations = (capture for family in families for capture in iter_invocations(family))
+    aggregator = SummaryAggregator()
+    started = time.perf_counter()
+
+    # spawn: workers must not inherit the parent's exporter threads and locks
+    context = multiprocessing.get_context("spawn")
+    with open(os.path.join(out_dir, "invocations.jsonl"), "w") as per_invocation, \
+            context.Pool(workers or os.cpu_count(), initializer=_init_worker,
+                         initargs=(out_dir, file_format)) as pool:
+        for summary in pool.imap_unordered(_process, invocations, chunksize=chunksize):
+            per_invocation.write(json.dumps(summary) + "\n")
+            aggregator.add(summary)
+
+    result = aggregator.result()
+    result["files"] = sum(len(family) for family in families)
+    result["elapsed_s"] = round(time.perf_counter() - started, 3)
+    with open(os.path.join(out_dir, "summary.json"), "w") as f:
+        json.dump(result, f, indent=2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="trace log files or directories")
+    parser.add_argument("--out", default="bulk_output", help="output directory")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPUs)")
+    parser.add_argument("--format", choices=FileFormat.ALL, default=FileFormat.JSONL,
+                        help="span file format")
+    parser.add_argument("--chunksize", type=int, default=4,
+                        help="invocations sent to a worker at a time")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = process_trace_logs(args.paths, args.out, args.workers, args.format, args.chunksize)
+    print(f"{result['invocations']} invocations from {result['files']} files, "
+          f"{result['spans']} spans in {result['elapsed_s']} s -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
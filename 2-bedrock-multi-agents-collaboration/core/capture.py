@@ -0,0 +1,256 @@
+"""
+Capture and replay of Bedrock Agent event streams.
+
+A capture is a JSON Lines file. The first line is a header describing the
+invocation, every following line is one event from ``response["completion"]``
+together with the time it was received, relative to the start of the stream:
+
+    {"format": "bedrock-agent-capture", "version": 1, "agentId": "...", ...}
+    {"offset_ms": 12.5, "event": {"trace": {...}}}
+    {"offset_ms": 80.1, "event": {"chunk": {"bytes": {"__bytes__": "SGVsbG8="}}}}
+    {"offset_ms": 95.0, "end": true}
+
+The ``end`` record is written when the invocation finishes, so readers know
+a capture is complete without reading the rest of the log.
+
+Values JSON cannot represent are tagged: ``bytes`` as base64 under
+``__bytes__`` and ``datetime`` as ISO 8601 under ``__datetime__``, so replayed
+events have the same types as the ones boto3 returned.
+
+Records are written by the background trace log sink (core/trace_log.py),
+so lines of concurrent invocations can interleave; every record carries the
+``capture_id`` of its invocation. Rotated ``.gz``/``.zst`` segments are read
+transparently, and ``read_capture`` also accepts the older
+``trace_logs.json`` files (trace events separated by ``---`` lines).
+"""
+
+import base64
+import gzip
+import io
+import itertools
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional
+
+from .trace_log import TraceLogSink, get_trace_log_sink, zstandard
+
+# Initialize logging
+logger = logging.getLogger(__name__)
+
+CAPTURE_FORMAT = "bedrock-agent-capture"
+CAPTURE_VERSION = 1
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    return str(value)
+
+
+def encode_record(record: Dict[str, Any]) -> str:
+    """Serialize a capture record to one JSON line"""
+    return json.dumps(record, default=_json_default)
+
+
+def _decode_hook(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1:
+        if "__bytes__" in obj:
+            return base64.b64decode(obj["__bytes__"])
+        if "__datetime__" in obj:
+            return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+def decode_event(line: str) -> Dict[str, Any]:
+    """Parse one capture line back into a record with the original types"""
+    return json.loads(line, object_hook=_decode_hook)
+
+
+class CaptureWriter:
+    """Record the events of one invocation through a background trace log sink.
+
+    The caller only makes a shallow copy of each event (handlers annotate the
+    trace dict afterwards); serialization and file I/O run on the sink's worker.
+    """
+
+    def __init__(self, path: str, sink: Optional[TraceLogSink] = None, **header):
+        self.path = path
+        self.capture_id = uuid.uuid4().hex
+        self._sink = sink or get_trace_log_sink(path, encoder=encode_record)
+        self._started = time.perf_counter()
+        self._sink.write({
+            "format": CAPTURE_FORMAT,
+            "version": CAPTURE_VERSION,
+            "capture_id": self.capture_id,
+            "captured_at": datetime.now().isoformat(),
+            **header,
+        })
+
+    def write_event(self, event: Dict[str, Any]):
+        """Record an event with its receive offset"""
+        offset_ms = round((time.perf_counter() - self._started) * 1000, 3)
+        if "trace" in event:
+            event = {**event, "trace": dict(event["trace"])}
+        self._sink.write({
+            "capture_id": self.capture_id,
+            "offset_ms": offset_ms,
+            "event": event,
+        })
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Wait until everything recorded so far is on disk"""
+        return self._sink.flush(timeout)
+
+    def close(self):
+        """Finish this capture; the shared sink stays open for other invocations"""
+        self._sink.write({
+            "capture_id": self.capture_id,
+            "offset_ms": round((time.perf_counter() - self._started) * 1000, 3),
+            "end": True,
+        })
+
+
+class Capture:
+    """A recorded event stream"""
+
+    def __init__(self, header: Dict[str, Any], events: List[Dict[str, Any]],
+                 offsets_ms: List[float], complete: bool = False):
+        self.header = header
+        self.events = events
+        self.offsets_ms = offsets_ms
+        # Whether the end record was read; captures without one may continue
+        # in the next segment of a rotated log
+        self.complete = complete
+
+    def __len__(self):
+        return len(self.events)
+
+    @property
+    def trace_event_count(self) -> int:
+        return sum(1 for event in self.events if "trace" in event)
+
+    def response(self, copy: bool = True) -> Dict[str, Any]:
+        """A response dict shaped like ``invoke_agent``'s, replaying the events.
+
+        Handlers annotate the trace dicts they are given, so by default every
+        call replays fresh copies of the recorded events.
+        """
+        events = decode_event(encode_record(self.events)) if copy else self.events
+        return {"completion": iter(events), "contentType": "application/json"}
+
+
+def _read_legacy(lines: Iterable[str]) -> List[Capture]:
+    """Parse a ``---``-separated trace_logs.json into a single capture"""
+    events = []
+    block: List[str] = []
+    for line in itertools.chain(lines, ["---"]):
+        if line.strip() != "---":
+            block.append(line)
+            continue
+        text = "".join(block).strip()
+        block = []
+        if not text:
+            continue
+        trace_data = json.loads(text)
+        if isinstance(trace_data.get("eventTime"), str):
+            trace_data["eventTime"] = datetime.fromisoformat(trace_data["eventTime"])
+        events.append({"trace": trace_data})
+    header = {"format": "trace_logs", "version": 0}
+    return [Capture(header, events, [0.0] * len(events))]
+
+
+@contextmanager
+def _open_text(path: str) -> Iterator[IO[str]]:
+    """Open a (possibly compressed) log for reading line by line"""
+    if path.endswith(".gz"):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            yield f
+    elif path.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError("Reading .zst trace logs requires the zstandard package")
+        with open(path, "rb") as raw:
+            reader = zstandard.ZstdDecompressor().stream_reader(raw)
+            with io.TextIOWrapper(reader, encoding="utf-8") as f:
+                yield f
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            yield f
+
+
+def iter_captures(path: str) -> Iterator[Capture]:
+    """Yield every invocation recorded in a capture file.
+
+    The file is read line by line: captures are yielded as their end record
+    is read, and the ones without an end record (unfinished, or continued in
+    a later segment) at the end of the file, in header order. Only the open
+    invocations are held in memory.
+    """
+    with _open_text(path) as f:
+        first_line = ""
+        for first_line in f:
+            if first_line.strip():
+                break
+        lines = itertools.chain([first_line], f)
+        try:
+            first = json.loads(first_line)
+        except ValueError:
+            first = None
+        if not isinstance(first, dict) or not ("format" in first or "capture_id" in first):
+            yield from _read_legacy(lines)
+            return
+
+        captures: Dict[Any, Capture] = {}
+        current = None
+        for line in lines:
+            if not line.strip():
+                continue
+            record = decode_event(line)
+            capture_id = record.get("capture_id")
+            if record.get("format") == CAPTURE_FORMAT:
+                current = Capture(record, [], [])
+                captures[capture_id if capture_id is not None else id(current)] = current
+                continue
+            if capture_id is None:
+                # Records without an id belong to the most recent header
+                capture = current
+            elif capture_id not in captures:
+                # The header went to an earlier, rotated segment
+                capture = captures[capture_id] = Capture({"capture_id": capture_id}, [], [])
+            else:
+                capture = captures[capture_id]
+            if capture is None:
+                continue
+            if record.get("end"):
+                capture.complete = True
+                if capture_id is not None:
+                    yield captures.pop(capture_id)
+                continue
+            capture.events.append(record["event"])
+            capture.offsets_ms.append(record.get("offset_ms", 0.0))
+    yield from captures.values()
+
+
+def read_capture(path: str) -> List[Capture]:
+    """Read all invocations from a capture (or legacy trace_logs.json) file"""
+    return list(iter_captures(path))
+
+
+def write_capture(path: str, events: Iterable[Dict[str, Any]], **header) -> int:
+    """Write a complete event stream as one capture, returning the event count"""
+    writer = CaptureWriter(path, **header)
+    count = 0
+    for event in events:
+        writer.write_event(event)
+        count += 1
+    writer.close()
+    writer.flush()
+    return count
+
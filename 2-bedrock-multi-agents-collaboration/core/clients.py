@@ -0,0 +1,158 @@
+"""
+Shared, pooled AWS service clients.
+
+Creating a boto3 client resolves credentials and endpoints and loads the
+service model, and every new client starts with an empty connection pool, so
+creating one per request adds a credential lookup and a fresh TCP/TLS
+handshake to each agent invocation. ``get_client`` creates one client per
+(service, region) and reuses it; boto3 clients are thread-safe once created,
+so concurrent requests (and fan-out) share its connection pool.
+
+Client settings are read from the environment and can be changed at runtime
+with ``configure_clients``:
+
+    BEDROCK_AGENT_MAX_POOL_CONNECTIONS  connections kept per client (default 50)
+    BEDROCK_AGENT_TCP_KEEPALIVE         enable TCP keep-alive probes (default true)
+    BEDROCK_AGENT_RETRY_MODE            "legacy", "standard" or "adaptive" (default standard)
+    BEDROCK_AGENT_MAX_ATTEMPTS          attempts including the first (default 3)
+    BEDROCK_AGENT_READ_TIMEOUT          seconds to wait for response data (default 60)
+    BEDROCK_AGENT_PREWARM_CLIENTS       services to create at startup, comma separated
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+
+# Initialize logging
+logger = logging.getLogger(__name__)
+
+RETRY_MODES = ("legacy", "standard", "adaptive")
+
+_TRUE = ("1", "true", "yes", "on")
+
+
+class ClientSettings:
+    """Connection pool, keep-alive and retry settings for shared clients"""
+
+    def __init__(
+        self,
+        max_pool_connections: Optional[int] = None,
+        tcp_keepalive: Optional[bool] = None,
+        retry_mode: Optional[str] = None,
+        max_attempts: Optional[int] = None,
+        read_timeout: Optional[float] = None,
+    ):
+        self.max_pool_connections = max_pool_connections or int(
+            os.environ.get("BEDROCK_AGENT_MAX_POOL_CONNECTIONS", 50))
+        self.tcp_keepalive = tcp_keepalive if tcp_keepalive is not None else (
+            os.environ.get("BEDROCK_AGENT_TCP_KEEPALIVE", "true").lower() in _TRUE)
+        self.retry_mode = retry_mode or os.environ.get("BEDROCK_AGENT_RETRY_MODE", "standard")
+        self.max_attempts = max_attempts or int(
+            os.environ.get("BEDROCK_AGENT_MAX_ATTEMPTS", 3))
+        self.read_timeout = read_timeout or float(
+            os.environ.get("BEDROCK_AGENT_READ_TIMEOUT", 60))
+        if self.retry_mode not in RETRY_MODES:
+            raise ValueError(
+                f"Unknown retry mode {self.retry_mode!r}, expected one of {RETRY_MODES}"
+            )
+
+    def to_config(self) -> Config:
+        """Build the botocore Config for these settings"""
+        return Config(
+            max_pool_connections=self.max_pool_connections,
+            tcp_keepalive=self.tcp_keepalive,
+            read_timeout=self.read_timeout,
+            retries={"mode": self.retry_mode, "max_attempts": self.max_attempts},
+        )
+
+
+class ClientPool:
+    """Caches one client per (service, region, endpoint_url)"""
+
+    def __init__(self, settings: Optional[ClientSettings] = None):
+        self.settings = settings or ClientSettings()
+        self._config = self.settings.to_config()
+        self._lock = threading.Lock()
+        # Creating clients from the default session is not thread-safe, so
+        # the pool owns its session and only uses it under the lock
+        self._session = None
+        self._clients: Dict[Tuple[str, Optional[str], Optional[str]], Any] = {}
+
+    def get(self, service: str, region_name: Optional[str] = None,
+            endpoint_url: Optional[str] = None):
+        """Return the shared client, creating it on first use"""
+        key = (service, region_name, endpoint_url)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                if self._session is None:
+                    self._session = boto3.session.Session()
+                client = self._session.client(
+                    service, region_name=region_name, endpoint_url=endpoint_url,
+                    config=self._config,
+                )
+                self._clients[key] = client
+                logger.debug(f"Created {service} client for region "
+                             f"{client.meta.region_name}")
+            return client
+
+    def close(self):
+        """Close the pooled connections and forget all clients"""
+        with self._lock:
+            clients, self._clients = self._clients, {}
+        for client in clients.values():
+            try:
+                client.close()
+            except Exception as e:
+                logger.debug(f"Error closing client: {e}")
+
+
+# Process-wide pool, replaced by configure_clients()
+pool = ClientPool()
+
+
+def get_client(service: str = "bedrock-agent-runtime", region_name: Optional[str] = None,
+               endpoint_url: Optional[str] = None):
+    """Return the shared, pooled client for a service and region"""
+    return pool.get(service, region_name, endpoint_url)
+
+
+def configure_clients(**kwargs) -> ClientSettings:
+    """Replace the process-wide client settings; existing clients are closed"""
+    global pool
+    old, pool = pool, ClientPool(ClientSettings(**kwargs))
+    old.close()
+    return pool.settings
+
+
+def prewarm_clients(services: Optional[Iterable[str]] = None,
+                    regions: Iterable[Optional[str]] = (None,)) -> int:
+    """Create clients ahead of the first request.
+
+    Args:
+        services: Service names, defaults to BEDROCK_AGENT_PREWARM_CLIENTS or
+            bedrock-agent-runtime
+        regions: Regions to create each client for, None for the default
+
+    Returns:
+        Number of clients available
+    """
+    if services is None:
+        services = [name.strip() for name in os.environ.get(
+            "BEDROCK_AGENT_PREWARM_CLIENTS", "bedrock-agent-runtime").split(",") if name.strip()]
+    count = 0
+    for service in services:
+        for region in regions:
+            try:
+                get_client(service, region)
+                count += 1
+            except Exception as e:
+                logger.warning(f"Could not create {service} client: {e}")
+    return count
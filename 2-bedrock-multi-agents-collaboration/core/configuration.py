@@ -1,33 +1,49 @@
 """Generic configuration for OpenTelemetry with any OTLP-compatible backend."""
 
+import atexit
 import os
-from typing import Dict, Optional, Any
+import threading
+import logging
+from typing import Dict, Optional, Any, Sequence, Union
 from opentelemetry import trace
-from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace import TracerProvider, SpanProcessor
 from opentelemetry.sdk.resources import Resource
-from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
-from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor, SpanExporter
 
 from opentelemetry import metrics
 from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
 from opentelemetry.sdk.metrics import MeterProvider
-from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+from opentelemetry.sdk.metrics.export import MetricReader, PeriodicExportingMetricReader
 
-def create_tracer_provider(
+from .export import BackgroundExportProcessor
+from .exporters import build_exporter
+from .metrics import MetricsSpanProcessor
+from .sampling import TailSamplingProcessor
+
+# Initialize logging
+logger = logging.getLogger(__name__)
+
+
+def _parse_headers(headers_str: str) -> Dict[str, str]:
+    """Parse an OTLP header string (format: key1=value1,key2=value2)"""
+    headers = {}
+    for header_pair in headers_str.split(","):
+        if "=" in header_pair:
+            key, value = header_pair.split("=", 1)
+            headers[key.strip()] = value.strip()
+    return headers
+
+
+def _build_resource(
     service_name: Optional[str] = None,
     environment: Optional[str] = None,
     resource_attributes: Optional[Dict[str, Any]] = None,
-    endpoint: Optional[str] = None,
-    headers: Optional[Dict[str, str]] = None,
-    use_batch_processor: bool = True,
-) -> TracerProvider:
-    """
-    Create a generic OpenTelemetry TracerProvider configurable for any backend
-    """
-    service_name = service_name or os.environ.get("OTEL_SERVICE_NAME", 
+) -> Resource:
+    """Create the resource describing this service"""
+    service_name = service_name or os.environ.get("OTEL_SERVICE_NAME",
                    os.environ.get("SERVICE_NAME", "opentelemetry-service"))
     environment = environment or os.environ.get("DEPLOYMENT_ENVIRONMENT", "production")
-    
+
     # Create base resource attributes
     attributes = {
         "service.name": service_name,
@@ -35,41 +51,310 @@ def create_tracer_provider(
     }
     if resource_attributes:
         attributes.update(resource_attributes)
-    resource = Resource.create(attributes)
-    
-    # Create tracer provider with resource
-    tracer_provider = TracerProvider(resource=resource)
-    
-    # Get endpoint from parameter or environment variable
-    final_endpoint = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT")
-    final_headers = os.environ["OTEL_EXPORTER_OTLP_HEADERS"]
-    
+    return Resource.create(attributes)
+
+
+def _build_span_processor(
+    endpoint: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None,
+    use_batch_processor: bool = True,
+    exporter: Union[str, SpanExporter, None] = None,
+    file_path: Optional[str] = None,
+    max_export_batch_size: Optional[int] = None,
+    schedule_delay_millis: Optional[float] = None,
+) -> Optional[SpanProcessor]:
+    """Create the exporter pipeline, or None if there is nothing to export to"""
     # Parse headers from OTEL_EXPORTER_OTLP_HEADERS if not provided as parameter
-    if not headers and "OTEL_EXPORTER_OTLP_HEADERS" in os.environ:
-        headers_str = os.environ["OTEL_EXPORTER_OTLP_HEADERS"]
-        headers = {}
-        
-        # Parse header string (format: key1=value1,key2=value2)
-        for header_pair in headers_str.split(","):
-            if "=" in header_pair:
-                key, value = header_pair.split("=", 1)
-                headers[key.strip()] = value.strip()
-    
-    # Configure OTLP exporter if endpoint is available
-    if final_endpoint:
-        try:
-            # Create OTLP exporter
-            otlp_exporter = OTLPSpanExporter()
-            
-            # Add appropriate span processor
-            processor_cls = BatchSpanProcessor if use_batch_processor else SimpleSpanProcessor
-            tracer_provider.add_span_processor(processor_cls(otlp_exporter))
-            
-        except Exception as e:
-            print(f"Failed to configure OTLP exporter: {str(e)}")
-    else:
-        print("No telemetry endpoint configured, spans will not be exported")
-    
-    # Set as global tracer provider
-    trace.set_tracer_provider(tracer_provider)
-    return tracer_provider
\ No newline at end of file
+    if not headers and os.environ.get("OTEL_EXPORTER_OTLP_HEADERS"):
+        headers = _parse_headers(os.environ["OTEL_EXPORTER_OTLP_HEADERS"])
+
+    try:
+        # OTLP (gzip), a local file, in-memory or none; see core/exporters.py
+        if not isinstance(exporter, SpanExporter):
+            exporter = build_exporter(exporter, endpoint, headers, file_path)
+        if exporter is None:
+            return None
+
+        # Export from a bounded background queue so requests never wait on
+        # the OTLP round trip; SimpleSpanProcessor exports inline (debugging)
+        if use_batch_processor:
+            processor = BackgroundExportProcessor(
+                exporter,
+                max_export_batch_size=max_export_batch_size,
+                schedule_delay_millis=schedule_delay_millis,
+            )
+        else:
+            processor = SimpleSpanProcessor(exporter)
+
+        # Keep only a fraction of ordinary traces, decided per whole trace
+        sampler = TailSamplingProcessor(processor)
+        return sampler if sampler.ratio < 1.0 else processor
+    except Exception as e:
+        logger.error(f"Failed to configure span exporter: {str(e)}")
+        return None
+
+
+def _build_metric_reader(
+    endpoint: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Optional[MetricReader]:
+    """Create a periodic OTLP metric reader, or None if no endpoint is configured"""
+    try:
+        if endpoint:
+            # An explicit endpoint is the traces URL; metrics go next to it
+            if not endpoint.rstrip("/").endswith("/v1/traces"):
+                logger.info(f"Cannot derive a metrics URL from {endpoint}, metrics will not be exported")
+                return None
+            metric_exporter = OTLPMetricExporter(
+                endpoint=endpoint.rstrip("/")[:-len("/v1/traces")] + "/v1/metrics",
+                headers=headers,
+            )
+        elif (os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT")
+              or os.environ.get("OTEL_EXPORTER_OTLP_METRICS_ENDPOINT")):
+            metric_exporter = OTLPMetricExporter()
+        else:
+            return None
+        # The export interval follows OTEL_METRIC_EXPORT_INTERVAL (default 60s)
+        return PeriodicExportingMetricReader(metric_exporter)
+    except Exception as e:
+        print(f"Failed to configure OTLP metric exporter: {str(e)}")
+        return None
+
+
+_meter_provider: Optional[MeterProvider] = None
+_meter_provider_lock = threading.Lock()
+
+
+def create_meter_provider(
+    resource: Optional[Resource] = None,
+    metric_readers: Optional[Sequence[MetricReader]] = None,
+    endpoint: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> MeterProvider:
+    """
+    Get the process-wide MeterProvider, building it on the first call only.
+
+    ``metric_readers`` replaces the OTLP reader (e.g. an InMemoryMetricReader
+    for tests); it must be passed before the first agent invocation.
+    """
+    global _meter_provider
+    with _meter_provider_lock:
+        if _meter_provider is None:
+            if metric_readers is None:
+                reader = _build_metric_reader(endpoint, headers)
+                metric_readers = [reader] if reader is not None else []
+            _meter_provider = MeterProvider(
+                metric_readers=metric_readers, resource=resource or _build_resource()
+            )
+            metrics.set_meter_provider(_meter_provider)
+        return _meter_provider
+
+
+class _SwappableSpanProcessor(SpanProcessor):
+    """Span processor delegating to a pipeline that can be replaced at runtime.
+
+    OpenTelemetry only allows the global TracerProvider to be set once, so
+    reconfiguration swaps the exporter pipeline behind this processor instead
+    of installing a new provider.
+    """
+
+    def __init__(self):
+        self._delegate: Optional[SpanProcessor] = None
+
+    @property
+    def delegate(self) -> Optional[SpanProcessor]:
+        return self._delegate
+
+    def swap(self, delegate: Optional[SpanProcessor]) -> Optional[SpanProcessor]:
+        """Install a new delegate and return the previous one"""
+        previous, self._delegate = self._delegate, delegate
+        return previous
+
+    def on_start(self, span, parent_context=None) -> None:
+        delegate = self._delegate
+        if delegate is not None:
+            delegate.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span) -> None:
+        delegate = self._delegate
+        if delegate is not None:
+            delegate.on_end(span)
+
+    def shutdown(self) -> None:
+        delegate = self.swap(None)
+        if delegate is not None:
+            delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        delegate = self._delegate
+        if delegate is None:
+            return True
+        return delegate.force_flush(timeout_millis)
+
+
+class TracerProviderRegistry:
+    """Owns the process-wide TracerProvider and its exporter pipeline.
+
+    The provider, exporter and span processor are built on first use and then
+    shared by every agent invocation. ``reconfigure`` replaces the exporter
+    pipeline under a lock and shuts the old one down once it is detached.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._provider: Optional[TracerProvider] = None
+        self._processor = _SwappableSpanProcessor()
+
+    @property
+    def provider(self) -> Optional[TracerProvider]:
+        """The shared provider, or None if it has not been built yet"""
+        return self._provider
+
+    @property
+    def export_pipeline(self) -> Optional[BackgroundExportProcessor]:
+        """The background export pipeline, if the active exporter uses one"""
+        delegate = self._processor.delegate
+        if isinstance(delegate, TailSamplingProcessor):
+            delegate = delegate.delegate
+        if isinstance(delegate, BackgroundExportProcessor):
+            return delegate
+        return None
+
+    @property
+    def tail_sampler(self) -> Optional[TailSamplingProcessor]:
+        """The tail sampler in front of the exporter, if sampling is enabled"""
+        delegate = self._processor.delegate
+        return delegate if isinstance(delegate, TailSamplingProcessor) else None
+
+    def get_or_create(
+        self,
+        service_name: Optional[str] = None,
+        environment: Optional[str] = None,
+        resource_attributes: Optional[Dict[str, Any]] = None,
+        endpoint: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        use_batch_processor: bool = True,
+        exporter: Union[str, SpanExporter, None] = None,
+        file_path: Optional[str] = None,
+        max_export_batch_size: Optional[int] = None,
+        schedule_delay_millis: Optional[float] = None,
+    ) -> TracerProvider:
+        """Return the shared provider, building it on the first call only"""
+        provider = self._provider
+        if provider is not None:
+            return provider
+
+        with self._lock:
+            if self._provider is None:
+                resource = _build_resource(service_name, environment, resource_attributes)
+                self._provider = self._create(resource)
+                self._processor.swap(
+                    _build_span_processor(
+                        endpoint, headers, use_batch_processor, exporter, file_path,
+                        max_export_batch_size, schedule_delay_millis,
+                    )
+                )
+                create_meter_provider(resource, endpoint=endpoint, headers=headers)
+            return self._provider
+
+    def reconfigure(
+        self,
+        endpoint: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        use_batch_processor: bool = True,
+        exporter: Union[str, SpanExporter, None] = None,
+        file_path: Optional[str] = None,
+        max_export_batch_size: Optional[int] = None,
+        schedule_delay_millis: Optional[float] = None,
+        span_processor: Optional[SpanProcessor] = None,
+        **resource_kwargs,
+    ) -> TracerProvider:
+        """Replace the exporter pipeline of the shared provider.
+
+        ``span_processor`` installs a ready-made pipeline; otherwise one is
+        built around ``exporter`` (an exporter name from core/exporters.py or
+        a SpanExporter) and the OTEL_* environment. Resource settings only
+        take effect if the provider has not been built yet.
+        """
+        processor = span_processor or _build_span_processor(
+            endpoint, headers, use_batch_processor, exporter, file_path,
+            max_export_batch_size, schedule_delay_millis,
+        )
+        with self._lock:
+            if self._provider is None:
+                resource = _build_resource(**resource_kwargs)
+                self._provider = self._create(resource)
+                create_meter_provider(resource, endpoint=endpoint, headers=headers)
+            previous = self._processor.swap(processor)
+            provider = self._provider
+
+        # Spans already handed to the old pipeline are flushed on shutdown
+        if previous is not None:
+            try:
+                previous.shutdown()
+            except Exception as e:
+                logger.warning(f"Error shutting down previous span processor: {e}")
+        return provider
+
+    def shutdown(self) -> None:
+        """Flush and shut down the exporter pipeline"""
+        with self._lock:
+            previous = self._processor.swap(None)
+        if previous is not None:
+            previous.shutdown()
+
+    def _create(self, resource: Resource) -> TracerProvider:
+        tracer_provider = TracerProvider(resource=resource, shutdown_on_exit=False)
+        tracer_provider.add_span_processor(self._processor)
+        # Metrics see every finished span, before any export-side sampling
+        tracer_provider.add_span_processor(MetricsSpanProcessor())
+
+        # Drain the export queue when the interpreter exits
+        atexit.register(self.shutdown)
+
+        # Set as global tracer provider
+        trace.set_tracer_provider(tracer_provider)
+        return tracer_provider
+
+
+# Process-wide registry shared by all agent invocations
+provider_registry = TracerProviderRegistry()
+
+
+def create_tracer_provider(
+    service_name: Optional[str] = None,
+    environment: Optional[str] = None,
+    resource_attributes: Optional[Dict[str, Any]] = None,
+    endpoint: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None,
+    use_batch_processor: bool = True,
+    exporter: Union[str, SpanExporter, None] = None,
+    file_path: Optional[str] = None,
+    max_export_batch_size: Optional[int] = None,
+    schedule_delay_millis: Optional[float] = None,
+) -> TracerProvider:
+    """
+    Get the process-wide OpenTelemetry TracerProvider configurable for any backend.
+
+    The provider is built on the first call; later calls return it unchanged.
+    Use reconfigure_tracer_provider() to change the exporter at runtime.
+    ``exporter`` selects OTLP, a local file, in-memory or no export (default
+    from BEDROCK_AGENT_EXPORTER); the batch settings default to OTEL_BSP_*.
+    """
+    return provider_registry.get_or_create(
+        service_name=service_name,
+        environment=environment,
+        resource_attributes=resource_attributes,
+        endpoint=endpoint,
+        headers=headers,
+        use_batch_processor=use_batch_processor,
+        exporter=exporter,
+        file_path=file_path,
+        max_export_batch_size=max_export_batch_size,
+        schedule_delay_millis=schedule_delay_millis,
+    )
+
+
+def reconfigure_tracer_provider(**kwargs) -> TracerProvider:
+    """Swap the exporter pipeline of the process-wide TracerProvider"""
+    return provider_registry.reconfigure(**kwargs)
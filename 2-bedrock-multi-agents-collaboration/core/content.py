@@ -0,0 +1,141 @@
+"""
+Content-addressed storage of large prompts and completions.
+
+The same prompt or completion is copied onto several spans of an invocation
+(the orchestration span, the ``llm`` span, its model output span and the
+root span). With a content store enabled, string attributes of at least
+``min_bytes`` are identified by their SHA-256 and only stored once:
+
+    span   the first span to carry a text keeps it in full (exempt from
+           the attribute size cap, so references always resolve), plus a
+           ``<key>.sha256`` attribute; later copies in the same invocation
+           become a reference
+    blob   every copy becomes a reference and each distinct text is written
+           once to a JSON Lines side file ({"sha256", "bytes", "content"})
+           through the background trace log sink
+
+A reference looks like ``[content sha256:9483d1... 50000 bytes]``, the same
+hash the attribute size cap puts on truncated values.
+
+Settings are read from the environment and can be changed at runtime with
+``configure_content_store``:
+
+    BEDROCK_AGENT_CONTENT_STORE      "off" (default), "span" or "blob"
+    BEDROCK_AGENT_CONTENT_MIN_BYTES  smallest value stored by reference (default 1024)
+    BEDROCK_AGENT_CONTENT_LOG        side file for "blob" (default content_store.jsonl)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional, Tuple
+
+from .capture import _open_text
+from .context import current_invocation
+from .timing import now
+from .trace_log import get_trace_log_sink
+
+# Initialize logging
+logger = logging.getLogger(__name__)
+
+# Digests already written to the side file, so each text is written once
+_WRITTEN_DIGESTS = 100000
+
+
+class ContentStoreMode:
+    """Where large texts are kept"""
+    OFF = "off"
+    SPAN = "span"
+    BLOB = "blob"
+
+    ALL = (OFF, SPAN, BLOB)
+
+
+def content_digest(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def content_ref(digest: str, size: int) -> str:
+    """The attribute value standing in for a stored text"""
+    return f"[content sha256:{digest} {size} bytes]"
+
+
+class ContentStore:
+    """Replaces repeated large attribute values with hash references"""
+
+    def __init__(
+        self,
+        mode: Optional[str] = None,
+        min_bytes: Optional[int] = None,
+        path: Optional[str] = None,
+    ):
+        self.mode = mode or os.environ.get("BEDROCK_AGENT_CONTENT_STORE", ContentStoreMode.OFF)
+        self.min_bytes = min_bytes or int(os.environ.get("BEDROCK_AGENT_CONTENT_MIN_BYTES", 1024))
+        self.path = path or os.environ.get("BEDROCK_AGENT_CONTENT_LOG", "content_store.jsonl")
+        if self.mode not in ContentStoreMode.ALL:
+            raise ValueError(
+                f"Unknown content store mode {self.mode!r}, expected one of {ContentStoreMode.ALL}"
+            )
+        self._lock = threading.Lock()
+        self._written: "OrderedDict[str, None]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != ContentStoreMode.OFF
+
+    def store(self, span, key: str, value: str, size: int) -> Tuple[str, bool]:
+        """Return the value to set for ``key`` and whether it is the copy kept
+        in full (the text itself) rather than a reference"""
+        digest = content_digest(value)
+        if self.mode == ContentStoreMode.SPAN:
+            first_seen = current_invocation().content_digests
+            if digest not in first_seen:
+                first_seen[digest] = key
+                span.set_attribute(f"{key}.sha256", digest)
+                return value, True
+        else:
+            self._write_blob(digest, value, size)
+        return content_ref(digest, size), False
+
+    def _write_blob(self, digest: str, value: str, size: int):
+        with self._lock:
+            if digest in self._written:
+                self._written.move_to_end(digest)
+                return
+            self._written[digest] = None
+            if len(self._written) > _WRITTEN_DIGESTS:
+                self._written.popitem(last=False)
+        get_trace_log_sink(self.path).write({
+            "sha256": digest,
+            "bytes": size,
+            "stored_at": now().iso,
+            "content": value,
+        })
+
+
+# Process-wide store, replaced by configure_content_store()
+store = ContentStore()
+
+
+def configure_content_store(**kwargs) -> ContentStore:
+    """Replace the process-wide content store settings"""
+    global store
+    store = ContentStore(**kwargs)
+    return store
+
+
+def iter_content_log(path: str) -> Iterator[Tuple[str, str]]:
+    """Yield (sha256, content) from a content side file (or a rotated segment)"""
+    with _open_text(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield record["sha256"], record["content"]
+
+
+def read_content_log(path: str) -> Dict[str, str]:
+    """Load a content side file into {sha256: content} to resolve references"""
+    return dict(iter_content_log(path))
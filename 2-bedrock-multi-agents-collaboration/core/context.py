@@ -0,0 +1,470 @@
+"""
+Invocation-scoped state for Bedrock Agent instrumentation.
+
+Each call to an instrumented agent gets its own InvocationContext holding the
+span manager, span/guardrail buffers, timers and cached root attributes. The
+active context is carried through ``contextvars`` so handlers running in
+concurrent Flask threads never see each other's state.
+"""
+
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional
+
+from opentelemetry import trace
+from opentelemetry.trace import Status, StatusCode, SpanKind
+
+from .constants import SpanAttributes
+from .events import TraceEvent
+from .latency import CriticalPath, EventClock, EventTimeTracer
+from .metrics import leaked_spans
+from .pricing import UsageAccumulator
+from .timer_lib import FunctionTimer
+from .timing import Timestamp, elapsed_ms, now, perf_ns, set_span_times
+
+# Initialize logging
+logger = logging.getLogger(__name__)
+
+# Step spans are placed on the current invocation's event clock and tracked
+# until they end
+tracer = EventTimeTracer(
+    trace.get_tracer("bedrock-agent-tracing"),
+    lambda: current_invocation().event_clock,
+    on_start=lambda span: current_invocation().spans.register(span),
+)
+
+# Status description of spans ended because their invocation ended
+LEAKED_SPAN_STATUS = "Span leaked: not ended by its handler"
+
+_leaked_total = 0
+_leaked_lock = threading.Lock()
+
+
+def leaked_span_count() -> int:
+    """Spans ended as leaked since the process started"""
+    return _leaked_total
+
+
+class SpanRegistry:
+    """Every span opened during an invocation, so none outlives it.
+
+    Handlers hand spans around through the span manager and ``active_spans``
+    and some paths never end them. ``end_leaked`` ends the ones still open
+    when the invocation closes, marked with ``span.leaked`` and an error
+    status, and counts them.
+    """
+
+    # Ended spans are dropped once this many are tracked
+    COMPACT_AT = 256
+
+    __slots__ = ("_spans", "_compact_at")
+
+    def __init__(self):
+        self._spans: List[Any] = []
+        self._compact_at = self.COMPACT_AT
+
+    def register(self, span):
+        spans = self._spans
+        spans.append(span)
+        if len(spans) >= self._compact_at:
+            spans[:] = [open_span for open_span in spans if open_span.is_recording()]
+            # With many spans legitimately open, compacting on every register
+            # would be quadratic; wait until the list has doubled again
+            self._compact_at = max(self.COMPACT_AT, 2 * len(spans))
+
+    def open_spans(self) -> List[Any]:
+        """Spans started and not ended yet"""
+        return [span for span in self._spans if span.is_recording()]
+
+    def end_leaked(self) -> int:
+        """End the spans still open; returns how many there were"""
+        global _leaked_total
+        leaked = self.open_spans()
+        self._spans.clear()
+        self._compact_at = self.COMPACT_AT
+        for span in leaked:
+            try:
+                span.set_attribute("span.leaked", True)
+                span.set_status(Status(StatusCode.ERROR, LEAKED_SPAN_STATUS))
+                span.end()
+                leaked_spans.add(1, {"span.name": span.name})
+            except Exception as e:
+                logger.error(f"Error ending leaked span {span}: {e}")
+        if leaked:
+            logger.debug(f"Ended {len(leaked)} leaked spans: {[span.name for span in leaked]}")
+            with _leaked_lock:
+                _leaked_total += len(leaked)
+        return len(leaked)
+
+
+class SpanManager:
+    """Manages spans and their relationships for the duration of processing."""
+
+    def __init__(self):
+        # Main spans dictionary - keyed by component_type:trace_id
+        self.spans = {}
+
+        # Track current trace_id for each component
+        self.active_traces = {
+            "orchestration": None,
+            "postprocessing": None,
+            "preprocessing": None,
+            "guardrail_pre": None,
+            "guardrail_post": None,
+        }
+
+        # Special spans tracked for direct access
+        self.special_spans = {
+            "kb_span": None,
+            "code_span": None,
+            "action_span": None,
+            "llm_spans": {},  # Tracks LLM spans by trace_id
+        }
+
+        # Post-response guardrail aggregates by base trace ID (streaming mode)
+        self.guardrail_buffer: Dict[str, "GuardrailAggregate"] = {}
+        # Track which spans have had their times set to prevent overwriting
+        self.spans_with_set_times = set()
+
+    def reset(self):
+        """Reset the span manager, ending any active spans."""
+        # End all active spans
+        for span_id, span in list(self.spans.items()):
+            if span and hasattr(span, "is_recording") and span.is_recording():
+                try:
+                    span.set_status(Status(StatusCode.OK))
+                    span.end()
+                except Exception as e:
+                    logger.error(f"Error ending span {span_id}: {e}")
+
+        # Reset all tracking collections
+        self.spans.clear()
+        self.active_traces = {
+            "orchestration": None,
+            "postprocessing": None,
+            "preprocessing": None,
+            "guardrail_pre": None,
+            "guardrail_post": None,
+        }
+
+        self.special_spans = {
+            "kb_span": None,
+            "code_span": None,
+            "action_span": None,
+            "llm_spans": {},
+        }
+
+        self.guardrail_buffer.clear()
+        self.spans_with_set_times.clear()
+
+    def protect_span_timing(self, span_key: str):
+        """Mark a span's timing as protected to prevent overwrites"""
+        self.spans_with_set_times.add(span_key)
+
+    def can_set_timing(self, span_key: str) -> bool:
+        """Check if timing can be set for this span"""
+        return span_key not in self.spans_with_set_times
+
+    def get_or_create_span(
+        self,
+        component_type: str,
+        trace_id: str,
+        parent_span,
+        attributes=None,
+        timing_data=None,
+    ):
+        span_key = f"{component_type}:{trace_id}"
+
+        if not parent_span:
+            logger.info("No parent span provided, cannot create child span.")
+
+            # Check existing span
+        if span_key in self.spans and self.spans[span_key].is_recording():
+            span = self.spans[span_key]
+
+            # Only update timing if allowed and provided
+            if timing_data and self.can_set_timing(span_key):
+                start_time, end_time, latency_ms = timing_data
+                if start_time and end_time:
+                    set_span_times(span, start_time, end_time, latency_ms)
+                    self.protect_span_timing(span_key)
+
+            return span
+
+        # Create new span with proper context from parent
+        span = tracer.start_span(
+            name=component_type,
+            kind=SpanKind.CLIENT,
+            attributes=attributes or {},
+            context=trace.set_span_in_context(parent_span),
+        )
+
+        # Start the span only if it's not already recording
+        if not span.is_recording():
+            print(f"Span {span_key} is not recording, starting it now.")
+            span.start()
+
+        # Set timing data if provided
+        if timing_data:
+            start_time, end_time, latency_ms = timing_data
+
+            # Only set if values are valid
+            if start_time and end_time:
+                set_span_times(span, start_time, end_time, latency_ms)
+
+                # Mark as having times set
+                self.spans_with_set_times.add(span_key)
+                logger.debug(f"Set timing on new span {span_key}")
+
+        self.spans[span_key] = span
+        self.active_traces[component_type] = trace_id
+        return span
+
+    def set_timing_if_not_set(
+        self, span_key, span, start_time, end_time, latency_ms
+    ):
+        """Set timing data on a span if it hasn't been set already."""
+        if span_key not in self.spans_with_set_times:
+            set_span_times(span, start_time, end_time, latency_ms)
+            self.spans_with_set_times.add(span_key)
+            logger.debug(f"Set timing on span {span_key}")
+            return True
+        return False
+
+    def add_guardrail_event(
+        self,
+        base_trace_id: str,
+        trace_data: Dict,
+        content: Optional[str] = None,
+        received_at: Optional[Timestamp] = None,
+    ) -> "GuardrailAggregate":
+        """Fold a post-response guardrail event into the aggregate for its base
+        trace ID (``content`` is accepted for compatibility and not stored)"""
+        aggregate = self.guardrail_buffer.get(base_trace_id)
+        if aggregate is None:
+            aggregate = self.guardrail_buffer[base_trace_id] = GuardrailAggregate(base_trace_id)
+        aggregate.add(trace_data, received_at)
+        return aggregate
+
+
+# Assessment policies that make a guardrail-post assessment worth reporting
+ASSESSMENT_POLICIES = (
+    "contentPolicy",
+    "topicPolicy",
+    "wordPolicy",
+    "sensitiveInformationPolicy",
+)
+
+# Guardrail actions that mean the response was blocked or changed
+GUARDRAIL_INTERVENTION_ACTIONS = ("INTERVENED", "BLOCKED", "GUARDRAIL_INTERVENED")
+
+
+class GuardrailAggregate:
+    """Post-response guardrail events of one base trace ID, folded as they arrive.
+
+    Streaming with a low ``applyGuardrailInterval`` produces a guardrail-post
+    event per few chunks; only the counts and the distinct substantive
+    assessments are kept, so reporting at the end of the stream does not
+    depend on the number of events.
+    """
+
+    __slots__ = (
+        "base_trace_id",
+        "action",
+        "event_count",
+        "assessments",
+        "intervened",
+        "first_received_at",
+        "last_received_at",
+        "_seen",
+        "_seen_repr",
+    )
+
+    def __init__(self, base_trace_id: str):
+        self.base_trace_id = base_trace_id
+        self.action = None
+        self.event_count = 0
+        self.assessments: List[Dict[str, Any]] = []
+        self.intervened = False
+        self.first_received_at: Optional[Timestamp] = None
+        self.last_received_at: Optional[Timestamp] = None
+        self._seen = set()
+        self._seen_repr = set()
+
+    def add(self, trace_data: Dict[str, Any], received_at: Optional[Timestamp] = None):
+        guardrail_trace = trace_data.get("trace", {}).get("guardrailTrace", {})
+        action = guardrail_trace.get("action", "NONE")
+        if self.action is None:
+            self.action = action
+        if action in GUARDRAIL_INTERVENTION_ACTIONS:
+            self.intervened = True
+
+        self.event_count += 1
+        received_at = received_at or trace_data.get("received_at") or now()
+        if self.first_received_at is None:
+            self.first_received_at = received_at
+        self.last_received_at = received_at
+
+        for assessment in guardrail_trace.get("outputAssessments", ()):
+            if not assessment or not any(
+                assessment.get(policy) for policy in ASSESSMENT_POLICIES
+            ):
+                continue
+            # Repeats usually have an identical repr; the canonical JSON
+            # form catches equal assessments with a different key order
+            quick_key = repr(assessment)
+            if quick_key in self._seen_repr:
+                continue
+            self._seen_repr.add(quick_key)
+            key = json.dumps(assessment, sort_keys=True, default=str)
+            if key not in self._seen:
+                self._seen.add(key)
+                self.assessments.append(assessment)
+
+    @property
+    def has_substantive_assessment(self) -> bool:
+        return bool(self.assessments)
+
+
+def new_active_spans() -> Dict[str, Any]:
+    """Create the active span lookup used by the orchestration handlers"""
+    return {
+        "kb_span": None,
+        "action_span": None,
+        "code_span": None,
+        "orchestration_span": None,
+        "postprocessing_span": None,
+        "active_traces": {
+            "preprocessing": None,
+            "orchestration": None,
+            "postprocessing": None,
+        },
+    }
+
+
+class InvocationContext:
+    """State owned by a single Bedrock Agent invocation."""
+
+    def __init__(self, root_attributes: Optional[Dict[str, Any]] = None):
+        self.span_manager = SpanManager()
+        self.active_spans = new_active_spans()
+        # Post-response guardrail aggregates by base trace ID, shared with
+        # the span manager so every event is stored once
+        self.guardrail_buffer: Dict[str, GuardrailAggregate] = self.span_manager.guardrail_buffer
+        # Step windows from eventTime gaps, used for span times and timers
+        self.event_clock = EventClock()
+        # Step time per kind of step, reported on the root span at the end
+        self.critical_path = CriticalPath()
+        # Tokens and cost per model, totalled on the root span at the end
+        self.usage = UsageAccumulator()
+        # Spans opened by the handlers, ended at the latest by close()
+        self.spans = SpanRegistry()
+        self.timer = FunctionTimer(clock=self.event_clock)
+
+        # Root span attributes the handlers copy onto child spans, cached so
+        # they are not read back from the root span for every event
+        self.root_attributes: Dict[str, Any] = dict(root_attributes or {})
+        self.root_span = None
+
+        # Stream progress, reported as time-to-first-byte/chunk on the root span
+        self.started_ns = perf_ns()
+        self.first_byte_ms: Optional[float] = None
+        self.first_chunk_ms: Optional[float] = None
+
+        # String attribute bytes per span, used by the attribute size budget
+        self.attribute_usage: Dict[int, Dict[str, int]] = {}
+        # Digests of large texts already stored in full (content store "span" mode)
+        self.content_digests: Dict[str, str] = {}
+        # Prompts as received, by span ID; copies onto child spans are made
+        # from these, as the span attributes may hold capped text or references
+        self.prompts: Dict[int, Any] = {}
+
+        # Optional CaptureWriter recording the raw event stream (SAVE_TRACE_LOGS)
+        self.capture = None
+
+        # The trace event being dispatched, parsed once for all its handlers
+        self.trace_event: Optional[TraceEvent] = None
+
+    @property
+    def model_id(self) -> str:
+        return self.root_attributes.get(
+            SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
+        )
+
+    @property
+    def stream_mode(self) -> bool:
+        return self.root_attributes.get("stream_mode", False)
+
+    def elapsed_ms(self) -> float:
+        """Milliseconds since the invocation started"""
+        return elapsed_ms(self.started_ns, perf_ns(), 2)
+
+    def record_stream_event(self, is_chunk: bool):
+        """Record time-to-first-byte and time-to-first-chunk on the root span"""
+        if self.first_byte_ms is None:
+            self.first_byte_ms = self.elapsed_ms()
+            if self.root_span is not None:
+                self.root_span.set_attribute("time_to_first_byte_ms", self.first_byte_ms)
+        if is_chunk and self.first_chunk_ms is None:
+            self.first_chunk_ms = self.elapsed_ms()
+            if self.root_span is not None:
+                self.root_span.set_attribute("time_to_first_chunk_ms", self.first_chunk_ms)
+
+    def end_root_span(self, root_span):
+        """Set the invocation's roll-ups on the root span and end it"""
+        self.critical_path.apply(root_span)
+        self.usage.apply(root_span)
+        # Not before the last step span when event times were shifted
+        root_span.end(end_time=self.event_clock.root_end_ns())
+
+    @contextmanager
+    def activate(self):
+        """Make this the current invocation for the duration of the block"""
+        token = _current_invocation.set(self)
+        try:
+            yield self
+        finally:
+            _current_invocation.reset(token)
+
+    def close(self):
+        """End any spans still open and drop per-invocation state"""
+        self.span_manager.reset()
+        # What the span manager does not know about has leaked
+        leaked = self.spans.end_leaked()
+        if leaked and self.root_span is not None:
+            self.root_span.set_attribute("spans.leaked", leaked)
+        self.active_spans = new_active_spans()
+        self.guardrail_buffer.clear()
+        self.attribute_usage.clear()
+        self.content_digests.clear()
+        self.prompts.clear()
+        self.timer.reset_all()
+        self.trace_event = None
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+
+
+_current_invocation: ContextVar[Optional[InvocationContext]] = ContextVar(
+    "bedrock_agent_invocation", default=None
+)
+
+# Used when handlers run outside an instrumented invocation
+_default_invocation = InvocationContext()
+
+
+def current_invocation() -> InvocationContext:
+    """Return the invocation context active in the calling thread/task"""
+    ctx = _current_invocation.get()
+    return ctx if ctx is not None else _default_invocation
+
+
+def trace_event(trace_data: Dict[str, Any]) -> TraceEvent:
+    """The parsed form of ``trace_data``, reusing the one being dispatched"""
+    event = current_invocation().trace_event
+    if event is None or event.raw is not trace_data:
+        event = TraceEvent(trace_data)
+    return event
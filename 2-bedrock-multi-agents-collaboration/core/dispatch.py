@@ -0,0 +1,148 @@
+"""
+Table-driven routing of trace events to their handlers.
+
+Handlers are registered per trace type (the component type of a
+``TraceEvent``, e.g. ``"orchestration"``) and optionally per subtype. A
+subtype is a key of the component trace or of its ``invocationInput`` /
+``observation`` parts, e.g. ``"knowledgeBaseLookupInput"`` or
+``"agentCollaboratorInvocationOutput"``.
+
+Trace-type handlers run for every event of that type. Subtype handlers run
+for the events containing one of their subtypes: within the component span
+for types whose handler calls ``dispatch_subtypes`` (orchestration does),
+or directly under the parent span for types without a trace-type handler.
+New Bedrock trace kinds can be supported without touching the core chain:
+
+    from core import register_trace_handler
+
+    def handle_routing(trace_data, parent_span):
+        ...
+
+    register_trace_handler("routingClassifier", handle_routing)
+    register_trace_handler("orchestration", handle_collaborator,
+                           subtypes=("agentCollaboratorInvocationInput",))
+
+Handlers are called as ``handler(trace_data, span)``; the parsed event is
+available through ``core.context.trace_event(trace_data)``.
+"""
+
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .events import COMPONENT_TYPES, TraceEvent, register_trace_type
+
+# Initialize logging
+logger = logging.getLogger(__name__)
+
+TraceHandler = Callable[[Dict[str, Any], Any], Any]
+
+
+def event_subtypes(event: TraceEvent) -> Set[str]:
+    """The subtype keys present in an event's component trace"""
+    subtypes = set(event.component)
+    for part in (event.invocation_input, event.observation):
+        if isinstance(part, dict):
+            subtypes.update(part)
+    return subtypes
+
+
+class TraceDispatcher:
+    """Registry of trace handlers keyed by trace type and subtype"""
+
+    def __init__(self):
+        self._type_handlers: Dict[str, List[TraceHandler]] = {}
+        self._subtype_handlers: Dict[str, List[Tuple[Tuple[str, ...], TraceHandler]]] = {}
+
+    def register(
+        self,
+        trace_type: str,
+        handler: TraceHandler,
+        subtypes: Optional[Iterable[str]] = None,
+        trace_key: Optional[str] = None,
+        replace: bool = False,
+    ):
+        """Register ``handler`` for a trace type, or for subtypes of it.
+
+        Args:
+            trace_type: Component type, e.g. "orchestration" or a new kind
+            handler: Called as handler(trace_data, span)
+            subtypes: Run only for events containing one of these keys
+            trace_key: Key of a new trace kind in event["trace"], defaults
+                to f"{trace_type}Trace"
+            replace: Drop the handlers already registered for the same slot
+        """
+        if trace_key is not None or trace_type not in COMPONENT_TYPES.values():
+            register_trace_type(trace_key or f"{trace_type}Trace", trace_type)
+
+        if subtypes is None:
+            handlers = self._type_handlers.setdefault(trace_type, [])
+            if replace:
+                handlers.clear()
+            handlers.append(handler)
+            return
+
+        subtypes = (subtypes,) if isinstance(subtypes, str) else tuple(subtypes)
+        entries = self._subtype_handlers.setdefault(trace_type, [])
+        if replace:
+            entries[:] = [entry for entry in entries if not set(entry[0]) & set(subtypes)]
+        entries.append((subtypes, handler))
+
+    def unregister(self, trace_type: str, handler: TraceHandler):
+        """Remove ``handler`` from every slot of ``trace_type``"""
+        handlers = self._type_handlers.get(trace_type, [])
+        handlers[:] = [h for h in handlers if h is not handler]
+        entries = self._subtype_handlers.get(trace_type, [])
+        entries[:] = [entry for entry in entries if entry[1] is not handler]
+
+    def handlers_for(self, event: TraceEvent) -> List[TraceHandler]:
+        """The handlers ``dispatch`` and ``dispatch_subtypes`` route an event to"""
+        handlers = list(self._type_handlers.get(event.component_type, ()))
+        entries = self._subtype_handlers.get(event.component_type)
+        if entries:
+            present = event_subtypes(event)
+            handlers.extend(handler for subtypes, handler in entries
+                            if any(subtype in present for subtype in subtypes))
+        return handlers
+
+    def replace_handlers(self, replace: Callable[[TraceHandler], TraceHandler]):
+        """Swap every registered handler for ``replace(handler)``, in place"""
+        for handlers in self._type_handlers.values():
+            handlers[:] = [replace(handler) for handler in handlers]
+        for entries in self._subtype_handlers.values():
+            entries[:] = [(subtypes, replace(handler)) for subtypes, handler in entries]
+
+    def dispatch(self, event: TraceEvent, parent_span):
+        """Run the handlers registered for an event's trace type"""
+        handlers = self._type_handlers.get(event.component_type)
+        if handlers:
+            for handler in handlers:
+                handler(event.raw, parent_span)
+        elif event.component_type in self._subtype_handlers:
+            self.dispatch_subtypes(event, parent_span)
+        else:
+            logger.debug(f"No handler registered for trace event {event}")
+
+    def dispatch_subtypes(self, event: TraceEvent, span):
+        """Run the subtype handlers matching an event, in registration order"""
+        entries = self._subtype_handlers.get(event.component_type)
+        if not entries:
+            return
+        present = event_subtypes(event)
+        for subtypes, handler in entries:
+            if any(subtype in present for subtype in subtypes):
+                handler(event.raw, span)
+
+
+# Process-wide registry; the built-in handlers are registered in core.agent
+dispatcher = TraceDispatcher()
+
+
+def register_trace_handler(
+    trace_type: str,
+    handler: TraceHandler,
+    subtypes: Optional[Iterable[str]] = None,
+    trace_key: Optional[str] = None,
+    replace: bool = False,
+):
+    """Register a handler with the process-wide dispatcher (see TraceDispatcher.register)"""
+    dispatcher.register(trace_type, handler, subtypes, trace_key, replace)
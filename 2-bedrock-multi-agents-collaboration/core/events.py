@@ -0,0 +1,99 @@
+"""
+Parsed form of a Bedrock Agent trace event.
+
+A trace event is a nested dict (``{"trace": {"orchestrationTrace": {...}},
+"eventTime": ..., ...}``). ``TraceEvent`` walks it once, when the event is
+dispatched, and keeps direct references to the parts the handlers need: the
+component trace, its trace ID, the event and receive times and the common
+subtraces. The raw dict is kept in ``raw`` and is not modified.
+"""
+
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from .timing import Timestamp, event_timestamp
+
+# Initialize logging
+logger = logging.getLogger(__name__)
+
+# Component trace key -> component type, in the order they are dispatched
+COMPONENT_TYPES = {
+    "guardrailTrace": "guardrail",
+    "preProcessingTrace": "preprocessing",
+    "orchestrationTrace": "orchestration",
+    "postProcessingTrace": "postprocessing",
+    "failureTrace": "failure",
+}
+
+
+def register_trace_type(trace_key: str, component_type: str):
+    """Recognise a new kind of trace, stored under ``trace_key`` in event["trace"]"""
+    COMPONENT_TYPES[trace_key] = component_type
+
+
+class TraceEvent:
+    """One trace event, parsed once and shared by the dispatcher and handlers"""
+
+    __slots__ = (
+        "raw",
+        "trace",
+        "component_type",
+        "component",
+        "trace_id",
+        "event_time",
+        "received_at",
+        "model_input",
+        "model_output",
+        "rationale",
+        "invocation_input",
+        "observation",
+    )
+
+    def __init__(self, trace_data: Dict[str, Any]):
+        self.raw = trace_data
+        trace_obj = trace_data.get("trace", trace_data)
+        self.trace = trace_obj
+
+        self.component_type = None
+        self.component: Dict[str, Any] = {}
+        for key, component_type in COMPONENT_TYPES.items():
+            if key in trace_obj:
+                self.component_type = component_type
+                self.component = trace_obj[key] or {}
+                break
+
+        component = self.component
+        self.model_input = component.get("modelInvocationInput")
+        self.model_output = component.get("modelInvocationOutput")
+        self.rationale = component.get("rationale")
+        self.invocation_input = component.get("invocationInput")
+        self.observation = component.get("observation")
+
+        self.trace_id = self._find_trace_id()
+        self.event_time: Optional[Timestamp] = event_timestamp(trace_data)
+        self.received_at: Optional[Timestamp] = trace_data.get("received_at")
+
+    def _find_trace_id(self) -> str:
+        component = self.component
+        if self.component_type in ("guardrail", "failure"):
+            if "traceId" in component:
+                return component["traceId"]
+            return f"{self.component_type}-{time.time()}"
+        if self.component_type is None:
+            logger.debug(f"Unknown component trace: {self.trace}")
+
+        for part in (self.model_input, self.model_output, self.rationale,
+                     self.invocation_input, self.observation):
+            if isinstance(part, dict) and "traceId" in part:
+                return part["traceId"]
+
+        # Fall back to a generated ID
+        return f"generated-{time.time()}"
+
+    def subtrace(self, component_type: str) -> Dict[str, Any]:
+        """The component trace if this event is of ``component_type``, else {}"""
+        return self.component if self.component_type == component_type else {}
+
+    def __repr__(self) -> str:
+        return f"TraceEvent({self.component_type}, {self.trace_id})"
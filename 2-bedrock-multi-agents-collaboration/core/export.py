@@ -0,0 +1,235 @@
+"""
+Background span export pipeline.
+
+Finished spans are put on a bounded in-memory queue and exported in batches
+by a worker thread, so the request path never waits on the OTLP round trip.
+When the queue is full the configured overflow policy decides whether the
+newest span is dropped, the oldest queued span is evicted, or the caller is
+briefly blocked (backpressure).
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor
+from opentelemetry.sdk.trace.export import SpanExporter
+
+# Initialize logging
+logger = logging.getLogger(__name__)
+
+
+class OverflowPolicy:
+    """What to do with a finished span when the export queue is full"""
+    DROP_NEWEST = "drop_newest"
+    DROP_OLDEST = "drop_oldest"
+    BLOCK = "block"
+
+    ALL = (DROP_NEWEST, DROP_OLDEST, BLOCK)
+
+
+class ExportPipelineMetrics:
+    """Counters describing the health of the export pipeline"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.enqueued_spans = 0
+        self.exported_spans = 0
+        self.dropped_spans = 0
+        self.failed_spans = 0
+        self.export_batches = 0
+        self.last_export_latency_ms = 0.0
+        self.total_export_latency_ms = 0.0
+
+    def record_enqueue(self, depth: int):
+        with self._lock:
+            self.enqueued_spans += 1
+            self.queue_depth = depth
+            if depth > self.max_queue_depth:
+                self.max_queue_depth = depth
+
+    def record_drop(self, count: int = 1):
+        with self._lock:
+            self.dropped_spans += count
+
+    def record_export(self, batch_size: int, latency_ms: float, success: bool, depth: int):
+        with self._lock:
+            self.export_batches += 1
+            self.queue_depth = depth
+            self.last_export_latency_ms = latency_ms
+            self.total_export_latency_ms += latency_ms
+            if success:
+                self.exported_spans += batch_size
+            else:
+                self.failed_spans += batch_size
+
+    def snapshot(self) -> Dict[str, float]:
+        """Return a consistent copy of all counters"""
+        with self._lock:
+            batches = self.export_batches
+            return {
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "enqueued_spans": self.enqueued_spans,
+                "exported_spans": self.exported_spans,
+                "dropped_spans": self.dropped_spans,
+                "failed_spans": self.failed_spans,
+                "export_batches": batches,
+                "last_export_latency_ms": round(self.last_export_latency_ms, 3),
+                "avg_export_latency_ms": round(
+                    self.total_export_latency_ms / batches, 3) if batches else 0.0,
+            }
+
+
+class BackgroundExportProcessor(SpanProcessor):
+    """Span processor exporting finished spans from a bounded queue on a worker thread."""
+
+    def __init__(
+        self,
+        exporter: SpanExporter,
+        max_queue_size: Optional[int] = None,
+        max_export_batch_size: Optional[int] = None,
+        schedule_delay_millis: Optional[float] = None,
+        overflow_policy: Optional[str] = None,
+        block_timeout_millis: float = 50,
+    ):
+        # Defaults follow the standard OTEL_BSP_* batch processor variables
+        self._exporter = exporter
+        self._max_queue_size = max_queue_size or int(
+            os.environ.get("OTEL_BSP_MAX_QUEUE_SIZE", 2048))
+        self._max_batch_size = max_export_batch_size or int(
+            os.environ.get("OTEL_BSP_MAX_EXPORT_BATCH_SIZE", 512))
+        self._schedule_delay = (schedule_delay_millis or float(
+            os.environ.get("OTEL_BSP_SCHEDULE_DELAY", 5000))) / 1000
+        self._overflow_policy = overflow_policy or os.environ.get(
+            "BEDROCK_AGENT_EXPORT_OVERFLOW", OverflowPolicy.DROP_NEWEST)
+        if self._overflow_policy not in OverflowPolicy.ALL:
+            raise ValueError(
+                f"Unknown overflow policy {self._overflow_policy!r}, "
+                f"expected one of {OverflowPolicy.ALL}"
+            )
+        self._block_timeout = block_timeout_millis / 1000
+
+        self.metrics = ExportPipelineMetrics()
+        self._queue: deque = deque()
+        lock = threading.Lock()
+        self._condition = threading.Condition(lock)
+        self._not_full = threading.Condition(lock)
+        self._flush_requested = False
+        self._flush_generation = 0
+        self._exported_generation = 0
+        self._shutdown = False
+
+        self._worker = threading.Thread(
+            name="BedrockAgentSpanExporter", target=self._run, daemon=True
+        )
+        self._worker.start()
+
+    @property
+    def overflow_policy(self) -> str:
+        return self._overflow_policy
+
+    def on_start(self, span, parent_context=None) -> None:
+        pass
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if self._shutdown or not span.context.trace_flags.sampled:
+            return
+
+        with self._condition:
+            if len(self._queue) >= self._max_queue_size:
+                if not self._make_room():
+                    self.metrics.record_drop()
+                    return
+            self._queue.append(span)
+            depth = len(self._queue)
+            if depth >= self._max_batch_size:
+                self._condition.notify_all()
+        self.metrics.record_enqueue(depth)
+
+    def _make_room(self) -> bool:
+        """Apply the overflow policy with the lock held; False drops the new span"""
+        if self._overflow_policy == OverflowPolicy.DROP_OLDEST:
+            self._queue.popleft()
+            self.metrics.record_drop()
+            return True
+        if self._overflow_policy == OverflowPolicy.BLOCK:
+            self._condition.notify_all()
+            return self._not_full.wait_for(
+                lambda: len(self._queue) < self._max_queue_size or self._shutdown,
+                timeout=self._block_timeout,
+            ) and not self._shutdown
+        return False
+
+    def request_flush(self) -> int:
+        """Wake the worker to export everything queued so far, without waiting"""
+        with self._condition:
+            self._flush_requested = True
+            self._flush_generation += 1
+            self._condition.notify_all()
+            return self._flush_generation
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        """Export everything queued so far and wait for it (shutdown/CLI use)"""
+        generation = self.request_flush()
+        deadline = time.monotonic() + timeout_millis / 1000
+        with self._condition:
+            while self._exported_generation < generation:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._worker.is_alive():
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def shutdown(self) -> None:
+        if self._shutdown:
+            return
+        self.force_flush()
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        self._worker.join(timeout=self._schedule_delay + 5)
+        self._exporter.shutdown()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._queue and not self._flush_requested and not self._shutdown:
+                    self._condition.wait(self._schedule_delay)
+                if self._shutdown and not self._queue:
+                    return
+                generation = self._flush_generation
+                self._flush_requested = False
+                batches = self._drain()
+
+            for batch in batches:
+                self._export(batch)
+
+            with self._condition:
+                self._exported_generation = max(self._exported_generation, generation)
+                self._condition.notify_all()
+
+    def _drain(self) -> List[List[ReadableSpan]]:
+        """Take every queued span in export-sized batches (lock held)"""
+        batches = []
+        while self._queue:
+            size = min(self._max_batch_size, len(self._queue))
+            batches.append([self._queue.popleft() for _ in range(size)])
+        self._not_full.notify_all()
+        return batches
+
+    def _export(self, batch: List[ReadableSpan]):
+        start = time.perf_counter()
+        success = False
+        try:
+            result = self._exporter.export(batch)
+            success = getattr(result, "name", "") == "SUCCESS"
+        except Exception as e:
+            logger.warning(f"Span export failed: {e}")
+        latency_ms = (time.perf_counter() - start) * 1000
+        self.metrics.record_export(len(batch), latency_ms, success, len(self._queue))
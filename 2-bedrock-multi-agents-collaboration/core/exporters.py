@@ -0,0 +1,192 @@
+"""
+Span exporters for the export pipeline.
+
+``build_exporter`` selects the exporter behind the background export queue,
+by name or from ``BEDROCK_AGENT_EXPORTER``:
+
+    otlp    OTLP/HTTP protobuf to OTEL_EXPORTER_OTLP_ENDPOINT, gzip-compressed
+            unless OTEL_EXPORTER_OTLP_COMPRESSION says otherwise (default)
+    file    local file at BEDROCK_AGENT_EXPORT_FILE (default spans.jsonl); one
+            JSON span per line, or length-prefixed OTLP protobuf requests if
+            the path ends in .pb (BEDROCK_AGENT_EXPORT_FILE_FORMAT overrides)
+    memory  spans kept in memory (InMemorySpanExporter), for tests
+    none    no exporter; metrics are still recorded
+
+The file exporter counts the bytes it writes, so export size per span can be
+measured offline; ``read_span_file`` reads either format back, resolving it
+the same way (pass ``file_format`` if the file was written with an override).
+"""
+
+import json
+import logging
+import os
+import struct
+import threading
+from typing import Dict, Iterator, Optional, Sequence
+
+from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+from opentelemetry.exporter.otlp.proto.http import Compression
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import ExportTraceServiceRequest
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+# Initialize logging
+logger = logging.getLogger(__name__)
+
+
+class ExporterKind:
+    """Exporters build_exporter can create"""
+    OTLP = "otlp"
+    FILE = "file"
+    MEMORY = "memory"
+    NONE = "none"
+
+    ALL = (OTLP, FILE, MEMORY, NONE)
+
+
+class FileFormat:
+    """Encodings of the file exporter"""
+    JSONL = "jsonl"
+    PROTOBUF = "protobuf"
+
+    ALL = (JSONL, PROTOBUF)
+
+
+# Length prefix of each protobuf record (big-endian uint32)
+_LENGTH = struct.Struct(">I")
+
+
+def resolve_file_format(path: str, file_format: Optional[str] = None) -> str:
+    """The file exporter's format for ``path``: ``file_format``, else
+    BEDROCK_AGENT_EXPORT_FILE_FORMAT, else protobuf for a .pb path"""
+    file_format = file_format or os.environ.get("BEDROCK_AGENT_EXPORT_FILE_FORMAT") or (
+        FileFormat.PROTOBUF if path.endswith(".pb") else FileFormat.JSONL)
+    if file_format not in FileFormat.ALL:
+        raise ValueError(
+            f"Unknown export file format {file_format!r}, expected one of {FileFormat.ALL}"
+        )
+    return file_format
+
+
+class FileSpanExporter(SpanExporter):
+    """Appends finished spans to a local file, as JSON Lines or OTLP protobuf"""
+
+    def __init__(self, path: Optional[str] = None, file_format: Optional[str] = None):
+        self.path = path or os.environ.get("BEDROCK_AGENT_EXPORT_FILE", "spans.jsonl")
+        self.file_format = resolve_file_format(self.path, file_format)
+        self._lock = threading.Lock()
+        self._file = open(self.path, "ab")
+        self.spans_written = 0
+        self.bytes_written = 0
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        if self.file_format == FileFormat.PROTOBUF:
+            payload = encode_spans(spans).SerializeToString()
+            data = _LENGTH.pack(len(payload)) + payload
+        else:
+            data = "".join(span.to_json(indent=None) + "\n" for span in spans).encode("utf-8")
+        try:
+            with self._lock:
+                if self._file is None:
+                    return SpanExportResult.FAILURE
+                self._file.write(data)
+                self.spans_written += len(spans)
+                self.bytes_written += len(data)
+        except OSError as e:
+            logger.error(f"Could not write spans to {self.path}: {e}")
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+        return True
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self) -> Dict[str, float]:
+        """Spans and bytes written so far"""
+        with self._lock:
+            spans = self.spans_written
+            return {
+                "spans_written": spans,
+                "bytes_written": self.bytes_written,
+                "bytes_per_span": round(self.bytes_written / spans, 1) if spans else 0.0,
+            }
+
+
+def read_span_file(path: str, file_format: Optional[str] = None) -> Iterator[dict]:
+    """Yield the spans of a file exporter output as dicts.
+
+    The format is resolved like the exporter's (``file_format``, else
+    BEDROCK_AGENT_EXPORT_FILE_FORMAT, else the extension); pass the one the
+    file was written with when reading it elsewhere. JSON Lines files yield
+    the SDK's span JSON; protobuf files yield one ExportTraceServiceRequest
+    per export batch, converted with MessageToDict.
+    """
+    if resolve_file_format(path, file_format) == FileFormat.JSONL:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    from google.protobuf.json_format import MessageToDict
+
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(_LENGTH.size)
+            if len(header) < _LENGTH.size:
+                return
+            request = ExportTraceServiceRequest()
+            request.ParseFromString(f.read(_LENGTH.unpack(header)[0]))
+            yield MessageToDict(request)
+
+
+def _otlp_compression() -> Compression:
+    value = (os.environ.get("OTEL_EXPORTER_OTLP_TRACES_COMPRESSION")
+             or os.environ.get("OTEL_EXPORTER_OTLP_COMPRESSION") or "gzip")
+    try:
+        return Compression(value.strip().lower())
+    except ValueError:
+        logger.warning(f"Unknown OTLP compression {value!r}, using gzip")
+        return Compression.Gzip
+
+
+def build_exporter(
+    kind: Optional[str] = None,
+    endpoint: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None,
+    file_path: Optional[str] = None,
+) -> Optional[SpanExporter]:
+    """Create the configured exporter, or None if there is nothing to export to"""
+    kind = kind or os.environ.get("BEDROCK_AGENT_EXPORTER", ExporterKind.OTLP)
+    if kind not in ExporterKind.ALL:
+        raise ValueError(f"Unknown exporter {kind!r}, expected one of {ExporterKind.ALL}")
+
+    if kind == ExporterKind.FILE:
+        return FileSpanExporter(file_path)
+    if kind == ExporterKind.MEMORY:
+        return InMemorySpanExporter()
+    if kind == ExporterKind.NONE:
+        return None
+
+    if not (endpoint or os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT")
+            or os.environ.get("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT")):
+        logger.warning("No telemetry endpoint configured, spans will not be exported "
+                       "(set OTEL_EXPORTER_OTLP_ENDPOINT or BEDROCK_AGENT_EXPORTER=file)")
+        return None
+
+    # An explicit endpoint is the full traces URL; otherwise the exporter
+    # derives it (and the headers) from the OTEL_* environment variables
+    if endpoint:
+        return OTLPSpanExporter(endpoint=endpoint, headers=headers,
+                                compression=_otlp_compression())
+    return OTLPSpanExporter(headers=headers or None, compression=_otlp_compression())
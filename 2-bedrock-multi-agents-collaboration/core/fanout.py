@@ -0,0 +1,168 @@
+"""
+Concurrent invocation of several Bedrock Agents.
+
+``fan_out`` calls an instrumented invoke function once per agent on a thread
+pool. Every call runs in a copy of the caller's context, so the agent's root
+span is a child of a shared ``Bedrock Agent fan-out`` span (and of whatever
+span was current when ``fan_out`` was called) and each call gets its own
+InvocationContext, exactly as a serial call would.
+
+    results = fan_out(invoke_bedrock_agent, {
+        "forecast": forecast_kwargs,
+        "solar": solar_kwargs,
+    })
+    first = fan_out(invoke_bedrock_agent, invocations, mode=FanOutMode.FIRST)
+
+Use non-streaming invocations: a streamed completion is only traced while it
+is consumed, so its root span would stay open until the caller drains it.
+"""
+
+import contextvars
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from opentelemetry import trace
+from opentelemetry.trace import Status, StatusCode
+
+from .timing import elapsed_ms, perf_ns
+
+# Initialize logging
+logger = logging.getLogger(__name__)
+
+tracer = trace.get_tracer("bedrock-agent-tracing")
+
+
+class FanOutMode:
+    """How fan_out combines the agents' results"""
+    ALL = "all"  # wait for every agent, results in input order
+    FIRST = "first"  # return the first successful result
+
+    MODES = (ALL, FIRST)
+
+
+class FanOutResult:
+    """The outcome of one agent invocation within a fan-out"""
+
+    __slots__ = ("name", "result", "error", "elapsed_ms")
+
+    def __init__(self, name: str, result: Any = None, error: Optional[BaseException] = None,
+                 elapsed_ms: float = 0.0):
+        self.name = name
+        self.result = result
+        self.error = error
+        self.elapsed_ms = elapsed_ms
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self) -> str:
+        state = "ok" if self.ok else f"error={self.error!r}"
+        return f"FanOutResult({self.name}, {state}, {self.elapsed_ms} ms)"
+
+
+def _invoke(name: str, invoke: Callable[..., Any], kwargs: Dict[str, Any]) -> FanOutResult:
+    started = perf_ns()
+    try:
+        result = invoke(**kwargs)
+        # instrument_agent_invocation reports failures as {"error": ...}
+        if isinstance(result, dict) and "error" in result and "completion" not in result:
+            raise RuntimeError(result["error"])
+    except Exception as e:
+        logger.error(f"Agent {name} failed: {e}")
+        return FanOutResult(name, error=e, elapsed_ms=elapsed_ms(started, perf_ns(), 2))
+    return FanOutResult(name, result=result, elapsed_ms=elapsed_ms(started, perf_ns(), 2))
+
+
+def fan_out(
+    invoke: Callable[..., Any],
+    invocations: Dict[str, Dict[str, Any]],
+    mode: str = FanOutMode.ALL,
+    max_workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Union[List[FanOutResult], Optional[FanOutResult]]:
+    """Invoke several agents concurrently.
+
+    Args:
+        invoke: Instrumented invoke function, called as invoke(**kwargs)
+        invocations: Keyword arguments per agent, keyed by a display name
+        mode: FanOutMode.ALL returns every FanOutResult in input order;
+            FanOutMode.FIRST returns the first successful one (or the last
+            failure), leaving slower agents to finish in the background
+        max_workers: Thread pool size, defaults to one thread per agent
+        timeout: Seconds to wait; agents still running are reported as
+            failed with a TimeoutError
+
+    Returns:
+        A list of FanOutResult for ALL, a single FanOutResult for FIRST
+    """
+    if mode not in FanOutMode.MODES:
+        raise ValueError(f"Unknown fan-out mode {mode!r}, expected one of {FanOutMode.MODES}")
+    if not invocations:
+        return [] if mode == FanOutMode.ALL else None
+
+    with tracer.start_as_current_span(
+        "Bedrock Agent fan-out",
+        attributes={
+            "fanout.mode": mode,
+            "fanout.agent_count": len(invocations),
+            "fanout.agents": list(invocations),
+        },
+    ) as span:
+        executor = ThreadPoolExecutor(
+            max_workers=max_workers or len(invocations),
+            thread_name_prefix="BedrockAgentFanOut",
+        )
+        futures = {}
+        for name, kwargs in invocations.items():
+            # A context can only be entered by one thread at a time, so every
+            # call gets its own copy (carrying the fan-out span as parent)
+            context = contextvars.copy_context()
+            futures[executor.submit(context.run, _invoke, name, invoke, kwargs)] = name
+
+        try:
+            if mode == FanOutMode.FIRST:
+                result = _first(futures, timeout)
+                span.set_attribute("fanout.winner", result.name)
+                span.set_attribute("fanout.winner_ms", result.elapsed_ms)
+                failed = 0 if result.ok else len(futures)
+                outcome = result
+            else:
+                done, _ = wait(futures, timeout=timeout)
+                results = [
+                    future.result() if future in done else FanOutResult(
+                        name, error=TimeoutError(f"Agent {name} did not finish in {timeout}s"))
+                    for future, name in futures.items()
+                ]
+                failed = sum(1 for result in results if not result.ok)
+                outcome = results
+        finally:
+            # Do not wait for agents that are still running (FIRST or timeout)
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        span.set_attribute("fanout.failed", failed)
+        if failed == len(futures):
+            span.set_status(Status(StatusCode.ERROR, "All agent invocations failed"))
+        else:
+            span.set_status(Status(StatusCode.OK))
+        return outcome
+
+
+def _first(futures, timeout: Optional[float]) -> FanOutResult:
+    deadline = None if timeout is None else time.monotonic() + timeout
+    pending = set(futures)
+    last = None
+    while pending:
+        remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            last = future.result()
+            if last.ok:
+                return last
+    if last is None or pending:
+        return FanOutResult("", error=TimeoutError(f"No agent finished in {timeout}s"))
+    return last
@@ -30,9 +30,10 @@ from opentelemetry.trace import Status, StatusCode, SpanKind
 
 from .constants import SpanAttributes, SpanKindValues
 from .tracing import set_span_attributes
+from .attributes import prompt_of, set_attribute, set_prompt
 from typing import Dict, Any
-from .timer_lib import timer
-from .agent import extract_trace_id
+from .context import GuardrailAggregate, current_invocation, trace_event
+from .timing import now, set_span_times
 import time
 
 # Initialize logging
@@ -41,14 +42,12 @@ logger = logging.getLogger(__name__)
 tracer = None
 
 
-def set_span_timing(span, start_time_iso, end_time_iso, latency_ms, span_key=None):
+def set_span_timing(span, start_time, end_time, latency_ms, span_key=None):
     """Safely set span timing if not already set"""
-    from .agent import span_manager
+    span_manager = current_invocation().span_manager
 
     if span_key and span_manager.can_set_timing(span_key):
-        span.set_attribute(SpanAttributes.SPAN_START_TIME, start_time_iso)
-        span.set_attribute(SpanAttributes.SPAN_END_TIME, end_time_iso)
-        span.set_attribute(SpanAttributes.SPAN_DURATION, latency_ms)
+        set_span_times(span, start_time, end_time, latency_ms)
         span_manager.protect_span_timing(span_key)
         return True
     return False
@@ -62,9 +61,9 @@ def set_tracer(tracer_instance):
 
 def handle_preprocessing(trace_data: Dict[str, Any], parent_span):
     """Handle pre-processing trace events with proper L2-L3-L4 hierarchy"""
+    event = trace_event(trace_data)
     # Extract preprocessing trace data from the full trace object
-    preprocessing_trace = trace_data.get(
-        "trace", {}).get("preProcessingTrace", {})
+    preprocessing_trace = event.subtrace("preprocessing")
     # Extract trace ID from preprocessing trace
     trace_id = None
     if "modelInvocationOutput" in preprocessing_trace:
@@ -77,8 +76,8 @@ def handle_preprocessing(trace_data: Dict[str, Any], parent_span):
     else:
         trace_id = f"preprocessing-{time.time()}"
     # Create L2 preprocessing span
-    start_time, end_time, duration = timer.check_start_time(
-        "handle_preprocessing", trace_data, trace_id
+    start_time, end_time, duration = current_invocation().timer.check_start_time(
+        "handle_preprocessing", event, trace_id
     )
     preprocessing_span = tracer.start_span(
         name="pre_processing",
@@ -88,12 +87,10 @@ def handle_preprocessing(trace_data: Dict[str, Any], parent_span):
             SpanAttributes.TRACE_ID: trace_id,
             "trace.type": "PRE_PROCESSING",
             SpanAttributes.LLM_SYSTEM: "preprocessing",
-            SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-            ),
+            SpanAttributes.LLM_REQUEST_MODEL: current_invocation().model_id,
             SpanAttributes.SPAN_NAME: "pre_processing",
-            "stream_mode": parent_span.attributes.get("stream_mode", False),
-            "metadata.streaming": parent_span.attributes.get(
+            "stream_mode": current_invocation().stream_mode,
+            "metadata.streaming": current_invocation().root_attributes.get(
                 "metadata.streaming", False
             ),
         },
@@ -113,7 +110,7 @@ def handle_preprocessing(trace_data: Dict[str, Any], parent_span):
     set_span_timing(preprocessing_span, start_time,
                     end_time, duration, span_key)
     # Register the span in span_manager
-    from .agent import span_manager
+    span_manager = current_invocation().span_manager
     if not preprocessing_span.is_recording():
         print("Preprocessing span is not recording")
         preprocessing_span.start()
@@ -129,14 +126,12 @@ def handle_preprocessing(trace_data: Dict[str, Any], parent_span):
                 "model.input.type": model_input.get("type", "PRE_PROCESSING"),
             },
         )
-        preprocessing_span.set_attribute(
-            SpanAttributes.LLM_PROMPTS, model_input.get("text", "")
-        )
+        set_prompt(preprocessing_span, model_input.get("text", ""))
         # Add inference configuration if available
         if "inferenceConfiguration" in model_input:
-            preprocessing_span.set_attribute(
-                "model.input.inference_configuration",
-                json.dumps(model_input["inferenceConfiguration"]),
+            set_attribute(
+                preprocessing_span, "model.input.inference_configuration",
+                model_input["inferenceConfiguration"]
             )
     # Check if we also have output data already in this trace
     if "modelInvocationOutput" in preprocessing_trace:
@@ -145,8 +140,8 @@ def handle_preprocessing(trace_data: Dict[str, Any], parent_span):
 
 def update_preprocessing_span(trace_data: Dict[str, Any], preprocessing_span):
     """Update an existing preprocessing span with output data"""
-    preprocessing_trace = trace_data.get(
-        "trace", {}).get("preProcessingTrace", {})
+    event = trace_event(trace_data)
+    preprocessing_trace = event.subtrace("preprocessing")
     # Only process output updates
     if "modelInvocationOutput" not in preprocessing_trace:
         return
@@ -154,11 +149,11 @@ def update_preprocessing_span(trace_data: Dict[str, Any], preprocessing_span):
     # Get trace ID for span key
     trace_id = model_output.get("traceId", "unknown")
     span_key = f"preprocessing:{trace_id}"
-    start_time, end_time, duration = timer.check_start_time(
-        "update_preprocessing", trace_data, trace_id
+    start_time, end_time, duration = current_invocation().timer.check_start_time(
+        "update_preprocessing", event, trace_id
     )
-    pre_start_time, pre_end_time, pre_duration = timer.check_start_time(
-        "handle_preprocessing", trace_data, trace_id
+    pre_start_time, pre_end_time, pre_duration = current_invocation().timer.check_start_time(
+        "handle_preprocessing", event, trace_id
     )
     # Update timing only if not protected
     set_span_timing(
@@ -171,9 +166,7 @@ def update_preprocessing_span(trace_data: Dict[str, Any], preprocessing_span):
         kind=SpanKind.CLIENT,
         attributes={
             SpanAttributes.LLM_SYSTEM: "aws.bedrock",
-            SpanAttributes.LLM_REQUEST_MODEL: preprocessing_span.attributes.get(
-                SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-            ),
+            SpanAttributes.LLM_REQUEST_MODEL: current_invocation().model_id,
             "trace.part": "preprocessing",
         },
         context=trace.set_span_in_context(preprocessing_span),
@@ -189,9 +182,7 @@ def update_preprocessing_span(trace_data: Dict[str, Any], preprocessing_span):
             set_span_attributes(
                 llm_span,
                 {
-                    SpanAttributes.LLM_PROMPTS: preprocessing_span.attributes.get(
-                        "model.input.text"
-                    ),
+                    SpanAttributes.LLM_PROMPTS: prompt_of(preprocessing_span, None),
                     SpanAttributes.LLM_USAGE_PROMPT_TOKENS: input_tokens,
                     SpanAttributes.LLM_USAGE_COMPLETION_TOKENS: output_tokens,
                     SpanAttributes.LLM_USAGE_TOTAL_TOKENS: total_tokens,
@@ -209,8 +200,8 @@ def update_preprocessing_span(trace_data: Dict[str, Any], preprocessing_span):
         # Add raw response to LLM span
         if "rawResponse" in model_output:
             raw_content = model_output["rawResponse"].get("content", "")
-            llm_span.set_attribute(SpanAttributes.LLM_COMPLETIONS, raw_content)
-            preprocessing_span.set_attribute("model.output", raw_content)
+            set_attribute(llm_span, SpanAttributes.LLM_COMPLETIONS, raw_content)
+            set_attribute(preprocessing_span, "model.output", raw_content)
         # Create L4 assessment span as child of LLM span
         with tracer.start_as_current_span(
             name="pre_proccessing_output",
@@ -228,7 +219,7 @@ def update_preprocessing_span(trace_data: Dict[str, Any], preprocessing_span):
             # Add metadata
             if "metadata" in model_output:
                 metadata = model_output["metadata"]
-                assessment_span.set_attribute("metadata", json.dumps(metadata))
+                set_attribute(assessment_span, "metadata", metadata)
                 # Add token usage directly
                 if "usage" in metadata:
                     usage = metadata["usage"]
@@ -241,15 +232,15 @@ def update_preprocessing_span(trace_data: Dict[str, Any], preprocessing_span):
             # Add parsed response
             if "parsedResponse" in model_output:
                 parsed_response = model_output["parsedResponse"]
-                assessment_span.set_attribute(
-                    "parsedResponse", json.dumps(parsed_response)
+                set_attribute(
+                    assessment_span, "parsedResponse", parsed_response
                 )
                 assessment_span.set_attribute(
                     "isValid", parsed_response.get("isValid"))
                 # Add rationale directly
                 if "rationale" in parsed_response:
-                    assessment_span.set_attribute(
-                        SpanAttributes.LLM_COMPLETIONS, parsed_response["rationale"]
+                    set_attribute(
+                        assessment_span, SpanAttributes.LLM_COMPLETIONS, parsed_response["rationale"]
                     )
                 # Set status based on isValid
                 is_valid = parsed_response.get("isValid", True)
@@ -269,36 +260,33 @@ def handle_llm_invocation(
     trace_data: Dict[str, Any], parent_span, parent_component: str
 ):
     """Handle LLM invocation - fixes duplicate LLM spans issue"""
-    trace_id = extract_trace_id(trace_data)
+    event = trace_event(trace_data)
+    trace_id = event.trace_id
     name = f"{parent_component}_llm"
-    start_time, end_time, duration = timer.check_start_time(
-        name, trace_data, trace_id)
+    start_time, end_time, duration = current_invocation().timer.check_start_time(
+        name, event, trace_id)
     # Determine which component and get trace from the full trace object
     if parent_component == "orchestration":
-        component_trace = trace_data.get(
-            "trace", {}).get("orchestrationTrace", {})
+        component_trace = event.subtrace("orchestration")
         output_span_name = "OrchestrationModelInvocationOutput"
     else:
-        component_trace = trace_data.get(
-            "trace", {}).get("postProcessingTrace", {})
+        component_trace = event.subtrace("postprocessing")
         output_span_name = "PostProcessingModelInvocationOutput"
     # Store input on parent span instead of creating a separate LLM span
     if "modelInvocationInput" in component_trace:
         model_input = component_trace["modelInvocationInput"]
         # parent_span.set_attribute("model.input.text", model_input.get("text", ""))
-        parent_span.set_attribute(
-            SpanAttributes.LLM_PROMPTS, model_input.get("text", "")
-        )
+        set_prompt(parent_span, model_input.get("text", ""))
         if "inferenceConfiguration" in model_input:
-            parent_span.set_attribute(
-                "model.input.inference_configuration",
-                json.dumps(model_input["inferenceConfiguration"]),
+            set_attribute(
+                parent_span, "model.input.inference_configuration",
+                model_input["inferenceConfiguration"]
             )
     # Create LLM span only for output
     llm_span = None
     if "modelInvocationOutput" in component_trace:
         model_output = component_trace["modelInvocationOutput"]
-        prompt = parent_span.attributes.get(SpanAttributes.LLM_PROMPTS, "")
+        prompt = prompt_of(parent_span)
         parent_context = trace.set_span_in_context(parent_span)
         # Use the parent context explicitly - this is the key fix
         with tracer.start_as_current_span(
@@ -306,10 +294,7 @@ def handle_llm_invocation(
             kind=SpanKind.CLIENT,
             attributes={
                 SpanAttributes.LLM_SYSTEM: "aws.bedrock",
-                SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                    SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-                ),
-                SpanAttributes.LLM_PROMPTS: prompt,
+                SpanAttributes.LLM_REQUEST_MODEL: current_invocation().model_id,
                 "trace.part": parent_component,
                 SpanAttributes.SPAN_NAME: f"{parent_component}_llm",
                 SpanAttributes.SPAN_START_TIME: start_time,
@@ -319,6 +304,7 @@ def handle_llm_invocation(
             context=parent_context,
         ) as current_llm_span:
             llm_span = current_llm_span
+            set_attribute(llm_span, SpanAttributes.LLM_PROMPTS, prompt)
             # Add token usage information
             if "metadata" in model_output and "usage" in model_output["metadata"]:
                 usage = model_output["metadata"]["usage"]
@@ -344,14 +330,14 @@ def handle_llm_invocation(
             # Add raw response
             if "rawResponse" in model_output:
                 raw_content = model_output["rawResponse"].get("content", "")
-                llm_span.set_attribute(
-                    SpanAttributes.LLM_COMPLETIONS, raw_content)
-                parent_span.set_attribute("model.output", raw_content)
+                set_attribute(
+                    llm_span, SpanAttributes.LLM_COMPLETIONS, raw_content)
+                set_attribute(parent_span, "model.output", raw_content)
             else:
                 raw_content = model_output["parsedResponse"].get("text", "")
-                llm_span.set_attribute(
-                    SpanAttributes.LLM_COMPLETIONS, raw_content)
-                parent_span.set_attribute("model.output", raw_content)
+                set_attribute(
+                    llm_span, SpanAttributes.LLM_COMPLETIONS, raw_content)
+                set_attribute(parent_span, "model.output", raw_content)
 
             # Create L4 model output span (child of llm span)
             with tracer.start_as_current_span(
@@ -361,9 +347,7 @@ def handle_llm_invocation(
                     SpanAttributes.OPERATION_NAME: SpanKindValues.TASK,
                     "trace.type": f"{parent_component.upper()}_MODEL_OUTPUT",
                     "trace.part": parent_component,
-                    SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                        SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-                    ),
+                    SpanAttributes.LLM_REQUEST_MODEL: current_invocation().model_id,
                     SpanAttributes.LLM_SYSTEM: f"bedrock-{parent_component}",
                     SpanAttributes.SPAN_NAME: f"{parent_component}_output",
                     SpanAttributes.SPAN_START_TIME: start_time,
@@ -378,19 +362,19 @@ def handle_llm_invocation(
                 if "rawResponse" in model_output:
                     raw_content = model_output["rawResponse"].get(
                         "content", "")
-                    output_span.set_attribute(
-                        SpanAttributes.LLM_PROMPTS, prompt)
-                    output_span.set_attribute(
-                        SpanAttributes.LLM_COMPLETIONS, raw_content
+                    set_attribute(
+                        output_span, SpanAttributes.LLM_PROMPTS, prompt)
+                    set_attribute(
+                        output_span, SpanAttributes.LLM_COMPLETIONS, raw_content
                     )
-                    output_span.set_attribute("output", raw_content)
+                    set_attribute(output_span, "output", raw_content)
 
                 # Add metadata
                 if "metadata" in model_output:
                     metadata = model_output["metadata"]
                     # print("Metadata:", metadata)
-                    output_span.set_attribute(
-                        "metadata", json.dumps(metadata, default=str))
+                    set_attribute(
+                        output_span, "metadata", metadata)
 
                     # Add token usage directly
                     if "usage" in metadata:
@@ -405,8 +389,8 @@ def handle_llm_invocation(
                 # Add parsed response
                 if "parsedResponse" in model_output:
                     parsed_response = model_output["parsedResponse"]
-                    output_span.set_attribute(
-                        "parsedResponse", json.dumps(parsed_response)
+                    set_attribute(
+                        output_span, "parsedResponse", parsed_response
                     )
 
                     # Set result output
@@ -414,52 +398,27 @@ def handle_llm_invocation(
                         parent_component == "postprocessing"
                         and "text" in parsed_response
                     ):
-                        output_span.set_attribute(
-                            "result", parsed_response["text"])
-                        parent_span.set_attribute(
-                            "result", parsed_response["text"])
-                        llm_span.set_attribute(
-                            "result", parsed_response["text"])
+                        set_attribute(
+                            output_span, "result", parsed_response["text"])
+                        set_attribute(
+                            parent_span, "result", parsed_response["text"])
+                        set_attribute(
+                            llm_span, "result", parsed_response["text"])
 
             # Set LLM span status
             llm_span.set_status(Status(StatusCode.OK))
-    else:
-        # no modelInvocationOutput
-        print(
-            f"Warning: No modelInvocationOutput found in {parent_component} trace data")
-        # print(
-        #    f"Trace data: {json.dumps(component_trace, indent=2, default=str)}")
-        model_input = component_trace["modelInvocationInput"]
-        foundationModel = ""
-        if "foundationModel" in model_input:
-            if model_input["foundationModel"]:
-                foundationModel = model_input["foundationModel"]
-        span_no_modelInvocationInput = tracer.start_span(
-            name="no-modelInvocationOutput",
-            kind=SpanKind.CLIENT,
-            attributes={
-                SpanAttributes.OPERATION_NAME: SpanKindValues.DATABASE,
-                "trace.type": "KNOWLEDGE_BASE_LOOKUP-INVOCATION_INPUT",
-                 SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                     SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-                 ),
-                "foundationModel": foundationModel
-            },
-            context=trace.set_span_in_context(parent_span),
-        )
-        span_no_modelInvocationInput.start()
 
 
 def handle_rationale(
     trace_data: Dict[str, Any], parent_span, llm_span=None, is_orphaned=False
 ):
     """Handle rationale span creation at L3 level after LLM span"""
-    trace_id = extract_trace_id(trace_data)
-    start_time, end_time, duration = timer.check_start_time(
-        "rationale", trace_data, trace_id
+    event = trace_event(trace_data)
+    trace_id = event.trace_id
+    start_time, end_time, duration = current_invocation().timer.check_start_time(
+        "rationale", event, trace_id
     )
-    orchestration_trace = trace_data.get(
-        "trace", {}).get("orchestrationTrace", {})
+    orchestration_trace = event.subtrace("orchestration")
 
     if "rationale" in orchestration_trace:
         rationale_data = orchestration_trace["rationale"]
@@ -488,8 +447,8 @@ def handle_rationale(
             # Add content
             rationale_span.set_attribute(
                 SpanAttributes.LLM_PROMPTS, "NotApplicable")
-            rationale_span.set_attribute(
-                SpanAttributes.LLM_COMPLETIONS, rationale_data.get("text", "")
+            set_attribute(
+                rationale_span, SpanAttributes.LLM_COMPLETIONS, rationale_data.get("text", "")
             )
             rationale_span.set_status(Status(StatusCode.OK))
     else:
@@ -497,28 +456,16 @@ def handle_rationale(
         logger.warning(
             "No rationale data found in orchestration trace. Skipping rationale span creation."
         )
-        span_no_rationale = tracer.start_span(
-            name="no-rationale",
-            kind=SpanKind.CLIENT,
-            attributes={
-                SpanAttributes.OPERATION_NAME: SpanKindValues.DATABASE,
-                "trace.type": "REASONING",
-                 SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                     SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-                 )
-            },
-            context=trace.set_span_in_context(parent_span),
-        )
-        span_no_rationale.start()
+        parent_span.add_event("no-rationale", {"trace.type": "REASONING"})
 
 
 def handle_knowledge_base(trace_data: Dict[str, Any], parent_span):
     """Handle knowledge base spans (input and output)"""
-    trace_id = extract_trace_id(trace_data)
-    start_time, end_time, duration = timer.check_start_time(
-        "kb", trace_data, trace_id)
-    orchestration_trace = trace_data.get(
-        "trace", {}).get("orchestrationTrace", {})
+    event = trace_event(trace_data)
+    trace_id = event.trace_id
+    start_time, end_time, duration = current_invocation().timer.check_start_time(
+        "kb", event, trace_id)
+    orchestration_trace = event.subtrace("orchestration")
     kb_query = None
     # Handle knowledge base lookup input
     if (
@@ -535,12 +482,8 @@ def handle_knowledge_base(trace_data: Dict[str, Any], parent_span):
             attributes={
                 SpanAttributes.OPERATION_NAME: SpanKindValues.DATABASE,
                 "retrieval.type": "semantic",
-                SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                    SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-                ),
-                SpanAttributes.LLM_PROMPTS: kb_query,
+                SpanAttributes.LLM_REQUEST_MODEL: current_invocation().model_id,
                 "trace.type": "KNOWLEDGE_BASE_LOOKUP",
-                "query": kb_input.get("text", ""),
                 "knowledge_base_id": kb_input.get("knowledgeBaseId", ""),
                 SpanAttributes.SPAN_START_TIME: start_time,
                 SpanAttributes.SPAN_END_TIME: end_time,
@@ -553,6 +496,7 @@ def handle_knowledge_base(trace_data: Dict[str, Any], parent_span):
         #    f"Knowledge Base Lookup Input Span (semantic): {kb_span}, Start Time: {start_time}, End Time: {end_time}, Duration: {duration}")
         # Start the span manually
         kb_span.start()
+        set_prompt(kb_span, kb_query)
 
         # Add richer metadata
         kb_metadata = {
@@ -567,45 +511,26 @@ def handle_knowledge_base(trace_data: Dict[str, Any], parent_span):
         set_span_attributes(
             kb_span,
             {
-                "metadata": json.dumps(kb_metadata),
+                "metadata": kb_metadata,
+                "query": kb_input.get("text", ""),
                 "kb.query.text": kb_input.get("text", ""),
                 "kb.data_source": kb_input.get("dataSource", ""),
-                "kb.filters": json.dumps(kb_input.get("filters", {})),
+                "kb.filters": kb_input.get("filters", {}),
             },
         )
-        from .agent import active_spans
+        active_spans = current_invocation().active_spans
 
         active_spans["kb_span"] = kb_span
-    else:
-        print(
-            "Knowledge Base Lookup Output not found in orchestration trace, skipping span creation"
-        )
-        print(
-            f"Orchestration Trace: {json.dumps(orchestration_trace, indent=2, default=str)}")
-        logger.warning(
-            "KB span not found or not recording, creating a new one")
-        kb_span_not_found = tracer.start_span(
-            name="knowledgeBaseLookupInput-no-invocationInput",
-            kind=SpanKind.CLIENT,
-            attributes={
-                SpanAttributes.OPERATION_NAME: SpanKindValues.DATABASE,
-                "trace.type": "KNOWLEDGE_BASE_LOOKUP-INVOCATION_INPUT",
-                 SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                     SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-                 ),
-            },
-            context=trace.set_span_in_context(parent_span),
-        )
-        kb_span_not_found.start()
 
-    # Handle knowledge base lookup output
+    # Handle knowledge base lookup output; Bedrock sends it in a later event
+    # than the input, which stays open in active_spans["kb_span"] until then
     if (
         "observation" in orchestration_trace
         and "knowledgeBaseLookupOutput" in orchestration_trace["observation"]
     ):
         kb_output = orchestration_trace["observation"]["knowledgeBaseLookupOutput"]
         # Retrieve the previously created kb_span
-        from .agent import active_spans
+        active_spans = current_invocation().active_spans
         kb_span = active_spans.get("kb_span")
         if (
             not kb_span
@@ -621,9 +546,7 @@ def handle_knowledge_base(trace_data: Dict[str, Any], parent_span):
                 attributes={
                     SpanAttributes.OPERATION_NAME: SpanKindValues.DATABASE,
                     "trace.type": "KNOWLEDGE_BASE_LOOKUP",
-                    SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                        SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-                    ),
+                    SpanAttributes.LLM_REQUEST_MODEL: current_invocation().model_id,
                 },
                 context=trace.set_span_in_context(parent_span),
             )
@@ -643,24 +566,22 @@ def handle_knowledge_base(trace_data: Dict[str, Any], parent_span):
                 kb_span
             ),  # Important: attach to kb_span, not parent_span
         ) as kb_result_span:
-            kb_result_span.set_attribute(
-                SpanAttributes.LLM_PROMPTS,
-                kb_span.attributes.get(SpanAttributes.LLM_PROMPTS),
+            set_attribute(
+                kb_result_span, SpanAttributes.LLM_PROMPTS,
+                prompt_of(kb_span, None)
             )
-            kb_result_span.set_attribute(
-                SpanAttributes.LLM_SYSTEM, kb_output.get("text", "")
+            set_attribute(
+                kb_result_span, SpanAttributes.LLM_SYSTEM, kb_output.get("text", "")
             )
             kb_result_span.set_attribute(
                 SpanAttributes.LLM_REQUEST_MODEL,
-                parent_span.attributes.get(
-                    SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-                ),
+                current_invocation().model_id,
             )
             # Add results
             if "retrievedReferences" in kb_output:
                 results = kb_output["retrievedReferences"]
-                kb_result_span.set_attribute(
-                    SpanAttributes.LLM_COMPLETIONS, json.dumps(results)
+                set_attribute(
+                    kb_result_span, SpanAttributes.LLM_COMPLETIONS, results
                 )
                 kb_result_span.set_attribute("result_count", len(results))
 
@@ -686,37 +607,16 @@ def handle_knowledge_base(trace_data: Dict[str, Any], parent_span):
 
         # Clear the reference
         active_spans["kb_span"] = None
-    else:
-        print(
-            "Knowledge Base Lookup Output not found in orchestration trace, skipping span creation"
-        )
-        print(
-            f"Orchestration Trace: {json.dumps(orchestration_trace, indent=2, default=str)}")
-        logger.warning(
-            "KB span not found or not recording, creating a new one")
-        kb_span_not_found = tracer.start_span(
-            name="knowledgeBaseLookupInput-invocationInput",
-            kind=SpanKind.CLIENT,
-            attributes={
-                SpanAttributes.OPERATION_NAME: SpanKindValues.DATABASE,
-                "trace.type": "KNOWLEDGE_BASE_LOOKUP-INVOCATION_INPUT",
-                 SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                     SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-                 ),
-            },
-            context=trace.set_span_in_context(parent_span),
-        )
-        kb_span_not_found.start()
 
 
 def handle_action_group(trace_data: Dict[str, Any], parent_span):
     """Handle action group spans (input and output)"""
-    trace_id = extract_trace_id(trace_data)
-    start_time, end_time, duration = timer.check_start_time(
-        "action_group", trace_data, trace_id
+    event = trace_event(trace_data)
+    trace_id = event.trace_id
+    start_time, end_time, duration = current_invocation().timer.check_start_time(
+        "action_group", event, trace_id
     )
-    orchestration_trace = trace_data.get(
-        "trace", {}).get("orchestrationTrace", {})
+    orchestration_trace = event.subtrace("orchestration")
 
     # Handle action group input - using correct field name: actionGroupInvocationInput
     if (
@@ -736,10 +636,7 @@ def handle_action_group(trace_data: Dict[str, Any], parent_span):
                 "tool.action_group_name": action_input.get("actionGroupName", {}),
                 "tool.function": action_input.get("function", {}),
                 "trace.type": action_input.get("executionType", {}),
-                SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                    SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-                ),
-                "tool.parameters": json.dumps(action_input.get("parameters", {})),
+                SpanAttributes.LLM_REQUEST_MODEL: current_invocation().model_id,
                 SpanAttributes.SPAN_START_TIME: start_time,
                 SpanAttributes.SPAN_END_TIME: end_time,
                 SpanAttributes.SPAN_DURATION: duration,
@@ -755,48 +652,25 @@ def handle_action_group(trace_data: Dict[str, Any], parent_span):
         set_span_attributes(
             action_span,
             {
-                "metadata": json.dumps(
-                    {
-                        "action_group": action_input.get("actionGroup", {}),
-                        "api_schema": action_input.get("apiSchema", {}),
-                        "tool_version": "1.0",
-                    }
-                ),
-                SpanAttributes.LLM_PROMPTS: json.dumps(
-                    action_input.get("parameters", {})
-                ),
+                "metadata": {
+                    "action_group": action_input.get("actionGroup", {}),
+                    "api_schema": action_input.get("apiSchema", {}),
+                    "tool_version": "1.0",
+                },
+                "tool.parameters": action_input.get("parameters", {}),
+                SpanAttributes.LLM_PROMPTS: action_input.get("parameters", {}),
                 SpanAttributes.LLM_COMPLETIONS: "NotApplicable",
             },
         )
 
         # Store the action span in the active_spans dictionary passed from agent.py
         # This will be retrieved later when output arrives
-        from .agent import active_spans
+        active_spans = current_invocation().active_spans
 
         active_spans["action_span"] = action_span
-    else:
-        print(
-            "Knowledge Base Lookup Output not found in orchestration trace, skipping span creation"
-        )
-        print(
-            f"Orchestration Trace: {json.dumps(orchestration_trace, indent=2, default=str)}")
-        logger.warning(
-            "KB span not found or not recording, creating a new one")
-        kb_span_not_found = tracer.start_span(
-            name="ActionGroup-no-invocationInput",
-            kind=SpanKind.CLIENT,
-            attributes={
-                SpanAttributes.OPERATION_NAME: SpanKindValues.DATABASE,
-                "trace.type": "KNOWLEDGE_BASE_LOOKUP-INVOCATION_INPUT",
-                 SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                     SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-                 ),
-            },
-            context=trace.set_span_in_context(parent_span),
-        )
-        kb_span_not_found.start()
 
     # Handle action group output - using correct field name: actionGroupInvocationOutput
+    # It arrives in a later event than the input, kept in active_spans["action_span"]
     if (
         "observation" in orchestration_trace
         and "actionGroupInvocationOutput" in orchestration_trace["observation"]
@@ -806,7 +680,7 @@ def handle_action_group(trace_data: Dict[str, Any], parent_span):
         ]
 
         # Retrieve the previously created action_span
-        from .agent import active_spans
+        active_spans = current_invocation().active_spans
 
         action_span = active_spans.get("action_span")
 
@@ -825,9 +699,7 @@ def handle_action_group(trace_data: Dict[str, Any], parent_span):
                 attributes={
                     SpanAttributes.OPERATION_NAME: SpanKindValues.TOOL,
                     "trace.type": "ACTION_GROUP",
-                    SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                        SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-                    ),
+                    SpanAttributes.LLM_REQUEST_MODEL: current_invocation().model_id,
                     "start_time": end_time,  # In fallback, use end time as start time
                 },
                 context=trace.set_span_in_context(parent_span),
@@ -852,8 +724,8 @@ def handle_action_group(trace_data: Dict[str, Any], parent_span):
             if "text" in action_output:
                 result_span.set_attribute(
                     SpanAttributes.LLM_PROMPTS, "NotApplicable")
-                result_span.set_attribute(
-                    SpanAttributes.LLM_COMPLETIONS, action_output["text"]
+                set_attribute(
+                    result_span, SpanAttributes.LLM_COMPLETIONS, action_output["text"]
                 )
 
         # Set status on action_span
@@ -864,37 +736,16 @@ def handle_action_group(trace_data: Dict[str, Any], parent_span):
 
         # Clear the reference
         active_spans["action_span"] = None
-    else:
-        print(
-            "Knowledge Base Lookup Output not found in orchestration trace, skipping span creation"
-        )
-        print(
-            f"Orchestration Trace: {json.dumps(orchestration_trace, indent=2, default=str)}")
-        logger.warning(
-            "KB span not found or not recording, creating a new one")
-        kb_span_not_found = tracer.start_span(
-            name="ActionGroup-no-observation",
-            kind=SpanKind.CLIENT,
-            attributes={
-                SpanAttributes.OPERATION_NAME: SpanKindValues.DATABASE,
-                "trace.type": "KNOWLEDGE_BASE_LOOKUP-INVOCATION_INPUT",
-                 SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                     SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-                 ),
-            },
-            context=trace.set_span_in_context(parent_span),
-        )
-        kb_span_not_found.start()
 
 
 def handle_code_interpreter(trace_data: Dict[str, Any], parent_span):
     """Handle code interpreter spans (input and output)"""
-    trace_id = extract_trace_id(trace_data)
-    start_time, end_time, duration = timer.check_start_time(
-        "CodeInterpreter", trace_data, trace_id
+    event = trace_event(trace_data)
+    trace_id = event.trace_id
+    start_time, end_time, duration = current_invocation().timer.check_start_time(
+        "CodeInterpreter", event, trace_id
     )
-    orchestration_trace = trace_data.get(
-        "trace", {}).get("orchestrationTrace", {})
+    orchestration_trace = event.subtrace("orchestration")
 
     # Handle code interpreter input
     # Using correct field name: codeInterpreterInvocationInput
@@ -914,13 +765,7 @@ def handle_code_interpreter(trace_data: Dict[str, Any], parent_span):
                 SpanAttributes.OPERATION_NAME: SpanKindValues.TOOL,
                 "tool.name": "CodeInterpreter",
                 "tool.description": "Executes Python code and returns results",
-                SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                    SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-                ),
-                "gen_ai.tool_calls.0.arguments": json.dumps(
-                    {"code": code_input.get("code", ""), "language": "python"}
-                ),
-                SpanAttributes.LLM_PROMPTS: code_input.get("code", ""),
+                SpanAttributes.LLM_REQUEST_MODEL: current_invocation().model_id,
                 SpanAttributes.SPAN_START_TIME: start_time,
                 SpanAttributes.SPAN_END_TIME: end_time,
                 SpanAttributes.SPAN_DURATION: duration,
@@ -932,15 +777,23 @@ def handle_code_interpreter(trace_data: Dict[str, Any], parent_span):
         print(
             f"Code Interpreter Span: {code_span}, Start Time: {start_time}, End Time: {end_time}, Duration: {duration}")
         code_span.start()
+        set_span_attributes(
+            code_span,
+            {
+                "gen_ai.tool_calls.0.arguments": {
+                    "code": code_input.get("code", ""), "language": "python"},
+                SpanAttributes.LLM_PROMPTS: code_input.get("code", ""),
+            },
+        )
 
         # Add code as an attribute
         if "code" in code_input:
-            code_span.set_attribute("code", code_input["code"])
+            set_attribute(code_span, "code", code_input["code"])
         code_span.set_attribute(SpanAttributes.SPAN_NAME, "CodeInterpreter")
 
         # Store the code span in the active_spans dictionary passed from agent.py
         # This will be retrieved later when output arrives
-        from .agent import active_spans
+        active_spans = current_invocation().active_spans
         active_spans["code_span"] = code_span
 
     # Handle code interpreter output as a separate event
@@ -954,7 +807,7 @@ def handle_code_interpreter(trace_data: Dict[str, Any], parent_span):
         ]
 
         # Retrieve the previously created code_span
-        from .agent import active_spans
+        active_spans = current_invocation().active_spans
 
         code_span = active_spans.get("code_span")
 
@@ -974,9 +827,7 @@ def handle_code_interpreter(trace_data: Dict[str, Any], parent_span):
                     SpanAttributes.OPERATION_NAME: SpanKindValues.TOOL,
                     "tool.name": "CodeInterpreter",
                     "tool.description": "Executes Python code and returns results",
-                    SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                        SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-                    ),
+                    SpanAttributes.LLM_REQUEST_MODEL: current_invocation().model_id,
                 },
                 context=trace.set_span_in_context(parent_span),
             )
@@ -999,9 +850,9 @@ def handle_code_interpreter(trace_data: Dict[str, Any], parent_span):
             # Add execution information - using the correct field name executionOutput
             if "executionOutput" in code_output:
                 execution_output = code_output["executionOutput"]
-                result_span.set_attribute("output", execution_output)
-                result_span.set_attribute("result", execution_output)
-                code_span.set_attribute("result", execution_output)
+                set_attribute(result_span, "output", execution_output)
+                set_attribute(result_span, "result", execution_output)
+                set_attribute(code_span, "result", execution_output)
 
             # Add execution status
             if "executionStatus" in code_output:
@@ -1014,10 +865,8 @@ def handle_code_interpreter(trace_data: Dict[str, Any], parent_span):
 
             # Add error message if there was one
             if "errorMessage" in code_output and code_output["errorMessage"]:
-                result_span.set_attribute(
-                    "errorMessage", code_output["errorMessage"])
-                code_span.set_attribute(
-                    "errorMessage", code_output["errorMessage"])
+                set_attribute(result_span, "errorMessage", code_output["errorMessage"])
+                set_attribute(code_span, "errorMessage", code_output["errorMessage"])
 
             result_span.set_status(Status(StatusCode.OK))
 
@@ -1031,29 +880,18 @@ def handle_code_interpreter(trace_data: Dict[str, Any], parent_span):
         active_spans["code_span"] = None
 
 
-def process_guardrail_buffer(guardrail_buffer: Dict[str, list], parent_span):
-    """Process buffered guardrail events for streaming responses"""
+def process_guardrail_buffer(guardrail_buffer: Dict[str, Any], parent_span):
+    """Create the consolidated guardrail_post spans for buffered guardrail events"""
     # Process each unique base trace ID
-    for base_trace_id, events in guardrail_buffer.items():
-        if not events:
+    for base_trace_id, aggregate in guardrail_buffer.items():
+        if isinstance(aggregate, list):
+            # Legacy buffer of {"trace_data": ...} entries
+            entries, aggregate = aggregate, GuardrailAggregate(base_trace_id)
+            for entry in entries:
+                aggregate.add(entry["trace_data"])
+        if not aggregate.event_count:
             continue
 
-        # Get the first event to extract common information
-        first_event = events[0]
-        first_trace_data = first_event["trace_data"]
-        guardrail_trace = first_trace_data.get(
-            "trace", {}).get("guardrailTrace", {})
-        action = guardrail_trace.get("action", "NONE")
-
-        # Get first and last timestamp
-        first_timestamp = first_event.get(
-            "timestamp", datetime.now().isoformat())
-        last_timestamp = (
-            events[-1].get("timestamp", datetime.now().isoformat())
-            if events
-            else first_timestamp
-        )
-
         # Create a single consolidated L2 guardrail_post span for this base trace ID
         with tracer.start_as_current_span(
             name="guardrail_post",
@@ -1061,48 +899,22 @@ def process_guardrail_buffer(guardrail_buffer: Dict[str, list], parent_span):
             attributes={
                 SpanAttributes.OPERATION_NAME: "guardrail",
                 "guardrail.type": "post",
-                "guardrail.action": action,
+                "guardrail.action": aggregate.action,
                 "guardrail.base_trace_id": base_trace_id,
                 "guardrail.streaming": True,
-                "guardrail.chunk_count": len(events),
-                "guardrail.chunks_received": len(events),
+                "guardrail.chunk_count": aggregate.event_count,
+                "guardrail.chunks_received": aggregate.event_count,
                 SpanAttributes.LLM_SYSTEM: "guardrails",
-                SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                    SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-                ),
+                SpanAttributes.LLM_REQUEST_MODEL: current_invocation().model_id,
             },
             context=trace.set_span_in_context(parent_span),
         ) as guardrail_span:
-            # Combine assessments from all events (if any have real content)
-            combined_assessments = []
-            has_substantive_assessment = False
-
-            for event in events:
-                trace_data = event["trace_data"]
-                guardrail_event = trace_data.get(
-                    "trace", {}).get("guardrailTrace", {})
-                assessments = guardrail_event.get("outputAssessments", [])
-
-                # Check if this assessment has content
-                for assessment in assessments:
-                    if assessment and any(
-                        key in assessment and assessment[key]
-                        for key in [
-                            "contentPolicy",
-                            "topicPolicy",
-                            "wordPolicy",
-                            "sensitiveInformationPolicy",
-                        ]
-                    ):
-                        has_substantive_assessment = True
-                        if assessment not in combined_assessments:
-                            combined_assessments.append(assessment)
+            combined_assessments = aggregate.assessments
 
             # Only create assessment span if we have substantive content
-            if has_substantive_assessment:
-                guardrail_span.set_attribute(
-                    "guardrail.output_assessments", json.dumps(
-                        combined_assessments)
+            if aggregate.has_substantive_assessment:
+                set_attribute(
+                    guardrail_span, "guardrail.output_assessments", combined_assessments
                 )
 
                 # Create a single assessment span with combined content
@@ -1116,9 +928,7 @@ def process_guardrail_buffer(guardrail_buffer: Dict[str, list], parent_span):
                         "guardrail.streaming": True,
                         "guardrail.assessments_count": len(combined_assessments),
                         SpanAttributes.LLM_SYSTEM: "guardrails-assessment",
-                        SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                            SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-                        ),
+                        SpanAttributes.LLM_REQUEST_MODEL: current_invocation().model_id,
                     },
                     context=trace.set_span_in_context(guardrail_span),
                 ) as assessment_span:
@@ -1129,39 +939,34 @@ def process_guardrail_buffer(guardrail_buffer: Dict[str, list], parent_span):
                         prefix = f"assessment.{idx}."
 
                         if "contentPolicy" in assessment:
-                            assessment_span.set_attribute(
-                                f"{prefix}content_policy",
-                                json.dumps(assessment["contentPolicy"]),
+                            set_attribute(
+                                assessment_span, f"{prefix}content_policy",
+                                assessment["contentPolicy"]
                             )
 
                         if "topicPolicy" in assessment:
-                            assessment_span.set_attribute(
-                                f"{prefix}topic_policy",
-                                json.dumps(assessment["topicPolicy"]),
+                            set_attribute(
+                                assessment_span, f"{prefix}topic_policy",
+                                assessment["topicPolicy"]
                             )
 
                         if "wordPolicy" in assessment:
-                            assessment_span.set_attribute(
-                                f"{prefix}word_policy",
-                                json.dumps(assessment["wordPolicy"]),
+                            set_attribute(
+                                assessment_span, f"{prefix}word_policy",
+                                assessment["wordPolicy"]
                             )
 
                         if "sensitiveInformationPolicy" in assessment:
-                            assessment_span.set_attribute(
-                                f"{prefix}sensitive_info_policy",
-                                json.dumps(
-                                    assessment["sensitiveInformationPolicy"]),
+                            set_attribute(
+                                assessment_span, f"{prefix}sensitive_info_policy",
+                                assessment["sensitiveInformationPolicy"]
                             )
 
                     # Set status on assessment span
                     assessment_span.set_status(Status(StatusCode.OK))
 
-            # Check if any guardrail action was GUARDRAIL_INTERVENED
-            if any(
-                event["trace_data"].get("guardrailTrace", {}).get("action", "")
-                == "GUARDRAIL_INTERVENED"
-                for event in events
-            ):
+            # Check if any guardrail action intervened
+            if aggregate.intervened:
                 guardrail_span.set_status(Status(StatusCode.ERROR))
                 guardrail_span.set_attribute(
                     "error.message", "Content blocked by guardrail"
@@ -1172,11 +977,12 @@ def process_guardrail_buffer(guardrail_buffer: Dict[str, list], parent_span):
 
 def handle_failure(trace_data: Dict[str, Any], parent_span):
     """Handle failure trace events with proper L2 hierarchy"""
-    trace_id = extract_trace_id(trace_data)
-    start_time, end_time, duration = timer.check_start_time(
-        "handle_failure", trace_data, trace_id
+    event = trace_event(trace_data)
+    trace_id = event.trace_id
+    start_time, end_time, duration = current_invocation().timer.check_start_time(
+        "handle_failure", event, trace_id
     )
-    failure_trace = trace_data.get("trace", {}).get("failureTrace", {})
+    failure_trace = event.subtrace("failure")
     trace_id = failure_trace.get("traceId", "unknown")
     failure_reason = failure_trace.get("failureReason", "Unknown failure")
 
@@ -1219,12 +1025,12 @@ def handle_failure(trace_data: Dict[str, Any], parent_span):
 
 def handle_final_response(trace_data: Dict[str, Any], parent_span):
     """Handle final response at L3 level under orchestration"""
-    trace_id = extract_trace_id(trace_data)
-    start_time, end_time, duration = timer.check_start_time(
-        "handle_final_response", trace_data, trace_id
+    event = trace_event(trace_data)
+    trace_id = event.trace_id
+    start_time, end_time, duration = current_invocation().timer.check_start_time(
+        "handle_final_response", event, trace_id
     )
-    orchestration_trace = trace_data.get(
-        "trace", {}).get("orchestrationTrace", {})
+    orchestration_trace = event.subtrace("orchestration")
 
     if (
         "observation" in orchestration_trace
@@ -1252,35 +1058,64 @@ def handle_final_response(trace_data: Dict[str, Any], parent_span):
         ) as final_response_span:
             # Add content
             final_response_span.set_attribute(SpanAttributes.LLM_PROMPTS, "")
-            final_response_span.set_attribute(
-                SpanAttributes.LLM_COMPLETIONS, final_text
+            set_attribute(
+                final_response_span, SpanAttributes.LLM_COMPLETIONS, final_text
             )
 
             # Add any metadata if available
             if "metadata" in final_response:
-                final_response_span.set_attribute(
-                    "response.metadata", json.dumps(
-                        final_response["metadata"], default=str)
+                set_attribute(
+                    final_response_span, "response.metadata", final_response["metadata"]
                 )
 
             # Set status to OK
             final_response_span.set_status(Status(StatusCode.OK))
 
         # Also add to parent span
-        parent_span.set_attribute("final_response", final_text)
+        set_attribute(parent_span, "final_response", final_text)
 
         return True
 
     return False
 
 
+def handle_guardrail_trace(trace_data: Dict[str, Any], parent_span):
+    """Route a guardrail trace: pre-request guardrails get spans right away,
+    post-response guardrails are buffered until the response is complete"""
+    guardrail_trace = trace_event(trace_data).component
+    trace_id = guardrail_trace.get("traceId", "")
+    action = guardrail_trace.get("action", "NONE")
+
+    if "pre" in trace_id:
+        # Pre-request guardrail
+        if action in ["BLOCKED", "INTERVENED"]:
+            # This is an actual guardrail intervention
+            handle_guardrail_intervention(trace_data, parent_span)
+        else:
+            # Standard pre-request guardrail
+            handle_guardrail_pre(trace_data, parent_span)
+        return
+
+    # Post-response guardrail - buffer for later processing
+    # Extract base trace ID
+    base_trace_id = (
+        trace_id.split("-guardrail-post-")[0]
+        if "-guardrail-post-" in trace_id
+        else trace_id
+    )
+    # Fold into the invocation's aggregate for this base trace ID; the
+    # consolidated guardrail_post span is created at the end of the stream
+    current_invocation().span_manager.add_guardrail_event(base_trace_id, trace_data)
+
+
 def handle_guardrail_intervention(trace_data: Dict[str, Any], parent_span):
     """Handle guardrail interventions (blocking or modifying content)"""
-    trace_id = extract_trace_id(trace_data)
-    start_time, end_time, duration = timer.check_start_time(
-        "handle_guardrail_intervention", trace_data, trace_id
+    event = trace_event(trace_data)
+    trace_id = event.trace_id
+    start_time, end_time, duration = current_invocation().timer.check_start_time(
+        "handle_guardrail_intervention", event, trace_id
     )
-    guardrail_trace = trace_data.get("trace", {}).get("guardrailTrace", {})
+    guardrail_trace = event.subtrace("guardrail")
     trace_id = guardrail_trace.get("traceId", "unknown")
     action = guardrail_trace.get("action", "UNKNOWN")
 
@@ -1295,9 +1130,7 @@ def handle_guardrail_intervention(trace_data: Dict[str, Any], parent_span):
             "guardrail.intervention": True,  # Mark as actual intervention
             SpanAttributes.TRACE_ID: trace_id,
             SpanAttributes.LLM_SYSTEM: "guardrails",
-            SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-            ),
+            SpanAttributes.LLM_REQUEST_MODEL: current_invocation().model_id,
             SpanAttributes.SPAN_NAME: "guardrail_intervention",
             SpanAttributes.SPAN_START_TIME: start_time,
             SpanAttributes.SPAN_END_TIME: end_time,
@@ -1312,12 +1145,12 @@ def handle_guardrail_intervention(trace_data: Dict[str, Any], parent_span):
         else:
             assessments = guardrail_trace.get("outputAssessments", [])
 
-        guardrail_span.set_attribute(
-            SpanAttributes.LLM_PROMPTS,
-            parent_span.attributes.get(SpanAttributes.LLM_PROMPTS, ""),
+        set_attribute(
+            guardrail_span, SpanAttributes.LLM_PROMPTS,
+            prompt_of(parent_span)
         )
-        guardrail_span.set_attribute(
-            SpanAttributes.LLM_COMPLETIONS, json.dumps(assessments)
+        set_attribute(
+            guardrail_span, SpanAttributes.LLM_COMPLETIONS, assessments
         )
         # Extract and add detailed information about what was blocked/modified
         blocked_items = []
@@ -1333,8 +1166,8 @@ def handle_guardrail_intervention(trace_data: Dict[str, Any], parent_span):
                                 f"Word '{word['match']}' blocked")
 
         if blocked_items:
-            guardrail_span.set_attribute(
-                "guardrail.blocked_items", json.dumps(blocked_items)
+            set_attribute(
+                guardrail_span, "guardrail.blocked_items", blocked_items
             )
 
         guardrail_span.set_status(Status(StatusCode.OK))
@@ -1342,14 +1175,14 @@ def handle_guardrail_intervention(trace_data: Dict[str, Any], parent_span):
 
 def handle_standard_preprocessing(trace_data: Dict[str, Any], parent_span):
     """Handle standard preprocessing traces (no guardrails)"""
-    trace_id = extract_trace_id(trace_data)
-    start_time, end_time, duration = timer.check_start_time(
-        "handle_standard_preprocessing", trace_data, trace_id
+    event = trace_event(trace_data)
+    trace_id = event.trace_id
+    start_time, end_time, duration = current_invocation().timer.check_start_time(
+        "handle_standard_preprocessing", event, trace_id
     )
     print("calling handle_standard_preprocessing",
           end_time, start_time, duration)
-    preprocessing_trace = trace_data.get(
-        "trace", {}).get("preProcessingTrace", {})
+    preprocessing_trace = event.subtrace("preprocessing")
 
     # Extract trace ID from preprocessing trace
     trace_id = "unknown"
@@ -1370,12 +1203,10 @@ def handle_standard_preprocessing(trace_data: Dict[str, Any], parent_span):
             SpanAttributes.TRACE_ID: trace_id,
             "trace.type": "PRE_PROCESSING",
             SpanAttributes.LLM_SYSTEM: "preprocessing",
-            SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-            ),
+            SpanAttributes.LLM_REQUEST_MODEL: current_invocation().model_id,
             SpanAttributes.SPAN_NAME: "pre_processing",
-            "stream_mode": parent_span.attributes.get("stream_mode", False),
-            "metadata.streaming": parent_span.attributes.get(
+            "stream_mode": current_invocation().stream_mode,
+            "metadata.streaming": current_invocation().root_attributes.get(
                 "metadata.streaming", False
             ),
             SpanAttributes.SPAN_START_TIME: start_time,
@@ -1398,12 +1229,13 @@ def handle_standard_preprocessing(trace_data: Dict[str, Any], parent_span):
                     "model.input.type": model_input.get("type", "PRE_PROCESSING"),
                 },
             )
+            set_prompt(preprocessing_span, model_input.get("text", ""))
 
             # Add inference configuration if available
             if "inferenceConfiguration" in model_input:
-                preprocessing_span.set_attribute(
-                    "model.input.inference_configuration",
-                    json.dumps(model_input["inferenceConfiguration"]),
+                set_attribute(
+                    preprocessing_span, "model.input.inference_configuration",
+                    model_input["inferenceConfiguration"]
                 )
 
         # Process model invocation output if available
@@ -1416,9 +1248,7 @@ def handle_standard_preprocessing(trace_data: Dict[str, Any], parent_span):
                 kind=SpanKind.CLIENT,
                 attributes={
                     SpanAttributes.LLM_SYSTEM: "aws.bedrock",
-                    SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                        SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-                    ),
+                    SpanAttributes.LLM_REQUEST_MODEL: current_invocation().model_id,
                     "trace.part": "preprocessing",
                     SpanAttributes.SPAN_START_TIME: start_time,
                     SpanAttributes.SPAN_END_TIME: end_time,
@@ -1426,10 +1256,8 @@ def handle_standard_preprocessing(trace_data: Dict[str, Any], parent_span):
                 },
                 context=trace.set_span_in_context(preprocessing_span),
             ) as llm_span:
-                llm_span.set_attributes(
-                    SpanAttributes.LLM_PROMPTS,
-                    preprocessing_span.attributes.get(
-                        SpanAttributes.LLM_PROMPTS),
+                set_attribute(
+                    llm_span, SpanAttributes.LLM_PROMPTS, prompt_of(preprocessing_span, None)
                 )
                 # Add token usage information
                 if "metadata" in model_output and "usage" in model_output["metadata"]:
@@ -1461,10 +1289,10 @@ def handle_standard_preprocessing(trace_data: Dict[str, Any], parent_span):
                 if "rawResponse" in model_output:
                     raw_content = model_output["rawResponse"].get(
                         "content", "")
-                    llm_span.set_attribute(
-                        SpanAttributes.LLM_COMPLETIONS, raw_content)
-                    preprocessing_span.set_attribute(
-                        "model.output", raw_content)
+                    set_attribute(
+                        llm_span, SpanAttributes.LLM_COMPLETIONS, raw_content)
+                    set_attribute(
+                        preprocessing_span, "model.output", raw_content)
 
                 # Create L4 assessment span as child of LLM span
                 with tracer.start_as_current_span(
@@ -1481,15 +1309,14 @@ def handle_standard_preprocessing(trace_data: Dict[str, Any], parent_span):
                     if "rawResponse" in model_output:
                         raw_content = model_output["rawResponse"].get(
                             "content", "")
-                        assessment_span.set_attribute(
-                            "rawResponse", raw_content)
-                        assessment_span.set_attribute("output", raw_content)
+                        set_attribute(assessment_span, "rawResponse", raw_content)
+                        set_attribute(assessment_span, "output", raw_content)
 
                     # Add metadata
                     if "metadata" in model_output:
                         metadata = model_output["metadata"]
-                        assessment_span.set_attribute(
-                            "metadata", json.dumps(metadata))
+                        set_attribute(
+                            assessment_span, "metadata", metadata)
 
                         # Add token usage directly
                         if "usage" in metadata:
@@ -1506,8 +1333,8 @@ def handle_standard_preprocessing(trace_data: Dict[str, Any], parent_span):
                     # Add parsed response
                     if "parsedResponse" in model_output:
                         parsed_response = model_output["parsedResponse"]
-                        assessment_span.set_attribute(
-                            "parsedResponse", json.dumps(parsed_response)
+                        set_attribute(
+                            assessment_span, "parsedResponse", parsed_response
                         )
                         assessment_span.set_attribute(
                             "isValid", parsed_response.get("isValid", True)
@@ -1515,8 +1342,9 @@ def handle_standard_preprocessing(trace_data: Dict[str, Any], parent_span):
 
                         # Add rationale directly
                         if "rationale" in parsed_response:
-                            assessment_span.set_attribute(
-                                "parsedResponse.rationale", parsed_response["rationale"]
+                            set_attribute(
+                                assessment_span, "parsedResponse.rationale",
+                                parsed_response["rationale"]
                             )
 
                         # Set status based on isValid
@@ -1542,11 +1370,12 @@ def handle_standard_preprocessing(trace_data: Dict[str, Any], parent_span):
 
 def handle_guardrail_pre(trace_data: Dict[str, Any], parent_span):
     """Handle pre-guardrail trace events as clean L2 spans"""
-    trace_id = extract_trace_id(trace_data)
-    start_time, end_time, duration = timer.check_start_time(
-        "handle_guardrail_pre", trace_data, trace_id
+    event = trace_event(trace_data)
+    trace_id = event.trace_id
+    start_time, end_time, duration = current_invocation().timer.check_start_time(
+        "handle_guardrail_pre", event, trace_id
     )
-    guardrail_trace = trace_data.get("trace", {}).get("guardrailTrace", {})
+    guardrail_trace = event.subtrace("guardrail")
     trace_id = guardrail_trace.get("traceId", "unknown")
     action = guardrail_trace.get("action", "NONE")
 
@@ -1560,9 +1389,7 @@ def handle_guardrail_pre(trace_data: Dict[str, Any], parent_span):
             "guardrail.action": action,
             SpanAttributes.TRACE_ID: trace_id,
             SpanAttributes.LLM_SYSTEM: "guardrails",
-            SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-            ),
+            SpanAttributes.LLM_REQUEST_MODEL: current_invocation().model_id,
             SpanAttributes.SPAN_NAME: "guardrail_pre",
             SpanAttributes.SPAN_START_TIME: start_time,
             SpanAttributes.SPAN_END_TIME: end_time,
@@ -1573,14 +1400,14 @@ def handle_guardrail_pre(trace_data: Dict[str, Any], parent_span):
         # Add input assessment details
         input_assessments = guardrail_trace.get("inputAssessments", [])
         guardrail_pre_span.set_attribute(SpanAttributes.LLM_PROMPTS, "NA")
-        guardrail_pre_span.set_attribute(
-            SpanAttributes.LLM_COMPLETIONS, json.dumps(input_assessments)
+        set_attribute(
+            guardrail_pre_span, SpanAttributes.LLM_COMPLETIONS, input_assessments
         )
 
         # Store assessments information
-        guardrail_pre_span.set_attribute(
-            "guardrail.assessments",
-            json.dumps({"input": guardrail_trace.get("inputAssessments", [])}),
+        set_attribute(
+            guardrail_pre_span, "guardrail.assessments",
+            {"input": guardrail_trace.get("inputAssessments", [])}
         )
 
         # Set status based on action
@@ -1595,11 +1422,12 @@ def handle_guardrail_pre(trace_data: Dict[str, Any], parent_span):
 
 def handle_guardrail_post(trace_data: Dict[str, Any], parent_span):
     """Handle post-guardrail trace events with proper L2-L3 hierarchy (no LLM spans)"""
-    trace_id = extract_trace_id(trace_data)
-    start_time, end_time, duration = timer.check_start_time(
-        "handle_guardrail_post", trace_data, trace_id
+    event = trace_event(trace_data)
+    trace_id = event.trace_id
+    start_time, end_time, duration = current_invocation().timer.check_start_time(
+        "handle_guardrail_post", event, trace_id
     )
-    guardrail_trace = trace_data.get("trace", {}).get("guardrailTrace", {})
+    guardrail_trace = event.subtrace("guardrail")
     trace_id = guardrail_trace.get("traceId", "unknown")
     action = guardrail_trace.get("action", "NONE")
 
@@ -1612,12 +1440,10 @@ def handle_guardrail_post(trace_data: Dict[str, Any], parent_span):
             "guardrail.type": "post",
             "guardrail.action": action,
             SpanAttributes.TRACE_ID: trace_id,
-            SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-            ),
+            SpanAttributes.LLM_REQUEST_MODEL: current_invocation().model_id,
             SpanAttributes.SPAN_NAME: "guardrail_post",
-            "stream_mode": parent_span.attributes.get("stream_mode", False),
-            "metadata.streaming": parent_span.attributes.get(
+            "stream_mode": current_invocation().stream_mode,
+            "metadata.streaming": current_invocation().root_attributes.get(
                 "metadata.streaming", False
             ),
             SpanAttributes.SPAN_START_TIME: start_time,
@@ -1633,8 +1459,8 @@ def handle_guardrail_post(trace_data: Dict[str, Any], parent_span):
         output_assessments = guardrail_trace.get("outputAssessments", [])
 
         if output_assessments:
-            guardrail_span.set_attribute(
-                "guardrail.output_assessments", json.dumps(output_assessments)
+            set_attribute(
+                guardrail_span, "guardrail.output_assessments", output_assessments
             )
 
             # Create L3 assessment span as a child of guardrail_span
@@ -1652,24 +1478,21 @@ def handle_guardrail_post(trace_data: Dict[str, Any], parent_span):
                     assessment = output_assessments[0]
                     # Add policy details
                     if "contentPolicy" in assessment:
-                        assessment_span.set_attribute(
-                            "content_policy", json.dumps(
-                                assessment["contentPolicy"])
+                        set_attribute(
+                            assessment_span, "content_policy", assessment["contentPolicy"]
                         )
                     if "topicPolicy" in assessment:
-                        assessment_span.set_attribute(
-                            "topic_policy", json.dumps(
-                                assessment["topicPolicy"])
+                        set_attribute(
+                            assessment_span, "topic_policy", assessment["topicPolicy"]
                         )
                     if "wordPolicy" in assessment:
-                        assessment_span.set_attribute(
-                            "word_policy", json.dumps(assessment["wordPolicy"])
+                        set_attribute(
+                            assessment_span, "word_policy", assessment["wordPolicy"]
                         )
                     if "sensitiveInformationPolicy" in assessment:
-                        assessment_span.set_attribute(
-                            "sensitive_info_policy",
-                            json.dumps(
-                                assessment["sensitiveInformationPolicy"]),
+                        set_attribute(
+                            assessment_span, "sensitive_info_policy",
+                            assessment["sensitiveInformationPolicy"]
                         )
 
                 # Set status on assessment span
@@ -1687,14 +1510,15 @@ def handle_guardrail_post(trace_data: Dict[str, Any], parent_span):
 
 def handle_user_input_span(trace_data: Dict[str, Any], parent_span):
     """Handle user input as a tool invocation"""
-    trace_id = extract_trace_id(trace_data)
-    start_time, end_time, duration = timer.check_start_time(
-        "handle_user_input", trace_data, trace_id
+    event = trace_event(trace_data)
+    trace_id = event.trace_id
+    start_time, end_time, duration = current_invocation().timer.check_start_time(
+        "handle_user_input", event, trace_id
     )
 
     # Extract observation data containing user question
-    obs = trace_data.get("trace", {}).get(
-        "orchestrationTrace", {}).get("observation", {})
+    obs = event.observation if event.component_type == "orchestration" else None
+    obs = obs or {}
     final_response = obs.get('finalResponse', {})
     question_text = final_response.get('text', '')
 
@@ -1714,33 +1538,34 @@ def handle_user_input_span(trace_data: Dict[str, Any], parent_span):
                     "description": "Question to ask the user"
                 }
             }),
-            SpanAttributes.LLM_COMPLETIONS: question_text,
-            SpanAttributes.LLM_PROMPTS: parent_span.attributes.get(SpanAttributes.LLM_PROMPTS, ""),
             SpanAttributes.SPAN_START_TIME: start_time,
             SpanAttributes.SPAN_END_TIME: end_time,
             SpanAttributes.SPAN_DURATION: duration,
         },
         context=trace.set_span_in_context(parent_span)
     ) as user_input_span:
+        set_attribute(user_input_span, SpanAttributes.LLM_PROMPTS, prompt_of(parent_span))
+        set_attribute(user_input_span, SpanAttributes.LLM_COMPLETIONS, question_text)
         # Set all relevant attributes from observation data
         if obs:
             if "metadata" in final_response:
-                user_input_span.set_attribute(
-                    "response.metadata", json.dumps(final_response["metadata"])
+                set_attribute(
+                    user_input_span, "response.metadata", final_response["metadata"]
                 )
 
             if "ask_user_metadata" in obs:
-                user_input_span.set_attribute(
-                    "ask_user.metadata", json.dumps(obs["ask_user_metadata"])
+                set_attribute(
+                    user_input_span, "ask_user.metadata", obs["ask_user_metadata"]
                 )
         user_input_span.set_status(Status(StatusCode.OK))
 
 
 def handle_file_operations(trace_data: Dict[str, Any], parent_span):
     """Handle file operations in the trace"""
-    trace_id = extract_trace_id(trace_data)
-    start_time, end_time, duration = timer.check_start_time(
-        "handle_file_operations", trace_data, trace_id
+    event = trace_event(trace_data)
+    trace_id = event.trace_id
+    start_time, end_time, duration = current_invocation().timer.check_start_time(
+        "handle_file_operations", event, trace_id
     )
 
     # Extract files data
@@ -1775,9 +1600,9 @@ def handle_file_operations(trace_data: Dict[str, Any], parent_span):
 
             # Add metadata if available
             if "metadata" in this_file:
-                file_span.set_attribute(
-                    f"file.{idx}.metadata",
-                    json.dumps(this_file["metadata"])
+                set_attribute(
+                    file_span, f"file.{idx}.metadata",
+                    this_file["metadata"]
                 )
 
             # Add content info if available
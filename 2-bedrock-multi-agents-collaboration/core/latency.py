@@ -0,0 +1,271 @@
+"""
+Step latency from Bedrock ``eventTime`` values.
+
+Bedrock stamps every trace event with the time the agent step happened; the
+events can reach us much later and in bursts, so local timestamps taken while
+handling them say little about how long a step took. ``EventClock`` derives
+each event's step window from the gap to the previous event of the same
+trace ID; the first event of a trace ID opens it at its own eventTime:
+
+    modelInvocationInput    10:00:00.000  window 10:00:00.000 - 10:00:00.000
+    modelInvocationOutput   10:00:02.400  window 10:00:00.000 - 10:00:02.400
+    invocationInput (KB)    10:00:02.410  window 10:00:02.400 - 10:00:02.410
+    observation (KB)        10:00:03.100  window 10:00:02.410 - 10:00:03.100
+
+Spans created through ``EventTimeTracer`` while an event is handled start at
+the beginning of its window, and end at the ``eventTime`` of the event being
+handled when they are ended, so a span opened by an input event and closed
+by its output event covers the step, and a span opened and closed by a single
+event covers the gap before it. Spans created outside event handling (or for
+events without ``eventTime``) keep the local clock.
+
+``CriticalPath`` adds the windows up per kind of step (LLM calls, knowledge
+base lookups, action groups, ...) so the root span can say where the time of
+an invocation went.
+
+Event times are used as they are unless the first one is further than
+``BEDROCK_AGENT_EVENT_CLOCK_MAX_SKEW_MS`` (default 60000) from when it was
+received, e.g. when replaying recorded streams; the invocation's event times
+are then shifted onto the local timeline, keeping the gaps between them.
+"""
+
+import os
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from opentelemetry import trace
+from opentelemetry.trace import SpanKind
+from wrapt import ObjectProxy
+
+from .events import TraceEvent
+from .timing import Timestamp, elapsed_ms, wall_ns
+
+# Trace IDs remembered per clock; the default invocation's clock lives for
+# the whole process, so it is cleared beyond this
+MAX_TRACE_IDS = 10000
+
+
+class StepWindow(NamedTuple):
+    """The interval an event reports on, in epoch nanoseconds"""
+    start_ns: int
+    end_ns: int
+    trace_id: str
+
+    @property
+    def duration_ms(self) -> float:
+        return elapsed_ms(self.start_ns, self.end_ns)
+
+
+class EventClock:
+    """Step windows of one invocation's trace events"""
+
+    def __init__(self, max_skew_ms: Optional[float] = None):
+        if max_skew_ms is None:
+            max_skew_ms = float(os.environ.get("BEDROCK_AGENT_EVENT_CLOCK_MAX_SKEW_MS", 60000))
+        self.max_skew_ns = int(max_skew_ms * 1_000_000)
+        # Added to every eventTime; non-zero only when it is on another timeline
+        self.offset_ns: Optional[int] = None
+        self.last_ns: Optional[int] = None
+        self._last_by_trace: Dict[str, int] = {}
+        # Window of the event being handled
+        self.current: Optional[StepWindow] = None
+
+    def observe(self, event: TraceEvent) -> Optional[StepWindow]:
+        """Window of ``event``, or None if it has no eventTime"""
+        if event.event_time is None:
+            return None
+        event_ns = event.event_time.ns
+        if self.offset_ns is None:
+            received_ns = event.received_at.ns if event.received_at is not None else wall_ns()
+            skew_ns = received_ns - event_ns
+            self.offset_ns = skew_ns if abs(skew_ns) > self.max_skew_ns else 0
+        event_ns += self.offset_ns
+
+        previous_ns = self._last_by_trace.get(event.trace_id, event_ns)
+        # Events of a trace ID can carry equal or out-of-order times
+        end_ns = max(event_ns, previous_ns)
+
+        if len(self._last_by_trace) >= MAX_TRACE_IDS:
+            self._last_by_trace.clear()
+        self._last_by_trace[event.trace_id] = end_ns
+        self.last_ns = end_ns if self.last_ns is None else max(self.last_ns, end_ns)
+        return StepWindow(previous_ns, end_ns, event.trace_id)
+
+    @contextmanager
+    def handling(self, event: TraceEvent):
+        """Make ``event``'s window current while its handlers run"""
+        previous, self.current = self.current, self.observe(event)
+        try:
+            yield self.current
+        finally:
+            self.current = previous
+
+    def end_ns(self, start_ns: int, trace_id: str) -> int:
+        """End time for a span started at ``start_ns`` and ended now.
+
+        Outside event handling (spans still open when the invocation ends)
+        this is the last event of the trace ID the span was started for.
+        """
+        if self.current is not None:
+            end_ns = self.current.end_ns
+        else:
+            end_ns = self._last_by_trace.get(trace_id, self.last_ns)
+        return max(end_ns, start_ns) if end_ns is not None else start_ns
+
+    def root_end_ns(self) -> Optional[int]:
+        """End time for the invocation's root span: now, or the last event
+        if that is later (event times shifted onto the local timeline)"""
+        if self.last_ns is None:
+            return None
+        return max(wall_ns(), self.last_ns)
+
+
+# Orchestration observations and the step whose result they report
+OBSERVATION_STEPS = {
+    "knowledgeBaseLookupOutput": "kb",
+    "actionGroupInvocationOutput": "action_group",
+    "codeInterpreterInvocationOutput": "code_interpreter",
+    "agentCollaboratorInvocationOutput": "collaborator",
+}
+
+
+def step_kind(event: TraceEvent) -> str:
+    """The kind of step an event's window belongs to, e.g. "llm" or "kb"
+
+    Orchestration windows ending in a model output are LLM calls, those ending
+    in an observation are the tool or lookup observed; the remaining ones
+    (rationale, invocation inputs, final response) are agent overhead and
+    count as "orchestration". Other traces count as their component type.
+    """
+    component_type = event.component_type or "unknown"
+    if component_type != "orchestration":
+        return component_type
+    if event.model_output is not None:
+        return "llm"
+    if isinstance(event.observation, dict):
+        for key, kind in OBSERVATION_STEPS.items():
+            if key in event.observation:
+                return kind
+    return "orchestration"
+
+
+class CriticalPath:
+    """Time per kind of step of one invocation, and its slowest step"""
+
+    __slots__ = ("totals_ns", "slowest")
+
+    def __init__(self):
+        self.totals_ns: Dict[str, int] = {}
+        # (duration_ns, kind, trace_id) of the longest single window
+        self.slowest: Optional[tuple] = None
+
+    def add(self, event: TraceEvent, window: StepWindow):
+        kind = step_kind(event)
+        duration_ns = window.end_ns - window.start_ns
+        self.totals_ns[kind] = self.totals_ns.get(kind, 0) + duration_ns
+        if self.slowest is None or duration_ns > self.slowest[0]:
+            self.slowest = (duration_ns, kind, window.trace_id)
+
+    def attributes(self) -> Dict[str, Any]:
+        """Root span attributes: critical_path.<kind>_ms, total and slowest step"""
+        if self.slowest is None:
+            return {}
+        attributes = {
+            f"critical_path.{kind}_ms": round(total_ns / 1_000_000, 3)
+            for kind, total_ns in self.totals_ns.items()
+        }
+        attributes["critical_path.total_ms"] = round(sum(self.totals_ns.values()) / 1_000_000, 3)
+        duration_ns, kind, trace_id = self.slowest
+        attributes["critical_path.slowest_step"] = kind
+        attributes["critical_path.slowest_step_ms"] = round(duration_ns / 1_000_000, 3)
+        attributes["critical_path.slowest_trace_id"] = trace_id
+        return attributes
+
+    def apply(self, span):
+        """Set the breakdown on ``span`` (the invocation's root span)"""
+        for key, value in self.attributes().items():
+            span.set_attribute(key, value)
+
+
+class EventTimedSpan(ObjectProxy):
+    """A span started on the event clock, ending on it too"""
+
+    def __init__(self, span, clock: EventClock, window: StepWindow):
+        super().__init__(span)
+        self._self_clock = clock
+        self._self_window = window
+
+    def end(self, end_time: Optional[int] = None):
+        if end_time is None:
+            window = self._self_window
+            end_time = self._self_clock.end_ns(window.start_ns, window.trace_id)
+        self.__wrapped__.end(end_time=end_time)
+
+
+class EventTimeTracer:
+    """Tracer placing spans on the event clock of the current invocation"""
+
+    def __init__(self, tracer, clock: Callable[[], EventClock],
+                 on_start: Optional[Callable[[Any], None]] = None):
+        self._tracer = tracer
+        self._clock = clock
+        # Called with every span started, e.g. to track it until it ends
+        self._on_start = on_start
+
+    def start_span(
+        self,
+        name: str,
+        context=None,
+        kind: SpanKind = SpanKind.INTERNAL,
+        attributes=None,
+        links=None,
+        start_time: Optional[int] = None,
+        record_exception: bool = True,
+        set_status_on_exception: bool = True,
+    ):
+        clock = self._clock()
+        window = clock.current if start_time is None else None
+        # Step timestamps (langfuse.startTime/endTime) are only formatted
+        # for spans that record them
+        timestamps = None
+        if attributes and any(isinstance(value, Timestamp) for value in attributes.values()):
+            timestamps = {k: v for k, v in attributes.items() if isinstance(v, Timestamp)}
+            attributes = {k: v for k, v in attributes.items() if k not in timestamps}
+        span = self._tracer.start_span(
+            name, context, kind, attributes, links,
+            start_time if window is None else window.start_ns,
+            record_exception, set_status_on_exception,
+        )
+        if timestamps and span.is_recording():
+            for key, value in timestamps.items():
+                span.set_attribute(key, value.iso)
+        if window is not None:
+            span = EventTimedSpan(span, clock, window)
+        if self._on_start is not None:
+            self._on_start(span)
+        return span
+
+    @contextmanager
+    def start_as_current_span(
+        self,
+        name: str,
+        context=None,
+        kind: SpanKind = SpanKind.INTERNAL,
+        attributes=None,
+        links=None,
+        start_time: Optional[int] = None,
+        record_exception: bool = True,
+        set_status_on_exception: bool = True,
+        end_on_exit: bool = True,
+    ):
+        span = self.start_span(
+            name, context, kind, attributes, links, start_time,
+            record_exception, set_status_on_exception,
+        )
+        with trace.use_span(
+            span,
+            end_on_exit=end_on_exit,
+            record_exception=record_exception,
+            set_status_on_exception=set_status_on_exception,
+        ) as current:
+            yield current
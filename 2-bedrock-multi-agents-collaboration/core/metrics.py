@@ -0,0 +1,128 @@
+"""
+OpenTelemetry metrics for agent invocations.
+
+``MetricsSpanProcessor`` is installed on the shared TracerProvider and turns
+finished spans into pre-aggregated metrics, so dashboards do not have to scan
+every span and spans can be sampled without losing totals:
+
+    bedrock_agent.invocation.duration  histogram (ms) per agent, streaming mode, status
+    bedrock_agent.step.duration        histogram (ms) per step span (llm, rationale,
+                                       knowledgeBaseLookupInput, action_group, ...)
+    gen_ai.client.token.usage          histogram ({token}) per model and token type
+    bedrock_agent.cost                 counter (USD) per model, priced from the
+                                       model cost lookup table
+    bedrock_agent.sampling.traces      counter of tail sampling decisions per
+                                       decision and reason (core.sampling)
+    bedrock_agent.spans.leaked         counter of spans still open when their
+                                       invocation ended, per span name
+
+Measurements are recorded in the context of the span they came from, so
+sampled spans are attached to the histograms as exemplars.
+"""
+
+import logging
+
+from opentelemetry import metrics, trace
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor
+from opentelemetry.trace import NonRecordingSpan, StatusCode
+
+from .constants import SpanAttributes, SpanKindValues
+from .pricing import compute_cost
+
+# Initialize logging
+logger = logging.getLogger(__name__)
+
+# Agent invocations routinely take tens of seconds
+DURATION_BUCKETS_MS = (
+    10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 20000, 30000, 60000, 120000,
+)
+# Buckets recommended by the GenAI semantic conventions
+TOKEN_BUCKETS = (
+    1, 4, 16, 64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304,
+)
+
+meter = metrics.get_meter("bedrock-agent-tracing")
+
+invocation_duration = meter.create_histogram(
+    "bedrock_agent.invocation.duration", unit="ms",
+    description="Duration of Bedrock Agent invocations, including consuming the stream",
+    explicit_bucket_boundaries_advisory=DURATION_BUCKETS_MS,
+)
+step_duration = meter.create_histogram(
+    "bedrock_agent.step.duration", unit="ms",
+    description="Duration of the steps (LLM calls, lookups, tools, guardrails) of an invocation",
+    explicit_bucket_boundaries_advisory=DURATION_BUCKETS_MS,
+)
+token_usage = meter.create_histogram(
+    "gen_ai.client.token.usage", unit="{token}",
+    description="Input and output tokens per model call",
+    explicit_bucket_boundaries_advisory=TOKEN_BUCKETS,
+)
+cost = meter.create_counter(
+    "bedrock_agent.cost", unit="USD",
+    description="Model cost of agent invocations",
+)
+sampled_traces = meter.create_counter(
+    "bedrock_agent.sampling.traces", unit="{trace}",
+    description="Traces kept or dropped by tail sampling",
+)
+leaked_spans = meter.create_counter(
+    "bedrock_agent.spans.leaked", unit="{span}",
+    description="Spans a handler left open, ended when their invocation ended",
+)
+
+
+def _span_duration_ms(span: ReadableSpan) -> float:
+    if span.end_time is None or span.start_time is None:
+        return 0.0
+    return (span.end_time - span.start_time) / 1_000_000
+
+
+class MetricsSpanProcessor(SpanProcessor):
+    """Records invocation, step, token and cost metrics from finished spans"""
+
+    def on_end(self, span: ReadableSpan) -> None:
+        try:
+            self._record(span)
+        except Exception as e:
+            logger.debug(f"Could not record metrics for span {span.name}: {e}")
+
+    def _record(self, span: ReadableSpan) -> None:
+        attributes = span.attributes or {}
+        context = trace.set_span_in_context(NonRecordingSpan(span.context))
+        status = "error" if span.status.status_code == StatusCode.ERROR else "ok"
+
+        if attributes.get("gen_ai.operation.name") == SpanKindValues.AGENT and "agent.id" in attributes:
+            # The root span stays open until the stream has been consumed
+            invocation_duration.record(
+                _span_duration_ms(span),
+                {
+                    "agent.id": attributes["agent.id"],
+                    "agent.alias_id": attributes.get("agent.alias_id", ""),
+                    "streaming": bool(attributes.get("stream_mode", False)),
+                    "status": status,
+                },
+                context=context,
+            )
+            return
+
+        step_attributes = {"step": span.name, "status": status}
+        if "trace.part" in attributes:
+            step_attributes["trace.part"] = attributes["trace.part"]
+        step_duration.record(_span_duration_ms(span), step_attributes, context=context)
+
+        # Token usage is set on the llm spans (the parent steps repeat it)
+        if span.name != "llm" or SpanAttributes.LLM_USAGE_PROMPT_TOKENS not in attributes:
+            return
+        model = attributes.get(SpanAttributes.LLM_REQUEST_MODEL) or "unknown"
+        input_tokens = int(attributes.get(SpanAttributes.LLM_USAGE_PROMPT_TOKENS) or 0)
+        output_tokens = int(attributes.get(SpanAttributes.LLM_USAGE_COMPLETION_TOKENS) or 0)
+        for token_type, count in (("input", input_tokens), ("output", output_tokens)):
+            token_usage.record(
+                count,
+                {SpanAttributes.LLM_REQUEST_MODEL: model, "gen_ai.token.type": token_type},
+                context=context,
+            )
+        usd = compute_cost(model, input_tokens, output_tokens)
+        if usd is not None:
+            cost.add(usd, {SpanAttributes.LLM_REQUEST_MODEL: model}, context=context)
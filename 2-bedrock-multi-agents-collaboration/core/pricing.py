@@ -0,0 +1,182 @@
+"""
+Model prices from the shared cost lookup table.
+
+Prices are read once from ``model-cost-lookup-table.csv`` at the repository
+root (the same table the New Relic lookup-table dashboards use), or from the
+file named by ``BEDROCK_AGENT_MODEL_COST_TABLE``. Each row gives the cost in
+USD per ``cost-input-tokens`` input tokens and per ``cost-output-tokens``
+output tokens.
+
+``UsageAccumulator`` keeps the running token and cost totals of one
+invocation, per model, as model outputs stream in.
+"""
+
+import csv
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from .constants import SpanAttributes
+
+# Initialize logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_COST_TABLE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    "model-cost-lookup-table.csv",
+)
+
+# Cross-region inference profiles prefix the model id with a geography
+_REGION_PREFIXES = ("us.", "eu.", "apac.")
+
+
+class ModelPrice(NamedTuple):
+    """USD per single input and output token"""
+    input_per_token: float
+    output_per_token: float
+    vendor: str = ""
+
+    def cost(self, input_tokens: int, output_tokens: int) -> float:
+        return input_tokens * self.input_per_token + output_tokens * self.output_per_token
+
+
+def load_price_table(path: str) -> Dict[str, ModelPrice]:
+    """Read a cost lookup table into {model id: ModelPrice}"""
+    prices = {}
+    with open(path, "r", newline="") as table:
+        for row in csv.DictReader(table):
+            try:
+                prices[row["response.model"].strip()] = ModelPrice(
+                    float(row["cost-input"]) / float(row["cost-input-tokens"]),
+                    float(row["cost-output"]) / float(row["cost-output-tokens"]),
+                    row.get("vendor", ""),
+                )
+            except (KeyError, TypeError, ValueError, ZeroDivisionError) as e:
+                logger.warning(f"Skipping cost table row {row}: {e}")
+    return prices
+
+
+_prices: Optional[Dict[str, ModelPrice]] = None
+_prices_lock = threading.Lock()
+
+
+def price_table() -> Dict[str, ModelPrice]:
+    """The process-wide price table, loaded on first use"""
+    global _prices
+    if _prices is None:
+        with _prices_lock:
+            if _prices is None:
+                path = os.environ.get("BEDROCK_AGENT_MODEL_COST_TABLE", DEFAULT_COST_TABLE)
+                try:
+                    _prices = load_price_table(path)
+                except OSError as e:
+                    logger.warning(f"No model cost table at {path}: {e}")
+                    _prices = {}
+    return _prices
+
+
+def lookup_price(model_id: Optional[str]) -> Optional[ModelPrice]:
+    """Price for a Bedrock model id, or None if it is not in the table"""
+    if not model_id:
+        return None
+    prices = price_table()
+    price = prices.get(model_id)
+    if price is None and model_id.startswith(_REGION_PREFIXES):
+        price = prices.get(model_id.split(".", 1)[1])
+    return price
+
+
+def compute_cost(model_id: Optional[str], input_tokens: int, output_tokens: int) -> Optional[float]:
+    """USD cost of one model call, or None if the model has no price"""
+    price = lookup_price(model_id)
+    if price is None:
+        return None
+    return price.cost(input_tokens, output_tokens)
+
+
+# Root span attribute with the invocation's total model cost
+COST_USD = "gen_ai.cost.usd"
+
+
+class UsageAccumulator:
+    """Input/output tokens and cost per model of one invocation"""
+
+    __slots__ = ("models", "_trace_models")
+
+    def __init__(self):
+        # model id -> [input tokens, output tokens, cost in USD or None]
+        self.models: Dict[str, List[Any]] = {}
+        # Model named by the modelInvocationInput of each trace ID
+        self._trace_models: Dict[str, str] = {}
+
+    def add(self, model_id: str, input_tokens: int, output_tokens: int):
+        """Count one model call"""
+        totals = self.models.get(model_id)
+        if totals is None:
+            totals = self.models[model_id] = [0, 0, 0.0 if lookup_price(model_id) else None]
+        totals[0] += input_tokens
+        totals[1] += output_tokens
+        if totals[2] is not None:
+            totals[2] += compute_cost(model_id, input_tokens, output_tokens)
+
+    def add_event(self, event, default_model: str):
+        """Count the usage reported by a trace event's model output, if any.
+
+        The model is the ``foundationModel`` of the trace ID's model input
+        when Bedrock reports one, else ``default_model``.
+        """
+        model_input = event.model_input
+        if isinstance(model_input, dict) and model_input.get("foundationModel"):
+            self._trace_models[event.trace_id] = model_input["foundationModel"]
+        model_output = event.model_output
+        if not isinstance(model_output, dict):
+            return
+        usage = (model_output.get("metadata") or {}).get("usage")
+        if not usage:
+            return
+        self.add(
+            self._trace_models.get(event.trace_id, default_model),
+            int(usage.get("inputTokens") or 0),
+            int(usage.get("outputTokens") or 0),
+        )
+
+    @property
+    def input_tokens(self) -> int:
+        return sum(totals[0] for totals in self.models.values())
+
+    @property
+    def output_tokens(self) -> int:
+        return sum(totals[1] for totals in self.models.values())
+
+    @property
+    def cost_usd(self) -> float:
+        """Cost of the models with a price (unpriced models count as 0)"""
+        return sum(totals[2] for totals in self.models.values() if totals[2] is not None)
+
+    def attributes(self) -> Dict[str, Any]:
+        """Root span attributes: gen_ai.usage.* totals, gen_ai.cost.usd and
+        the per-model breakdown"""
+        if not self.models:
+            return {}
+        input_tokens, output_tokens = self.input_tokens, self.output_tokens
+        return {
+            SpanAttributes.LLM_USAGE_PROMPT_TOKENS: input_tokens,
+            SpanAttributes.LLM_USAGE_COMPLETION_TOKENS: output_tokens,
+            SpanAttributes.LLM_USAGE_TOTAL_TOKENS: input_tokens + output_tokens,
+            COST_USD: round(self.cost_usd, 8),
+            "gen_ai.usage.by_model": json.dumps({
+                model: {
+                    "input_tokens": totals[0],
+                    "output_tokens": totals[1],
+                    "cost_usd": round(totals[2], 8) if totals[2] is not None else None,
+                }
+                for model, totals in self.models.items()
+            }),
+        }
+
+    def apply(self, span):
+        """Set the totals on ``span`` (the invocation's root span)"""
+        for key, value in self.attributes().items():
+            span.set_attribute(key, value)
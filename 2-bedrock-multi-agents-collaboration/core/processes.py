@@ -2,7 +2,6 @@ import time
 import json
 import time
 import logging
-from datetime import datetime, timezone
 from typing import Tuple, Optional, Dict, Any
 
 from opentelemetry import trace
@@ -10,67 +9,103 @@ from opentelemetry.trace import Status, StatusCode, SpanKind
 
 from .constants import SpanAttributes, SpanKindValues
 from .tracing import set_span_attributes
-from .agent import extract_trace_id, span_manager
-from .timer_lib import timer
-from .agent import extract_trace_id
+from .attributes import set_attribute
+from .context import current_invocation, trace_event, tracer
+from .dispatch import dispatcher
+from .handlers import (
+    handle_action_group,
+    handle_code_interpreter,
+    handle_file_operations,
+    handle_final_response,
+    handle_knowledge_base,
+    handle_llm_invocation,
+    handle_rationale,
+    handle_user_input_span,
+)
+from .timing import Timestamp, event_timestamp, get_time, now
 
 
 # Initialize logging
 logger = logging.getLogger(__name__)
 
 
-def get_time():
-    "Get the time at which trace part was received"
-    end_timestamp = time.time()
-    end_time_iso = (
-        datetime.fromtimestamp(end_timestamp, tz=timezone.utc)
-        .replace(tzinfo=None)
-        .isoformat()
-    )
-    return end_timestamp, end_time_iso
-
-
 def get_TraceEventtime(trace_data):
     # Get start timestamp from eventTime
-    event_time = trace_data.get("eventTime")
-    if event_time:
-        start_timestamp = event_time.timestamp()
-        start_time_iso = (
-            datetime.fromtimestamp(start_timestamp, tz=timezone.utc)
-            .replace(tzinfo=None)
-            .isoformat()
-        )
-        return start_timestamp, start_time_iso
-    else:
+    started_at = event_timestamp(trace_data)
+    if started_at is None:
         return None, None
+    return started_at.seconds, started_at.iso
 
 
 def add_latency(trace_data):
-    end_timestamp, end_time_iso = get_time()
-    start_timestamp, start_time_iso = get_TraceEventtime(trace_data)
-    if start_timestamp is None:
-        return end_time_iso, end_time_iso, 0
-    latency_ms = round((end_timestamp - start_timestamp) * 1000, 3)
-    return end_time_iso, start_time_iso, latency_ms
+    """(end, start, ms) of the step an event reports, from eventTime gaps
+
+    The ends are Timestamps; format them with ``.iso`` only where needed.
+    """
+    ctx = current_invocation()
+    window = ctx.event_clock.current
+    if window is not None and ctx.trace_event is not None and ctx.trace_event.raw is trace_data:
+        return Timestamp(window.end_ns), Timestamp(window.start_ns), window.duration_ms
+    # Not being dispatched: the event itself, without a gap to measure
+    started_at = event_timestamp(trace_data) or now()
+    return started_at, started_at, 0
+
+
+def handle_orchestration_llm(trace_data, span):
+    """Model invocation input/output within an orchestration step"""
+    handle_llm_invocation(trace_data, span, "orchestration")
+
+
+def handle_orchestration_rationale(trace_data, span):
+    """Rationale after the LLM output, or on its own"""
+    orchestration_trace = trace_event(trace_data).component
+    # Only process rationale with LLM output, ensuring it comes after the completion
+    if "modelInvocationOutput" in orchestration_trace:
+        handle_rationale(trace_data, span)
+    # Standalone rationale events (in practice they come with LLM events)
+    elif "modelInvocationInput" not in orchestration_trace:
+        # Store a marker in the span to indicate this is a standalone rationale
+        span.set_attribute("rationale.standalone", True)
+        handle_rationale(trace_data, span)
+
+
+def handle_orchestration_ask_user(trace_data, span):
+    """A final response that asks the user for input"""
+    observation = trace_event(trace_data).observation or {}
+    if observation.get("type") == "ASK_USER":
+        handle_user_input_span(trace_data, span)
+
+
+# Built-in orchestration subtype handlers, registered with the dispatcher in
+# core.agent. The final response is handled by process_orchestration_trace
+# itself since it ends the orchestration span.
+ORCHESTRATION_HANDLERS = (
+    (("modelInvocationInput", "modelInvocationOutput"), handle_orchestration_llm),
+    (("rationale",), handle_orchestration_rationale),
+    (("knowledgeBaseLookupInput",), handle_knowledge_base),
+    (("knowledgeBaseLookupOutput",), handle_knowledge_base),
+    (("actionGroupInvocationInput",), handle_action_group),
+    (("actionGroupInvocationOutput",), handle_action_group),
+    (("codeInterpreterInvocationInput",), handle_code_interpreter),
+    (("codeInterpreterInvocationOutput",), handle_code_interpreter),
+    (("finalResponse",), handle_orchestration_ask_user),
+)
 
 
 def process_orchestration_trace(trace_data, parent_span, active_spans_dict):
     """Process orchestration trace with proper span hierarchy"""
-    time_trace_id = extract_trace_id(trace_data, "orchestration")
+    event = trace_event(trace_data)
+    trace_id = event.trace_id
     # logger.warning(f"Orchestration trace : {trace_data}")
-    start_time, end_time, duration = timer.check_start_time(
-        "orchestration", trace_data, time_trace_id
+    start_time, end_time, duration = current_invocation().timer.check_start_time(
+        "orchestration", event, trace_id
     )
 
     # Extract orchestration trace from the full trace object
-    orchestration_trace = trace_data.get(
-        "trace", {}).get("orchestrationTrace", {})
-
-    # Get trace ID consistently
-    trace_id = extract_trace_id(trace_data, "orchestration")
+    orchestration_trace = event.subtrace("orchestration")
 
     # Get or create orchestration span with proper hierarchy and timing
-    orchestration_span = span_manager.get_or_create_span(
+    orchestration_span = current_invocation().span_manager.get_or_create_span(
         "orchestration",
         trace_id,
         parent_span,
@@ -78,10 +113,8 @@ def process_orchestration_trace(trace_data, parent_span, active_spans_dict):
             SpanAttributes.OPERATION_NAME: SpanKindValues.TASK,
             "trace.type": "ORCHESTRATION",
             SpanAttributes.TRACE_ID: trace_id,
-            SpanAttributes.LLM_REQUEST_MODEL: parent_span.attributes.get(
-                SpanAttributes.LLM_REQUEST_MODEL, "Not-Configured"
-            ),
-            "stream_mode": parent_span.attributes.get("stream_mode", False),
+            SpanAttributes.LLM_REQUEST_MODEL: current_invocation().model_id,
+            "stream_mode": current_invocation().stream_mode,
         },
     )
     # Store in global active_spans for backward compatibility
@@ -92,18 +125,6 @@ def process_orchestration_trace(trace_data, parent_span, active_spans_dict):
 
     # CRITICAL: Use trace.use_span to work with the span within a context
     with trace.use_span(orchestration_span, end_on_exit=False) as current_span:
-        # Import handlers
-        from .handlers import (
-            handle_llm_invocation,
-            handle_rationale,
-            handle_knowledge_base,
-            handle_action_group,
-            handle_code_interpreter,
-            handle_final_response,
-            handle_user_input_span,
-            handle_file_operations,
-        )
-
         # Check for file operations first (if present in the trace data)
         if "files" in trace_data:
             handle_file_operations(trace_data, current_span)
@@ -114,8 +135,7 @@ def process_orchestration_trace(trace_data, parent_span, active_spans_dict):
                 "text", ""
             )
             if model_input_text:  # Only set if not empty
-                current_span.set_attribute(
-                    "model.input.text", model_input_text)
+                set_attribute(current_span, "model.input.text", model_input_text)
             current_span.set_attribute(
                 "model.input.type",
                 orchestration_trace["modelInvocationInput"].get(
@@ -123,75 +143,9 @@ def process_orchestration_trace(trace_data, parent_span, active_spans_dict):
                 ),
             )
 
-        # Process model invocation (LLM) first
-        # Only process rationale if we have LLM output, ensuring rationale comes after LLM completion
-        if (
-            "modelInvocationInput" in orchestration_trace
-            or "modelInvocationOutput" in orchestration_trace
-        ):
-            # Handle LLM invocation
-            handle_llm_invocation(trace_data, current_span, "orchestration")
-
-            # Process rationale immediately after LLM (at same L3 level)
-            # but only if we have LLM output to ensure proper ordering
-            if (
-                "modelInvocationOutput" in orchestration_trace
-                and "rationale" in orchestration_trace
-            ):
-                handle_rationale(trace_data, current_span)
-
-        # Handle standalone rationale events (though in practice, they should come with LLM events)
-        elif "rationale" in orchestration_trace:
-            # Store a marker in the span to indicate this is a standalone rationale
-            current_span.set_attribute("rationale.standalone", True)
-            handle_rationale(trace_data, current_span)
-
-        # Process knowledge base lookup
-        if (
-            "invocationInput" in orchestration_trace
-            and "knowledgeBaseLookupInput" in orchestration_trace["invocationInput"]
-        ):
-            handle_knowledge_base(trace_data, current_span)
-
-        if (
-            "observation" in orchestration_trace
-            and "knowledgeBaseLookupOutput" in orchestration_trace["observation"]
-        ):
-            handle_knowledge_base(trace_data, current_span)
-
-        # Process action group - using correct field names
-        if (
-            "invocationInput" in orchestration_trace
-            and "actionGroupInvocationInput" in orchestration_trace["invocationInput"]
-        ):
-            handle_action_group(trace_data, current_span)
-
-        if (
-            "observation" in orchestration_trace
-            and "actionGroupInvocationOutput" in orchestration_trace["observation"]
-        ):
-            handle_action_group(trace_data, current_span)
-
-        # Process code interpreter - using correct field names
-        if (
-            "invocationInput" in orchestration_trace
-            and "codeInterpreterInvocationInput"
-            in orchestration_trace["invocationInput"]
-        ):
-            handle_code_interpreter(trace_data, current_span)
-
-        if (
-            "observation" in orchestration_trace
-            and "codeInterpreterInvocationOutput" in orchestration_trace["observation"]
-        ):
-            handle_code_interpreter(trace_data, current_span)
-
-        if (
-            "observation" in orchestration_trace
-            and "finalResponse" in orchestration_trace["observation"]
-            and orchestration_trace.get("observation", {}).get("type") == "ASK_USER"
-        ):
-            handle_user_input_span(trace_data, current_span)
+        # LLM, rationale, knowledge base, action group, code interpreter and
+        # ask-user handlers, in ORCHESTRATION_HANDLERS order
+        dispatcher.dispatch_subtypes(event, current_span)
 
         # Check if final response is in the observation
         if (
@@ -205,28 +159,22 @@ def process_orchestration_trace(trace_data, parent_span, active_spans_dict):
             # Only if final response was successfully processed
             if final_response_processed:
                 final_response = orchestration_trace["observation"]["finalResponse"]
-                parent_span.set_attribute(
-                    "final_response", final_response.get("text", "")
+                set_attribute(
+                    parent_span, "final_response", final_response.get("text", "")
                 )
 
                 # Add final status and close this span
                 current_span.set_status(Status(StatusCode.OK))
 
-                # Capture timestamp to preserve timing information
-                final_timestamp, final_time_iso = get_time()
+                # Set final timing if not already set; the timer ran up to
+                # this (final response) event
                 span_key = f"orchestration:{trace_id}"
-                start_timestamp = datetime.fromisoformat(start_time)
-                start_timestamp = start_timestamp.timestamp()
-
-                # Set final timing if not already set
-                span_manager.set_timing_if_not_set(
+                current_invocation().span_manager.set_timing_if_not_set(
                     span_key,
                     current_span,
                     start_time,
-                    final_time_iso,
-                    round((final_timestamp - start_timestamp) * 1000, 3)
-                    if start_timestamp
-                    else 0,
+                    end_time,
+                    duration or 0,
                 )
 
                 # End the span
@@ -245,13 +193,12 @@ def process_post_processing_trace(trace_data, root_span, active_spans_dict):
     if not root_span:
         print("root_span : ", root_span)
 
-    time_trace_id = extract_trace_id(trace_data)
-    start_time, end_time, duration = timer.check_start_time(
-        "post_processing", trace_data, time_trace_id
+    event = trace_event(trace_data)
+    start_time, end_time, duration = current_invocation().timer.check_start_time(
+        "post_processing", event, event.trace_id
     )
     # Extract post processing trace from the full trace object
-    post_processing_trace = trace_data.get(
-        "trace", {}).get("postProcessingTrace", {})
+    post_processing_trace = event.subtrace("postprocessing")
     # Get trace ID
     trace_id = None
     for field in ["modelInvocationInput", "modelInvocationOutput"]:
@@ -285,7 +232,7 @@ def process_post_processing_trace(trace_data, root_span, active_spans_dict):
 
         # Create new L2 post-processing span using start_span() for persistence
         # CRITICAL: We use start_span() (not start_as_current_span) because we need to store and reuse the span
-        post_span = trace.get_tracer("bedrock-agent-tracing").start_span(
+        post_span = tracer.start_span(
             name="postProcessingTrace",
             kind=SpanKind.CLIENT,
             attributes={
@@ -296,26 +243,15 @@ def process_post_processing_trace(trace_data, root_span, active_spans_dict):
             context=trace.set_span_in_context(root_span),  # Link to parent
         )
 
-        # Copy model_id and streaming metadata from root span if available
-        if hasattr(root_span, "attributes"):
-            # Copy model ID
-            if SpanAttributes.LLM_REQUEST_MODEL in root_span.attributes:
-                post_span.set_attribute(
-                    SpanAttributes.LLM_REQUEST_MODEL,
-                    root_span.attributes[SpanAttributes.LLM_REQUEST_MODEL],
-                )
-
-            # Copy streaming flag
-            if "stream_mode" in root_span.attributes:
-                post_span.set_attribute(
-                    "stream_mode", root_span.attributes["stream_mode"]
-                )
-
-            # Copy streaming metadata
-            if "metadata.streaming" in root_span.attributes:
-                post_span.set_attribute(
-                    "metadata.streaming", root_span.attributes["metadata.streaming"]
-                )
+        # Copy model_id and streaming metadata cached from the root span
+        root_attributes = current_invocation().root_attributes
+        for key in (
+            SpanAttributes.LLM_REQUEST_MODEL,
+            "stream_mode",
+            "metadata.streaming",
+        ):
+            if key in root_attributes:
+                post_span.set_attribute(key, root_attributes[key])
 
         # Start the span manually - required when using start_span()
         post_span.start()
@@ -334,7 +270,7 @@ def process_post_processing_trace(trace_data, root_span, active_spans_dict):
             or not post_span.is_recording()
         ):
             # Create new span if previous one is no longer valid
-            post_span = trace.get_tracer("bedrock-agent-tracing").start_span(
+            post_span = tracer.start_span(
                 name="postProcessingTrace",
                 kind=SpanKind.CLIENT,
                 attributes={
@@ -348,15 +284,10 @@ def process_post_processing_trace(trace_data, root_span, active_spans_dict):
                 context=trace.set_span_in_context(root_span),
             )
 
-            # Copy model_id from root span if available
-            if (
-                hasattr(root_span, "attributes")
-                and SpanAttributes.LLM_REQUEST_MODEL in root_span.attributes
-            ):
-                post_span.set_attribute(
-                    SpanAttributes.LLM_REQUEST_MODEL,
-                    root_span.attributes[SpanAttributes.LLM_REQUEST_MODEL],
-                )
+            # Copy model_id cached from the root span
+            post_span.set_attribute(
+                SpanAttributes.LLM_REQUEST_MODEL, current_invocation().model_id
+            )
 
             # Start the span manually - required when using start_span()
             post_span.start()
@@ -366,16 +297,12 @@ def process_post_processing_trace(trace_data, root_span, active_spans_dict):
     if post_span:
         # CRITICAL: Use trace.use_span to work with the span within a context
         with trace.use_span(post_span, end_on_exit=False) as current_span:
-            # Import handlers here to avoid circular imports
-            from .handlers import handle_llm_invocation
-
             # Process model invocation input (store for later)
             if "modelInvocationInput" in post_processing_trace:
                 model_input = post_processing_trace["modelInvocationInput"]
                 model_input_text = model_input.get("text", "")
                 if model_input_text:  # Only set if not empty
-                    current_span.set_attribute(
-                        "model.input.text", model_input_text)
+                    set_attribute(current_span, "model.input.text", model_input_text)
                 current_span.set_attribute(
                     "model.input.type", model_input.get(
                         "type", "POST_PROCESSING")
@@ -383,19 +310,20 @@ def process_post_processing_trace(trace_data, root_span, active_spans_dict):
 
                 # Add inference configuration if available
                 if "inferenceConfiguration" in model_input:
-                    current_span.set_attribute(
-                        "model.input.inference_configuration",
-                        json.dumps(model_input["inferenceConfiguration"]),
+                    set_attribute(
+                        current_span, "model.input.inference_configuration",
+                        model_input["inferenceConfiguration"]
                     )
             # Process LLM invocation
             handle_llm_invocation(trace_data, current_span, "postprocessing")
+            dispatcher.dispatch_subtypes(event, current_span)
             # Check if this is the final part of post-processing
             if "modelInvocationOutput" in post_processing_trace:
                 # Get the final response
                 output = post_processing_trace["modelInvocationOutput"]
                 if "parsedResponse" in output and "text" in output["parsedResponse"]:
                     final_text = output["parsedResponse"]["text"]
-                    current_span.set_attribute("final_response", final_text)
+                    set_attribute(current_span, "final_response", final_text)
                     current_span.set_status(Status(StatusCode.OK))
                     current_span.end()
                     # Clear active span references
@@ -0,0 +1,219 @@
+"""
+Tail-based sampling of agent traces.
+
+``TailSamplingProcessor`` sits in front of the export pipeline and buffers
+the finished spans of each trace in process. When the trace's local root
+span ends (the agent invocation, or the fan-out span around several
+invocations) the whole trace is kept or dropped at once:
+
+- traces with an error span or a guardrail intervention are always kept
+- traces slower than ``slow_ms`` or more expensive than ``cost_usd`` are kept
+- of the rest, a ``ratio`` fraction is kept, chosen from the trace id so the
+  decision is the same in every process that sees the trace
+
+Spans that end after the decision follow it. Traces whose root never ends
+are decided with the spans at hand after ``decision_wait`` seconds, or when
+more than ``max_traces`` are buffered.
+
+Settings are read from the environment; sampling is only installed when the
+ratio is below 1:
+
+    BEDROCK_AGENT_SAMPLING_RATIO          fraction of ordinary traces to keep (default 1.0)
+    BEDROCK_AGENT_SAMPLING_SLOW_MS        always keep invocations slower than this (default 10000)
+    BEDROCK_AGENT_SAMPLING_COST_USD       always keep traces costing more than this (default 0.05)
+    BEDROCK_AGENT_SAMPLING_DECISION_WAIT  seconds to wait for a root span (default 300)
+    BEDROCK_AGENT_SAMPLING_MAX_TRACES     traces buffered at most (default 1000)
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor
+from opentelemetry.trace import StatusCode
+
+from .constants import SpanAttributes
+from .context import GUARDRAIL_INTERVENTION_ACTIONS
+from .metrics import sampled_traces
+from .pricing import compute_cost
+
+# Initialize logging
+logger = logging.getLogger(__name__)
+
+# Decisions remembered for spans that end after their trace was decided
+_DECIDED_TRACES = 10000
+_TRACE_ID_LIMIT = 1 << 64
+
+
+class SamplingReason:
+    """Why a trace was kept or dropped"""
+    ERROR = "error"
+    GUARDRAIL = "guardrail_intervention"
+    SLOW = "slow"
+    EXPENSIVE = "expensive"
+    RATIO = "ratio"
+    DROPPED = "dropped"
+
+
+class _PendingTrace:
+    __slots__ = ("spans", "first_seen", "error", "guardrail", "cost_usd")
+
+    def __init__(self):
+        self.spans: List[ReadableSpan] = []
+        self.first_seen = time.monotonic()
+        self.error = False
+        self.guardrail = False
+        self.cost_usd = 0.0
+
+
+class TailSamplingProcessor(SpanProcessor):
+    """Buffers each trace until its root span ends, then keeps or drops it whole"""
+
+    def __init__(
+        self,
+        delegate: SpanProcessor,
+        ratio: Optional[float] = None,
+        slow_ms: Optional[float] = None,
+        cost_usd: Optional[float] = None,
+        decision_wait: Optional[float] = None,
+        max_traces: Optional[int] = None,
+    ):
+        self.delegate = delegate
+        self.ratio = ratio if ratio is not None else float(
+            os.environ.get("BEDROCK_AGENT_SAMPLING_RATIO", 1.0))
+        self.slow_ms = slow_ms if slow_ms is not None else float(
+            os.environ.get("BEDROCK_AGENT_SAMPLING_SLOW_MS", 10000))
+        self.cost_usd = cost_usd if cost_usd is not None else float(
+            os.environ.get("BEDROCK_AGENT_SAMPLING_COST_USD", 0.05))
+        self.decision_wait = decision_wait if decision_wait is not None else float(
+            os.environ.get("BEDROCK_AGENT_SAMPLING_DECISION_WAIT", 300))
+        self.max_traces = max_traces or int(
+            os.environ.get("BEDROCK_AGENT_SAMPLING_MAX_TRACES", 1000))
+        if not 0.0 <= self.ratio <= 1.0:
+            raise ValueError(f"Sampling ratio must be between 0 and 1, got {self.ratio}")
+        self._bound = round(self.ratio * _TRACE_ID_LIMIT)
+
+        self._lock = threading.Lock()
+        self._pending: "OrderedDict[int, _PendingTrace]" = OrderedDict()
+        self._decided: "OrderedDict[int, bool]" = OrderedDict()
+        self._counters: Dict[str, int] = {
+            "kept_traces": 0, "dropped_traces": 0, "kept_spans": 0, "dropped_spans": 0,
+        }
+        self._reasons: Dict[str, int] = {}
+
+    def on_start(self, span, parent_context=None) -> None:
+        self.delegate.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        trace_id = span.context.trace_id
+        decisions: List[Tuple[int, _PendingTrace, bool, str]] = []
+        late: Optional[bool] = None
+        with self._lock:
+            if trace_id in self._decided:
+                late = self._decided[trace_id]
+                self._count(late, 1)
+            else:
+                pending = self._pending.get(trace_id)
+                if pending is None:
+                    pending = self._pending[trace_id] = _PendingTrace()
+                self._observe(pending, span)
+                if span.parent is None or span.parent.is_remote:
+                    del self._pending[trace_id]
+                    decisions.append((trace_id, pending, *self._decide(pending, span)))
+                decisions.extend(self._expire())
+            for decided_id, pending, keep, reason in decisions:
+                self._record(decided_id, pending, keep, reason)
+
+        if late:
+            self.delegate.on_end(span)
+        for _, pending, keep, _ in decisions:
+            if keep:
+                for buffered in pending.spans:
+                    self.delegate.on_end(buffered)
+
+    def _observe(self, pending: _PendingTrace, span: ReadableSpan):
+        pending.spans.append(span)
+        attributes = span.attributes or {}
+        if span.status.status_code == StatusCode.ERROR:
+            pending.error = True
+        if attributes.get("guardrail.action") in GUARDRAIL_INTERVENTION_ACTIONS:
+            pending.guardrail = True
+        if span.name == "llm" and SpanAttributes.LLM_USAGE_PROMPT_TOKENS in attributes:
+            usd = compute_cost(
+                attributes.get(SpanAttributes.LLM_REQUEST_MODEL),
+                int(attributes.get(SpanAttributes.LLM_USAGE_PROMPT_TOKENS) or 0),
+                int(attributes.get(SpanAttributes.LLM_USAGE_COMPLETION_TOKENS) or 0),
+            )
+            pending.cost_usd += usd or 0.0
+
+    def _decide(self, pending: _PendingTrace, root: Optional[ReadableSpan]) -> Tuple[bool, str]:
+        if pending.error:
+            return True, SamplingReason.ERROR
+        if pending.guardrail:
+            return True, SamplingReason.GUARDRAIL
+        if root is not None and root.end_time is not None and root.start_time is not None:
+            if (root.end_time - root.start_time) / 1_000_000 >= self.slow_ms:
+                return True, SamplingReason.SLOW
+        if pending.cost_usd >= self.cost_usd > 0:
+            return True, SamplingReason.EXPENSIVE
+        trace_id = pending.spans[0].context.trace_id
+        # Same rule as TraceIdRatioBased: the low 64 bits of the trace id
+        if (trace_id & (_TRACE_ID_LIMIT - 1)) < self._bound:
+            return True, SamplingReason.RATIO
+        return False, SamplingReason.DROPPED
+
+    def _expire(self) -> List[Tuple[int, _PendingTrace, bool, str]]:
+        """Decide traces whose root did not end in time, oldest first"""
+        expired = []
+        deadline = time.monotonic() - self.decision_wait
+        while self._pending:
+            trace_id, pending = next(iter(self._pending.items()))
+            if pending.first_seen > deadline and len(self._pending) <= self.max_traces:
+                break
+            del self._pending[trace_id]
+            expired.append((trace_id, pending, *self._decide(pending, None)))
+        return expired
+
+    def _record(self, trace_id: int, pending: _PendingTrace, keep: bool, reason: str):
+        self._decided[trace_id] = keep
+        if len(self._decided) > _DECIDED_TRACES:
+            self._decided.popitem(last=False)
+        self._counters["kept_traces" if keep else "dropped_traces"] += 1
+        self._count(keep, len(pending.spans))
+        self._reasons[reason] = self._reasons.get(reason, 0) + 1
+        sampled_traces.add(1, {"decision": "keep" if keep else "drop", "reason": reason})
+
+    def _count(self, keep: bool, spans: int):
+        self._counters["kept_spans" if keep else "dropped_spans"] += spans
+
+    def snapshot(self) -> Dict[str, int]:
+        """Kept and dropped counts, by reason"""
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot["pending_traces"] = len(self._pending)
+            for reason, count in self._reasons.items():
+                snapshot[f"reason.{reason}"] = count
+        return snapshot
+
+    def _flush_pending(self):
+        with self._lock:
+            decisions = [(trace_id, pending, *self._decide(pending, None))
+                         for trace_id, pending in self._pending.items()]
+            self._pending.clear()
+            for decided_id, pending, keep, reason in decisions:
+                self._record(decided_id, pending, keep, reason)
+        for _, pending, keep, _ in decisions:
+            if keep:
+                for buffered in pending.spans:
+                    self.delegate.on_end(buffered)
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.delegate.force_flush(timeout_millis)
+
+    def shutdown(self) -> None:
+        # Decide what is still buffered rather than losing it
+        self._flush_pending()
+        self.delegate.shutdown()
@@ -6,8 +6,6 @@ processing traces and completions as they are received.
 
 import json
 import logging
-import time
-from datetime import datetime, timezone
 from typing import Dict, Any, Optional, Callable
 from wrapt import ObjectProxy
 
@@ -15,9 +13,12 @@ from opentelemetry import trace
 from opentelemetry.trace import Status, StatusCode
 
 from .constants import SpanAttributes
+from .attributes import set_attribute
+from .timing import now
+from .context import current_invocation
 
-# Add this import
 from .agent import process_trace_event
+from .handlers import process_guardrail_buffer
 
 # Initialize logging
 logger = logging.getLogger(__name__)
@@ -41,28 +42,70 @@ class AgentStreamingWrapper(ObjectProxy):
             stream_done_callback: Optional callback to execute after stream completes
         """
         super().__init__(response)
-        self._root_span = root_span
-        self._stream_done_callback = stream_done_callback
-        self._completion_data = {"chunks": [], "traces": []}
-        self._chunk_count = 0
-        self._current_chunk = ""  # Current chunk for association with traces
+        # wrapt.ObjectProxy forwards attribute writes to the wrapped object
+        # unless they are prefixed with _self_
+        self._self_root_span = root_span
+        self._self_stream_done_callback = stream_done_callback
+        self._self_completion_data = {"chunks": [], "traces": []}
+        self._self_chunk_count = 0
+        self._self_current_chunk = ""  # Current chunk for association with traces
+        # The stream is consumed after the instrumented call has returned, so
+        # keep the invocation it belongs to and re-activate it per event
+        self._self_invocation = current_invocation()
 
         # Record metadata in root span
-        if self._root_span:
-            self._root_span.set_attribute("streaming", True)
-            self._root_span.set_attribute("metadata.streaming", True)
-            self._root_span.set_attribute(
-                "streaming.start_time", datetime.now().isoformat()
+        if self._self_root_span:
+            self._self_root_span.set_attribute("streaming", True)
+            self._self_root_span.set_attribute("metadata.streaming", True)
+            self._self_root_span.set_attribute(
+                "streaming.start_time", now().iso
             )
 
     def __iter__(self):
         """Process events while yielding them."""
-        for event in self.__wrapped__:
-            self._process_event(event)
-            yield event
-
-        # After all events are processed, handle end of stream
-        self._handle_end_of_stream()
+        invocation = self._self_invocation
+        completed = False
+        reason = "Stream closed before completion"
+        try:
+            for event in self.__wrapped__:
+                with invocation.activate():
+                    invocation.record_stream_event(is_chunk="chunk" in event)
+                    if invocation.capture is not None:
+                        invocation.capture.write_event(event)
+                    self._process_event(event)
+                yield event
+
+            # After all events are processed, handle end of stream
+            with invocation.activate():
+                try:
+                    self._handle_end_of_stream()
+                    completed = True
+                except Exception as e:
+                    # Not the consumer's problem; the finally block below
+                    # still ends the invocation
+                    reason = "End of stream processing failed"
+                    logger.error(f"Error handling end of stream: {str(e)}", exc_info=True)
+        finally:
+            # The consumer stopped early (e.g. the HTTP client disconnected)
+            # or the end of stream could not be processed; still close the
+            # invocation so the root span is not leaked
+            if not completed:
+                with invocation.activate():
+                    self._handle_abandoned_stream(reason)
+
+    def _handle_abandoned_stream(self, reason: str = "Stream closed before completion"):
+        """End the invocation when the stream was not fully consumed."""
+        invocation = self._self_invocation
+        root_span = self._self_root_span or invocation.root_span
+        invocation.close()
+        if root_span is None:
+            logger.warning(f"{reason} after {self._self_chunk_count} chunks")
+            return
+        if root_span.is_recording():
+            root_span.set_attribute("streaming.complete", False)
+            root_span.set_attribute("streaming.chunks_received", self._self_chunk_count)
+            root_span.set_status(Status(StatusCode.ERROR, reason))
+            invocation.end_root_span(root_span)
 
     def _handle_end_of_stream(self):
         """Handle the end of the stream."""
@@ -70,46 +113,39 @@ class AgentStreamingWrapper(ObjectProxy):
         self._process_remaining_guardrails()
 
         # Update root span with final metrics
-        if self._root_span:
-            self._root_span.set_attribute("streaming.complete", True)
-            self._root_span.set_attribute(
-                "streaming.end_time", datetime.now().isoformat()
+        if self._self_root_span:
+            self._self_root_span.set_attribute("streaming.complete", True)
+            self._self_root_span.set_attribute(
+                "streaming.end_time", now().iso
             )
 
         # Join collected chunks to create the complete answer
-        answer_text = "".join(self._completion_data["chunks"])
+        answer_text = "".join(self._self_completion_data["chunks"])
 
         # Update root span with the complete response
-        if self._root_span:
-            self._root_span.set_attribute(SpanAttributes.LLM_COMPLETIONS, answer_text)
-            self._root_span.set_attribute(
-                "streaming.total_chunks", len(self._completion_data["chunks"])
+        if self._self_root_span:
+            set_attribute(self._self_root_span, SpanAttributes.LLM_COMPLETIONS, answer_text)
+            self._self_root_span.set_attribute(
+                "streaming.total_chunks", len(self._self_completion_data["chunks"])
             )
 
         # Call completion callback if provided
-        if self._stream_done_callback:
-            self._stream_done_callback(self._completion_data)
+        if self._self_stream_done_callback:
+            self._self_stream_done_callback(self._self_completion_data)
 
     def _process_remaining_guardrails(self):
         """Process remaining guardrails at the end of the stream."""
-        if not self._root_span:
+        if not self._self_root_span:
             return
 
-        # Import here to avoid circular imports
-        from .handlers import process_guardrail_buffer
-        from .agent import guardrail_buffer, span_manager
+        invocation = self._self_invocation
 
         # Process guardrails using handler
-        if guardrail_buffer:
-            process_guardrail_buffer(guardrail_buffer, self._root_span)
-
-        # Also process from span manager's buffer
-        if span_manager.guardrail_buffer:
-            process_guardrail_buffer(span_manager.guardrail_buffer, self._root_span)
+        if invocation.guardrail_buffer:
+            process_guardrail_buffer(invocation.guardrail_buffer, self._self_root_span)
 
-        # Clear buffers after processing
-        guardrail_buffer.clear()
-        span_manager.guardrail_buffer.clear()
+        # Clear the buffer after processing
+        invocation.guardrail_buffer.clear()
 
     def _process_event(self, event):
         """
@@ -135,26 +171,24 @@ class AgentStreamingWrapper(ObjectProxy):
                         output_text = str(output_bytes)
 
                     # Track chunks
-                    self._chunk_count += 1
-                    self._current_chunk = output_text
-                    self._completion_data["chunks"].append(output_text)
+                    self._self_chunk_count += 1
+                    self._self_current_chunk = output_text
+                    self._self_completion_data["chunks"].append(output_text)
 
                     # Update root span with basic metrics (don't overload with every chunk)
-                    if self._root_span and self._chunk_count % 10 == 0:
-                        self._root_span.set_attribute(
-                            "streaming.chunks_received", self._chunk_count
+                    if self._self_root_span and self._self_chunk_count % 10 == 0:
+                        self._self_root_span.set_attribute(
+                            "streaming.chunks_received", self._self_chunk_count
                         )
 
             # Process trace events
             elif "trace" in event:
-                self._completion_data["traces"].append(event["trace"])
+                self._self_completion_data["traces"].append(event["trace"])
 
                 # Process trace through agent's process_trace_event
-                if self._root_span:
-                    from .agent import process_trace_event
-
+                if self._self_root_span:
                     try:
-                        process_trace_event(event["trace"], self._root_span)
+                        process_trace_event(event["trace"], self._self_root_span)
                     except Exception as e:
                         logger.error(
                             f"Error processing trace event in streaming: {str(e)}",
@@ -187,29 +221,26 @@ def wrap_streaming_response(response, root_span=None):
 
             # Update root span with the complete response
             if root_span:
-                root_span.set_attribute(SpanAttributes.LLM_COMPLETIONS, answer_text)
+                set_attribute(root_span, SpanAttributes.LLM_COMPLETIONS, answer_text)
                 root_span.set_attribute(
                     "streaming.chunks", len(completion_data["chunks"])
                 )
                 root_span.set_attribute("streaming.completed", True)
 
                 # Clean up spans
-                from .agent import span_manager
-
-                span_manager.reset()
+                current_invocation().close()
 
                 # Set end time
-                end_timestamp, end_time_iso = (
-                    time.time(),
-                    datetime.now(timezone.utc).replace(tzinfo=None).isoformat(),
-                )
-                root_span.set_attribute(SpanAttributes.LANGFUSE_END_TIME, end_time_iso)
+                root_span.set_attribute(SpanAttributes.SPAN_END_TIME, now().iso)
 
-                # Set final status
+                # Set final status; the root span was left open for the stream
                 root_span.set_status(Status(StatusCode.OK))
+                current_invocation().end_root_span(root_span)
 
         except Exception as e:
             logger.error(f"Error in stream complete callback: {str(e)}", exc_info=True)
+            # Let the wrapper end the invocation
+            raise
 
     # Wrap the completion with our wrapper
     wrapped = AgentStreamingWrapper(
@@ -1,15 +1,24 @@
-import time
 import logging
-from datetime import datetime, timezone
-from typing import Dict, Tuple, Optional, Any
+from typing import Dict, Tuple, Optional, Any, Union
+
+from .events import TraceEvent
+from .latency import EventClock
+from .timing import Timestamp, event_timestamp, iso_from_ns, now, wall_ns
 
 # Initialize logging
 logger = logging.getLogger(__name__)
 
 class FunctionTimer:
-    def __init__(self):
-        """Initialize the timer storage."""
-        self._timers: Dict[Tuple[str, str], float] = {}
+    def __init__(self, clock: Optional[EventClock] = None):
+        """Initialize the timer storage.
+
+        Args:
+            clock: Event clock of the invocation; check_start_time then times
+                steps by eventTime gaps instead of against the local clock
+        """
+        # Start times in epoch nanoseconds, see core.timing
+        self._timers: Dict[Tuple[str, str], int] = {}
+        self.clock = clock
 
     def start(
         self, function_name: str, trace_id: str, start_time: Optional[float] = None
@@ -23,20 +32,21 @@ class FunctionTimer:
             start_time: Optional custom start time, defaults to current time if None
 
         Returns:
-            The start time value
+            The start time value (epoch seconds)
         """
         key = (function_name, trace_id)
         if key not in self._timers:
-            self._timers[key] = start_time if start_time is not None else time.time()
-        return self._timers[key]
+            self._timers[key] = (
+                int(start_time * 1_000_000_000) if start_time is not None else wall_ns()
+            )
+        return self._timers[key] / 1_000_000_000
+
+    def _start_ns(self, function_name: str, trace_id: str, start_ns: int) -> int:
+        return self._timers.setdefault((function_name, trace_id), start_ns)
 
     def _to_iso_format(self, timestamp: float) -> str:
         """Convert a timestamp to ISO 8601 format without timezone info."""
-        return (
-            datetime.fromtimestamp(timestamp, tz=timezone.utc)
-            .replace(tzinfo=None)
-            .isoformat()
-        )
+        return iso_from_ns(int(timestamp * 1_000_000_000))
 
     def end(self, function_name: str, trace_id: str) -> Tuple[str, str, float]:
         """
@@ -59,20 +69,13 @@ class FunctionTimer:
                 f"No start time recorded for function {function_name} with trace_id {trace_id}"
             )
 
-        start_time = self._timers[key]
-        end_time = time.time()
+        start_ns = self._timers[key]
+        end_ns = wall_ns()
 
-        # Calculate duration in milliseconds (seconds * 1000)
-        duration_ms = (end_time - start_time) * 1000
+        # Duration in milliseconds; eventTime can be ahead of the local clock
+        duration_ms = abs(end_ns - start_ns) / 1_000_000
 
-        if duration_ms < 0:
-            duration_ms = -1 * duration_ms
-
-        # Convert timestamps to ISO format
-        start_time_iso = self._to_iso_format(start_time)
-        end_time_iso = self._to_iso_format(end_time)
-
-        return start_time_iso, end_time_iso, duration_ms
+        return iso_from_ns(start_ns), iso_from_ns(end_ns), duration_ms
 
     def reset(self, function_name: str, trace_id: str) -> None:
         """
@@ -123,8 +126,8 @@ class FunctionTimer:
         Returns:
             The start time in ISO format or None if not set
         """
-        timestamp = self._timers.get((function_name, trace_id))
-        return self._to_iso_format(timestamp) if timestamp is not None else None
+        start_ns = self._timers.get((function_name, trace_id))
+        return iso_from_ns(start_ns) if start_ns is not None else None
 
     def is_started(self, function_name: str, trace_id: str) -> bool:
         """
@@ -150,7 +153,7 @@ class FunctionTimer:
             Dictionary mapping function names to their start times in ISO format for this trace_id
         """
         return {
-            key[0]: self._to_iso_format(value)
+            key[0]: iso_from_ns(value)
             for key, value in self._timers.items()
             if key[1] == trace_id
         }
@@ -166,7 +169,7 @@ class FunctionTimer:
             Dictionary mapping trace_ids to their start times in ISO format for this function
         """
         return {
-            key[1]: self._to_iso_format(value)
+            key[1]: iso_from_ns(value)
             for key, value in self._timers.items()
             if key[0] == function_name
         }
@@ -180,66 +183,49 @@ class FunctionTimer:
         Returns:
             Tuple containing (unix_timestamp, iso8601_string) - uses current time if other times not found
         """
-        # Try to get event time directly from the trace data
-        event_time = trace_data.get("eventTime")
-        if event_time:
-            # Handle datetime conversion correctly with timezone
-            if isinstance(event_time, datetime):
-                try:
-                    # Ensure timestamp conversion uses proper timezone handling
-                    if event_time.tzinfo is None:
-                        # Assume UTC for naive datetime objects
-                        event_time = event_time.replace(tzinfo=timezone.utc)
-
-                    timestamp = event_time.timestamp()
-                    # Format ISO string according to specified format - convert to UTC, remove tz info, then format
-                    time_iso = (
-                        datetime.fromtimestamp(timestamp, tz=timezone.utc)
-                        .replace(tzinfo=None)
-                        .isoformat()
-                    )
-
-                    logger.debug(
-                        f"Successfully extracted eventTime: {time_iso}, timestamp: {timestamp}"
-                    )
-                    return timestamp, time_iso
-                except Exception as e:
-                    logger.warning(f"Error processing eventTime {event_time}: {str(e)}")
-
-        # Return current time as fallback if both eventTime and received_timestamp are not found
-        current_time = time.time()
-        # Format current time according to the specified format
-        current_time_iso = (
-            datetime.fromtimestamp(current_time, tz=timezone.utc)
-            .replace(tzinfo=None)
-            .isoformat()
-        )
-        logger.debug(f"No event time found, using current time: {current_time_iso}")
-
-        return current_time, current_time_iso
+        timestamp = event_timestamp(trace_data)
+        if timestamp is None:
+            logger.debug("No event time found, using current time")
+            timestamp = now()
+        return timestamp.seconds, timestamp.iso
 
     def check_start_time(
-        self, name: str, trace_data: Dict[str, Any], trace_id: str
-    ) -> Tuple[Optional[str], Optional[str], Optional[float]]:
-        current_start_time, current_start_time_iso = self.extract_event_time(trace_data)
-        if self.is_started(name, trace_id):
-            start_time, end_time, duration = self.end(name, trace_id)
-            return start_time, end_time, duration
-        else:
-            self.start(name, trace_id, current_start_time)
-            start_time, end_time, duration = self.end(name, trace_id)
-            return start_time, end_time, duration
+        self, name: str, trace_data: Union[Dict[str, Any], TraceEvent], trace_id: str
+    ) -> Tuple[Timestamp, Timestamp, float]:
+        """Time a step from its first event to the event being handled.
+
+        With an event clock, the timer starts where the first event's step
+        window starts and ends at the eventTime of the current event, so the
+        duration is the gap between Bedrock's eventTime values. Otherwise it
+        starts at the event's eventTime and ends now.
+
+        Returns:
+            (start, end, duration_ms); the timestamps are only formatted to
+            ISO 8601 when set on a recording span (see core.timing)
+        """
+        window = self.clock.current if self.clock is not None else None
+        if window is not None:
+            start_ns = self._start_ns(name, trace_id, window.start_ns)
+            end_ns = max(window.end_ns, start_ns)
+            return Timestamp(start_ns), Timestamp(end_ns), (end_ns - start_ns) / 1_000_000
+
+        if not self.is_started(name, trace_id):
+            if isinstance(trace_data, TraceEvent):
+                timestamp = trace_data.event_time
+            else:
+                timestamp = event_timestamp(trace_data)
+            self._start_ns(name, trace_id, timestamp.ns if timestamp else wall_ns())
+        start_ns = self._timers[(name, trace_id)]
+        end_ns = wall_ns()
+        # Duration in milliseconds; eventTime can be ahead of the local clock
+        return Timestamp(start_ns), Timestamp(end_ns), abs(end_ns - start_ns) / 1_000_000
 
     def get_endtime(self) -> Tuple[float, str]:
         """Get the time at which trace part was received"""
-        end_timestamp = time.time()
-        end_time_iso = (
-            datetime.fromtimestamp(end_timestamp, tz=timezone.utc)
-            .replace(tzinfo=None)
-            .isoformat()
-        )
-        return end_timestamp, end_time_iso
+        timestamp = now()
+        return timestamp.seconds, timestamp.iso
 
 
-# Create a global instance for easy import
+# Global instance for use outside instrumented invocations; each invocation
+# gets its own FunctionTimer through core.context.InvocationContext
 timer = FunctionTimer()
\ No newline at end of file
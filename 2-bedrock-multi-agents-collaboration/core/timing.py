@@ -0,0 +1,174 @@
+"""
+Timing primitives shared by the instrumentation.
+
+All timestamps are taken from the monotonic ``perf_counter_ns`` clock and
+mapped onto wall-clock time through an anchor pair (``time_ns`` and
+``perf_counter_ns`` read together). Durations are therefore never negative
+or skewed by clock adjustments, while timestamps still line up with the
+``eventTime`` values Bedrock reports. The anchor is refreshed every
+``ANCHOR_REFRESH_NS`` so long-running processes follow NTP corrections.
+
+Timestamps are plain integers until an ISO 8601 string is actually needed
+(e.g. for a span attribute); ``Timestamp.iso`` formats on first access and
+caches the result. Step timers hand out ``Timestamp`` objects, and the
+``langfuse.startTime``/``langfuse.endTime`` strings are only formatted when
+they are set on a recording span (``set_span_times``, ``EventTimeTracer``).
+"""
+
+import time
+from datetime import datetime, timezone
+from typing import Any, Optional, Tuple, Union
+
+from .constants import SpanAttributes
+
+# Re-anchor the monotonic clock to the wall clock once a minute
+ANCHOR_REFRESH_NS = 60 * 1_000_000_000
+
+perf_ns = time.perf_counter_ns
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+_anchor_wall_ns = time.time_ns()
+_anchor_perf_ns = perf_ns()
+
+
+def _reanchor(perf: int):
+    global _anchor_wall_ns, _anchor_perf_ns
+    _anchor_perf_ns, _anchor_wall_ns = perf, time.time_ns()
+
+
+def wall_ns(perf: Optional[int] = None) -> int:
+    """Wall-clock nanoseconds since the epoch for a perf_counter_ns reading"""
+    if perf is None:
+        perf = perf_ns()
+        if perf - _anchor_perf_ns > ANCHOR_REFRESH_NS:
+            _reanchor(perf)
+    return _anchor_wall_ns + (perf - _anchor_perf_ns)
+
+
+# Events arrive in bursts, so consecutive timestamps usually share a second;
+# the formatted "YYYY-MM-DDTHH:MM:SS" prefix of the last second is reused
+_last_second = (-1, "")
+
+
+def iso_from_ns(ns: int) -> str:
+    """Format epoch nanoseconds as naive UTC ISO 8601 (datetime.isoformat style)"""
+    global _last_second
+    seconds, remainder = divmod(ns, 1_000_000_000)
+    cached_second, base = _last_second
+    if cached_second != seconds:
+        base = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds))
+        _last_second = (seconds, base)
+    micros = remainder // 1000
+    return f"{base}.{micros:06d}" if micros else base
+
+
+def elapsed_ms(start_ns: int, end_ns: int, digits: int = 3) -> float:
+    """Milliseconds between two nanosecond readings"""
+    return round((end_ns - start_ns) / 1_000_000, digits)
+
+
+class Timestamp:
+    """A wall-clock instant in epoch nanoseconds, formatted to ISO on demand"""
+
+    __slots__ = ("ns", "_iso")
+
+    def __init__(self, ns: int):
+        self.ns = ns
+        self._iso = None
+
+    @classmethod
+    def now(cls) -> "Timestamp":
+        return cls(wall_ns())
+
+    @classmethod
+    def from_seconds(cls, seconds: float) -> "Timestamp":
+        return cls(int(seconds * 1_000_000_000))
+
+    @classmethod
+    def from_datetime(cls, value: datetime) -> "Timestamp":
+        """Convert a datetime, treating naive values as UTC"""
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        delta = value - _EPOCH
+        return cls(
+            (delta.days * 86_400 + delta.seconds) * 1_000_000_000
+            + delta.microseconds * 1000
+        )
+
+    @classmethod
+    def from_iso(cls, value: str) -> "Timestamp":
+        """Parse an ISO 8601 string, treating naive values as UTC"""
+        return cls.from_datetime(datetime.fromisoformat(value))
+
+    @property
+    def seconds(self) -> float:
+        """Epoch seconds, as returned by time.time()"""
+        return self.ns / 1_000_000_000
+
+    @property
+    def iso(self) -> str:
+        if self._iso is None:
+            self._iso = iso_from_ns(self.ns)
+        return self._iso
+
+    def ms_since(self, earlier: "Timestamp", digits: int = 3) -> float:
+        return elapsed_ms(earlier.ns, self.ns, digits)
+
+    def __str__(self) -> str:
+        return self.iso
+
+    def __repr__(self) -> str:
+        return f"Timestamp({self.iso})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Timestamp) and other.ns == self.ns
+
+    def __lt__(self, other: "Timestamp") -> bool:
+        return self.ns < other.ns
+
+    def __hash__(self) -> int:
+        return hash(self.ns)
+
+
+def now() -> Timestamp:
+    """The current wall-clock time"""
+    return Timestamp(wall_ns())
+
+
+def event_timestamp(trace_data: Any) -> Optional[Timestamp]:
+    """The ``eventTime`` of a trace event, or None if it is missing/invalid"""
+    event_time = trace_data.get("eventTime") if isinstance(trace_data, dict) else None
+    if isinstance(event_time, datetime):
+        return Timestamp.from_datetime(event_time)
+    if isinstance(event_time, str):
+        try:
+            return Timestamp.from_iso(event_time)
+        except ValueError:
+            return None
+    return None
+
+
+def get_time() -> Tuple[float, str]:
+    """Get the current time as (epoch seconds, ISO 8601 string)"""
+    timestamp = now()
+    return timestamp.seconds, timestamp.iso
+
+
+def attribute_value(value: Any) -> Any:
+    """A span attribute value, formatting a Timestamp as ISO 8601"""
+    return value.iso if isinstance(value, Timestamp) else value
+
+
+def set_span_times(
+    span,
+    start: Union[Timestamp, str, None],
+    end: Union[Timestamp, str, None],
+    duration_ms: Optional[float],
+):
+    """Set the langfuse start/end/duration attributes of a recording span"""
+    if not span.is_recording():
+        return
+    span.set_attribute(SpanAttributes.SPAN_START_TIME, attribute_value(start))
+    span.set_attribute(SpanAttributes.SPAN_END_TIME, attribute_value(end))
+    span.set_attribute(SpanAttributes.SPAN_DURATION, duration_ms)
@@ -0,0 +1,261 @@
+"""
+Background trace log sink.
+
+Records are put on a bounded in-memory queue and written as JSON Lines by a
+worker thread, in batches, so trace logging adds no disk latency to the
+event loop. The active file is rotated by size and/or age; rotated segments
+are optionally compressed with gzip or zstd (``zstandard`` package) and only
+the newest ``backup_count`` are kept.
+
+Defaults come from the environment:
+
+    BEDROCK_AGENT_TRACE_LOG_MAX_BYTES       rotate above this size (default 50 MiB)
+    BEDROCK_AGENT_TRACE_LOG_ROTATE_SECONDS  rotate after this age (default 0, off)
+    BEDROCK_AGENT_TRACE_LOG_COMPRESSION     none, gzip (default) or zstd
+    BEDROCK_AGENT_TRACE_LOG_BACKUPS         rotated segments to keep (default 10)
+"""
+
+import atexit
+import glob
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+# Initialize logging
+logger = logging.getLogger(__name__)
+
+
+class Compression:
+    """How rotated segments are compressed"""
+    NONE = "none"
+    GZIP = "gzip"
+    ZSTD = "zstd"
+
+    ALL = (NONE, GZIP, ZSTD)
+    SUFFIX = {NONE: "", GZIP: ".gz", ZSTD: ".zst"}
+
+
+class TraceLogSink:
+    """Writes JSON records to a rotating log file from a worker thread."""
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: Optional[int] = None,
+        rotate_seconds: Optional[float] = None,
+        compression: Optional[str] = None,
+        backup_count: Optional[int] = None,
+        max_queue_size: int = 10000,
+        batch_size: int = 512,
+        flush_interval_seconds: float = 1.0,
+        encoder: Optional[Callable[[Any], str]] = None,
+    ):
+        self.path = path
+        self._encoder = encoder or (lambda record: json.dumps(record, default=str))
+        self._max_bytes = max_bytes or int(
+            os.environ.get("BEDROCK_AGENT_TRACE_LOG_MAX_BYTES", 50 * 1024 * 1024))
+        self._rotate_seconds = rotate_seconds if rotate_seconds is not None else float(
+            os.environ.get("BEDROCK_AGENT_TRACE_LOG_ROTATE_SECONDS", 0))
+        self._compression = compression or os.environ.get(
+            "BEDROCK_AGENT_TRACE_LOG_COMPRESSION", Compression.GZIP)
+        if self._compression not in Compression.ALL:
+            raise ValueError(
+                f"Unknown compression {self._compression!r}, "
+                f"expected one of {Compression.ALL}"
+            )
+        if self._compression == Compression.ZSTD and zstandard is None:
+            logger.warning("zstandard is not installed, rotated trace logs use gzip")
+            self._compression = Compression.GZIP
+        self._backup_count = backup_count if backup_count is not None else int(
+            os.environ.get("BEDROCK_AGENT_TRACE_LOG_BACKUPS", 10))
+        self._max_queue_size = max_queue_size
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval_seconds
+
+        self.written_records = 0
+        self.dropped_records = 0
+        self.rotations = 0
+
+        self._queue: deque = deque()
+        self._condition = threading.Condition()
+        self._flush_generation = 0
+        self._written_generation = 0
+        self._shutdown = False
+
+        self._file = None
+        self._file_bytes = 0
+        self._opened_at = 0.0
+
+        self._worker = threading.Thread(
+            name="BedrockAgentTraceLog", target=self._run, daemon=True
+        )
+        self._worker.start()
+
+    def write(self, record: Any) -> bool:
+        """Queue a record for the encoder; False if it was dropped"""
+        with self._condition:
+            if self._shutdown or len(self._queue) >= self._max_queue_size:
+                self.dropped_records += 1
+                return False
+            self._queue.append(record)
+            if len(self._queue) == self._batch_size:
+                self._condition.notify_all()
+        return True
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Write everything queued so far and wait for it"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self._flush_generation += 1
+            generation = self._flush_generation
+            self._condition.notify_all()
+            while self._written_generation < generation:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._worker.is_alive():
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self):
+        if self._shutdown:
+            return
+        self.flush()
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        self._worker.join(timeout=10)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._queue and self._written_generation >= self._flush_generation \
+                        and not self._shutdown:
+                    self._condition.wait(self._flush_interval)
+                generation = self._flush_generation
+                batch = list(self._queue)
+                self._queue.clear()
+                shutdown = self._shutdown
+
+            if batch:
+                self._write_batch(batch)
+            elif self._file is not None and self._due_for_rotation():
+                self._rotate()
+
+            with self._condition:
+                self._written_generation = max(self._written_generation, generation)
+                self._condition.notify_all()
+
+            if shutdown and not self._queue:
+                self._close_file()
+                return
+
+    def _write_batch(self, batch):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self._encoder(record))
+            except Exception as e:
+                self.dropped_records += 1
+                logger.warning(f"Could not serialize trace log record: {e}")
+        data = "\n".join(lines) + "\n"
+        try:
+            if self._file is None:
+                self._open_file()
+            elif self._due_for_rotation():
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+            self._file_bytes += len(data)
+            self.written_records += len(lines)
+        except Exception as e:
+            self.dropped_records += len(lines)
+            logger.error(f"Failed to write trace log {self.path}: {e}")
+
+    def _open_file(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._file_bytes = self._file.tell()
+        self._opened_at = time.monotonic()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _due_for_rotation(self) -> bool:
+        if self._file_bytes >= self._max_bytes:
+            return True
+        return bool(self._rotate_seconds) and self._file_bytes > 0 and \
+            time.monotonic() - self._opened_at >= self._rotate_seconds
+
+    def _rotate(self):
+        """Move the active file aside, compress it and prune old segments"""
+        self._close_file()
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        segment = f"{self.path}.{stamp}"
+        try:
+            os.replace(self.path, segment)
+            self._compress(segment)
+            self._prune()
+            self.rotations += 1
+        except Exception as e:
+            logger.error(f"Failed to rotate trace log {self.path}: {e}")
+        self._open_file()
+
+    def _compress(self, segment: str):
+        if self._compression == Compression.NONE:
+            return
+        target = segment + Compression.SUFFIX[self._compression]
+        with open(segment, "rb") as src:
+            if self._compression == Compression.GZIP:
+                with gzip.open(target, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+            else:
+                with open(target, "wb") as dst:
+                    zstandard.ZstdCompressor().copy_stream(src, dst)
+        os.remove(segment)
+
+    def _prune(self):
+        segments = sorted(glob.glob(f"{glob.escape(self.path)}.*"))
+        for old in segments[:max(len(segments) - self._backup_count, 0)]:
+            os.remove(old)
+
+
+_sinks: Dict[str, TraceLogSink] = {}
+_sinks_lock = threading.Lock()
+
+
+def get_trace_log_sink(path: str, **kwargs) -> TraceLogSink:
+    """Return the process-wide sink for ``path``, starting it on first use"""
+    key = os.path.abspath(path)
+    sink = _sinks.get(key)
+    if sink is not None:
+        return sink
+    with _sinks_lock:
+        if key not in _sinks:
+            _sinks[key] = TraceLogSink(path, **kwargs)
+        return _sinks[key]
+
+
+def close_trace_logs():
+    """Flush and close every trace log sink"""
+    with _sinks_lock:
+        sinks = list(_sinks.values())
+        _sinks.clear()
+    for sink in sinks:
+        sink.close()
+
+
+# Write out whatever is still queued when the interpreter exits
+atexit.register(close_trace_logs)
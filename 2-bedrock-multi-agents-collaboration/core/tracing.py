@@ -2,12 +2,14 @@
 Core tracing functionality for Bedrock Agent Langfuse integration.
 """
 from .constants import SpanAttributes
+from .attributes import set_attribute
+from .timing import now
 import json
 import logging
 from datetime import datetime
 from contextlib import contextmanager
 
-from opentelemetry import trace
+from opentelemetry import metrics, trace
 from opentelemetry.trace import Status, StatusCode
 
 # Constants for document attributes to match OpenInference standards
@@ -41,10 +43,16 @@ def get_tracer(tracer_name="bedrock-agent-tracing"):
 
 
 def set_span_attributes(span, attributes):
-    """Set multiple attributes on a span, skipping None/empty values"""
+    """Set multiple attributes on a span, skipping None/empty values.
+
+    Values go through the size-capped attribute encoder, so dicts and lists
+    are only JSON-encoded when the span is recording.
+    """
+    if span is None or not span.is_recording():
+        return
     for key, value in attributes.items():
         if value is not None and value != "":
-            span.set_attribute(key, value)
+            set_attribute(span, key, value)
 
 
 def enhance_span_attributes(span, trace_data):
@@ -52,7 +60,7 @@ def enhance_span_attributes(span, trace_data):
     common_attributes = {
         "trace.step_number": trace_data.get("step_number", 0),
         "trace.component_type": trace_data.get("type", "unknown"),
-        "trace.timestamp": datetime.now().isoformat(),
+        "trace.timestamp": now().iso,
     }
 
     if "metadata" in trace_data and "usage" in trace_data["metadata"]:
@@ -98,18 +106,49 @@ def span_context(span):
             span.end()
 
 
-def flush_telemetry():
-    """Force flush all pending telemetry data to Langfuse"""
+def get_export_metrics():
+    """Return queue depth, export latency and drop counters of the export pipeline"""
+    from .configuration import provider_registry
+    from .context import leaked_span_count
+
+    pipeline = provider_registry.export_pipeline
+    snapshot = pipeline.metrics.snapshot() if pipeline is not None else {}
+    snapshot["leaked_spans"] = leaked_span_count()
+    sampler = provider_registry.tail_sampler
+    if sampler is not None:
+        snapshot.update(
+            {f"sampling.{key}": value for key, value in sampler.snapshot().items()}
+        )
+    return snapshot
+
+
+def flush_telemetry(blocking: bool = False, timeout_millis: int = 30000):
+    """Flush pending telemetry data to the OTLP endpoint.
+
+    By default this only wakes the background exporter and returns at once,
+    so request handlers never wait on the export round trip. Pass
+    ``blocking=True`` to wait for the export, e.g. before a script exits.
+    """
     try:
+        from .configuration import provider_registry
+
+        pipeline = provider_registry.export_pipeline
+        if pipeline is not None and not blocking:
+            pipeline.request_flush()
+            logger.debug(f"Telemetry flush requested: {pipeline.metrics.snapshot()}")
+            return
+
         # Get the tracer provider
         trace_provider = trace.get_tracer_provider()
+        if not hasattr(trace_provider, "force_flush"):
+            return
 
-        # Check if we have processors with the exporter
-        if hasattr(trace_provider, "_active_span_processor"):
-            processor = trace_provider._active_span_processor
+        success = trace_provider.force_flush(timeout_millis=timeout_millis)
 
-        # Set a longer timeout (30 seconds) to ensure all data is flushed
-        success = trace_provider.force_flush(timeout_millis=30000)
+        # Export the latest metric values as well before a script exits
+        meter_provider = metrics.get_meter_provider()
+        if hasattr(meter_provider, "force_flush"):
+            success = meter_provider.force_flush(timeout_millis=timeout_millis) and success
 
         if success:
             logger.info(
@@ -118,20 +157,5 @@ def flush_telemetry():
             logger.warning(
                 "🔶 Telemetry flush timed out or failed - data may not have been sent completely"
             )
-
-        # Also try to force the process to be more aggressive
-        from opentelemetry.sdk.trace.export import (
-            SimpleSpanProcessor,
-            BatchSpanProcessor,
-        )
-
-        if hasattr(trace_provider, "_active_span_processor"):
-            processor = trace_provider._active_span_processor
-            if hasattr(processor, "force_flush"):
-                try:
-                    processor.force_flush(300)
-                except Exception as e:
-                    logger.warning(
-                        f"Error during explicit processor flush: {e}")
     except Exception as e:
         logger.error(f"🔴 Error flushing telemetry: {str(e)}", exc_info=True)
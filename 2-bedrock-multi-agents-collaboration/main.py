@@ -1,14 +1,18 @@
 """
 Example usage of Bedrock Agent Langfuse integration with streaming support.
 """
+import glob
+import os
 import time
-import boto3
 import uuid
 import json
-from core.timer_lib import timer
 from core import instrument_agent_invocation, flush_telemetry
+from core.agent_config import get_agent_config, use_agent_config
+from core.clients import get_client, prewarm_clients
+from core.configuration import create_tracer_provider
+from core.fanout import FanOutMode, fan_out
 import logging
-from flask import Flask, render_template, request
+from flask import Flask, Response, render_template, request, stream_with_context
 import markdown
 
 logging.basicConfig(level=logging.INFO)
@@ -27,14 +31,29 @@ try:
 except Exception as e:
     print(f"Error reading prompts file: {e}")
 
+# Create the Bedrock client at startup instead of on the first request
+prewarm_clients()
+
+# Build the tracer provider once, with the resource from the active config
+# (instead of setting OTEL_SERVICE_NAME/DEPLOYMENT_ENVIRONMENT per request).
+# Set OTEL_EXPORTER_OTLP_ENDPOINT / OTEL_EXPORTER_OTLP_HEADERS for the backend,
+# e.g. https://otlp.nr-data.net:443 and "api-key=NEW_RELIC_LICENSE_KEY".
+try:
+    create_tracer_provider(
+        service_name=os.environ.get("OTEL_SERVICE_NAME", "bedrock-energy-agent"),
+        environment=get_agent_config().environment,
+    )
+except (OSError, ValueError) as e:
+    print(f"Error reading agent config: {e}")
+
 
 @instrument_agent_invocation
 def invoke_bedrock_agent(
     inputText: str, agentId: str, agentAliasId: str, sessionId: str, **kwargs
 ):
     """Invoke a Bedrock Agent with instrumentation for Langfuse."""
-    # Create Bedrock client
-    bedrock_rt_client = boto3.client("bedrock-agent-runtime")
+    # Shared client: reuses credentials, endpoint and pooled connections
+    bedrock_rt_client = get_client("bedrock-agent-runtime")
     use_streaming = kwargs.get("streaming", False)
     invoke_params = {
         "inputText": inputText,
@@ -80,74 +99,42 @@ def process_streaming_response(stream):
     return full_response
 
 
-def agentInteraction(prompt):
-    import os
-    import base64
-    start = time.time()
-    with open('config.json', 'r') as config_file:
-        config = json.load(config_file)
-
-    # For Langfuse specifically but you can add any other observability provider:
-    if "langfuse" in config:
-        os.environ["OTEL_SERVICE_NAME"] = 'bedrock-energy-agent'
-        os.environ["DEPLOYMENT_ENVIRONMENT"] = config["langfuse"]["environment"]
-        project_name = config["langfuse"]["project_name"]
-        environment = config["langfuse"]["environment"]
-        langfuse_public_key = config["langfuse"]["langfuse_public_key"]
-        langfuse_secret_key = config["langfuse"]["langfuse_secret_key"]
-        # langfuse_api_url = "https://us.cloud.langfuse.com"
-        langfuse_api_url = config["langfuse"]["langfuse_api_url"]
-
-        # Create auth header
-        auth_token = base64.b64encode(
-            f"{langfuse_public_key}:{langfuse_secret_key}".encode()
-        ).decode()
-
-    # Set OpenTelemetry environment variables
-    # os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"] = "https://otlp.nr-data.net:443"
-    # os.environ["OTEL_EXPORTER_OTLP_HEADERS"] = "api-key=NEW_RELIC_LICENSE_KEY"
-
-    # Agent configuration
-    agentId = config["agent"]["agentId"]
-    agentAliasId = config["agent"]["agentAliasId"]
-    sessionId = f"session-{int(time.time())}"
-
-    # User information
-    userId = config["user"]["userId"]
-    agent_model_id = config["user"]["agent_model_id"]
+def build_invocation_kwargs(prompt, streaming=False, config_path=None):
+    """Build the keyword arguments for invoke_bedrock_agent from the cached agent config."""
+    # Parsed and validated once; reloaded only when the file changes
+    config = get_agent_config(config_path)
 
     # Tags for filtering in Langfuse
     tags = ["bedrock-agent", "example", "development"]
 
-    # Generate a custom trace ID
-    trace_id = str(uuid.uuid4())
-
-    # Prompt
-    # question = config["question"]["question"]  # your prompt to the agent
-    question = prompt
-    # Set streaming mode: True for streaming final response, False for non-streaming
-    streaming = False
-
-    # Single invocation that works for both streaming and non-streaming
-    response = invoke_bedrock_agent(
-        inputText=question,
-        agentId=agentId,
-        agentAliasId=agentAliasId,
-        sessionId=sessionId,
+    return dict(
+        inputText=prompt,
+        agentId=config.agent_id,
+        agentAliasId=config.agent_alias_id,
+        sessionId=f"session-{int(time.time())}",
         show_traces=False,
         SAVE_TRACE_LOGS=False,
-        userId=userId,
+        userId=config.user_id,
         tags=tags,
-        trace_id=trace_id,
-        project_name=project_name,
-        environment=environment,
-        langfuse_public_key=langfuse_public_key,
-        langfuse_secret_key=langfuse_secret_key,
-        langfuse_api_url=langfuse_api_url,
+        # Generate a custom trace ID
+        trace_id=str(uuid.uuid4()),
+        project_name=config.project_name,
+        environment=config.environment,
+        langfuse_public_key=config.langfuse_public_key,
+        langfuse_secret_key=config.langfuse_secret_key,
+        langfuse_api_url=config.langfuse_api_url,
         streaming=streaming,
-        model_id=agent_model_id,
+        model_id=config.model_id,
     )
 
+
+def agentInteraction(prompt):
+    # Set streaming mode: True for streaming final response, False for non-streaming
+    streaming = False
+
+    # Single invocation that works for both streaming and non-streaming
+    response = invoke_bedrock_agent(**build_invocation_kwargs(prompt, streaming))
+
     # Handle the response appropriately based on streaming mode
     resp = response
     if isinstance(response, dict) and "error" in response:
@@ -177,16 +164,75 @@ def agentInteraction(prompt):
             print("Raw response:")
             print(f"{response}")
 
-    # Flush telemetry data
+    # Wake the background exporter; this does not wait for the export
     flush_telemetry()
-    timer.reset_all()
 
     return resp
 
 
+def agentInteractionStream(prompt):
+    """Invoke the agent in streaming mode and yield the answer text chunk by chunk."""
+    response = invoke_bedrock_agent(**build_invocation_kwargs(prompt, streaming=True))
+    try:
+        if isinstance(response, dict) and "error" in response:
+            print(f"\nError: {response['error']}")
+            yield f"Error: {response['error']}"
+            return
+
+        # Iterating the wrapped completion drives the trace processing; the
+        # root span ends once the stream has been drained (or abandoned)
+        for event in response["completion"]:
+            if "chunk" in event and "bytes" in event["chunk"]:
+                output_bytes = event["chunk"]["bytes"]
+                if isinstance(output_bytes, bytes):
+                    yield output_bytes.decode("utf-8")
+                else:
+                    yield str(output_bytes)
+    finally:
+        # Wake the background exporter; this does not wait for the export
+        flush_telemetry()
+
+
+# Specialist agents for fan-out: config-forecast.json, config-peak.json, ...
+AGENT_CONFIGS = {
+    os.path.basename(path)[len("config-"):-len(".json")]: path
+    for path in sorted(glob.glob("config-*.json"))
+}
+
+
+def agentInteractionFanOut(prompt, mode=FanOutMode.ALL):
+    """Ask every specialist agent concurrently and merge (or race) their answers."""
+    invocations = {
+        name: build_invocation_kwargs(prompt, streaming=False, config_path=path)
+        for name, path in AGENT_CONFIGS.items()
+    }
+    results = fan_out(invoke_bedrock_agent, invocations, mode=mode)
+    if mode == FanOutMode.FIRST:
+        results = [results] if results else []
+
+    sections = []
+    for result in results:
+        if result.ok:
+            answer = result.result.get("extracted_completion", "")
+        else:
+            answer = f"Error: {result.error}"
+        print(f"\n🤖 {result.name} ({result.elapsed_ms} ms):\n{answer}")
+        sections.append(f"### {result.name}\n\n{answer}")
+
+    # Wake the background exporter; this does not wait for the export
+    flush_telemetry()
+
+    return "\n\n".join(sections)
+
+
+def sse_event(event, data):
+    """Format a server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @app.route("/")
 def home():
-    return render_template("index.html", prompts=prompts)
+    return render_template("index.html", prompts=prompts, stream_url="/prompt/stream")
 
 
 @app.route("/prompt", methods=["POST"])
@@ -196,7 +242,56 @@ def prompt():
     html_output = markdown.markdown(output_prompt)
     # html_output = output_prompt
 
-    return render_template("index.html", input=input_prompt, output=html_output, prompts=prompts)
+    return render_template("index.html", input=input_prompt, output=html_output, prompts=prompts,
+                           stream_url="/prompt/stream")
+
+
+@app.route("/prompt/fanout", methods=["POST"])
+def prompt_fanout():
+    """Answer with every specialist agent (mode=first: the fastest one)."""
+    input_prompt = request.form.get("input")
+    mode = request.form.get("mode", FanOutMode.ALL)
+    if mode not in FanOutMode.MODES:
+        mode = FanOutMode.ALL
+    output_prompt = agentInteractionFanOut(input_prompt, mode)
+    html_output = markdown.markdown(output_prompt)
+
+    return render_template("index.html", input=input_prompt, output=html_output, prompts=prompts,
+                           stream_url="/prompt/stream")
+
+
+@app.route("/config", methods=["POST"])
+def switch_config():
+    """Switch the active agent config file (e.g. name=peak for config-peak.json)."""
+    name = request.form.get("name", "")
+    path = AGENT_CONFIGS.get(name, "config.json" if name in ("", "default") else None)
+    if path is None:
+        return {"error": f"Unknown config {name!r}", "available": sorted(AGENT_CONFIGS)}, 404
+    try:
+        config = use_agent_config(path)
+    except (OSError, ValueError) as e:
+        return {"error": str(e)}, 400
+    return {"config": path, "agentId": config.agent_id}
+
+
+@app.route("/prompt/stream", methods=["POST"])
+def prompt_stream():
+    """Stream the agent answer to the browser as server-sent events."""
+    input_prompt = request.form.get("input")
+
+    def generate():
+        full_response = ""
+        for text in agentInteractionStream(input_prompt):
+            full_response += text
+            yield sse_event("chunk", {"text": text})
+        yield sse_event("done", {"html": markdown.markdown(full_response)})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        # Disable proxy buffering so chunks reach the client as they arrive
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # make the server publicly available via port 5004
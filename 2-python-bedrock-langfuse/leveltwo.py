@@ -2,6 +2,7 @@ from traceloop.sdk import Traceloop
 import os
 from flask import Flask, render_template, request
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 import json
 import markdown
@@ -15,7 +16,11 @@ Traceloop.init(
 )
 
 # Create a Bedrock Runtime client in the AWS Region you want to use.
-client = boto3.client("bedrock-runtime", region_name="us-east-1")
+client = boto3.client(
+    "bedrock-runtime",
+    region_name="us-east-1",
+    config=Config(max_pool_connections=int(os.environ.get("BEDROCK_AGENT_MAX_POOL_CONNECTIONS", 50))),
+)
 
 # Set the model ID, e.g., Titan Text Premier.¨
 # model_id = "amazon.titan-text-lite-v1"